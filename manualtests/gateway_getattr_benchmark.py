@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2026 University of Dundee & Open Microscopy Environment.
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Micro-benchmark of BlitzObjectWrapper.__getattr__ getters, comparing the
+per class accessor table (omero.gateway._ACCESSORS) with the dynamic
+lookup which is used for getters missing from the table.
+
+No server is needed, the wrappers are built around in-memory objects::
+
+    python manualtests/gateway_getattr_benchmark.py [-n 100000]
+"""
+
+import argparse
+import timeit
+
+import omero.gateway
+from omero.gateway import ImageWrapper, LogicalChannelWrapper
+from omero.model import ImageI, LogicalChannelI, IlluminationI
+from omero.rtypes import rbool, rtime
+
+
+def wrappers():
+    image = ImageI(1, True)
+    image.archived = rbool(True)
+    image.acquisitionDate = rtime(1000)
+    channel = LogicalChannelI(2, True)
+    channel.illumination = IlluminationI(3, False)
+    return [
+        (ImageWrapper(None, image), "getArchived"),
+        (ImageWrapper(None, image), "getAcquisitionDate"),
+        (LogicalChannelWrapper(None, channel), "getIllumination"),
+    ]
+
+
+def best(stmt, number, repeat):
+    return min(timeit.repeat(stmt, number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--number", type=int, default=100000,
+                        help="Calls per measurement")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="Measurements, the best is reported")
+    args = parser.parse_args()
+
+    for wrapper, name in wrappers():
+        key = (wrapper.__class__, wrapper._obj.__class__)
+
+        def call():
+            return getattr(wrapper, name)()
+        call()
+        assert name in omero.gateway._ACCESSORS[key]
+        table = best(call, args.number, args.repeat)
+        # An empty table sends every getter to the dynamic lookup
+        accessors = omero.gateway._ACCESSORS[key]
+        omero.gateway._ACCESSORS[key] = {}
+        try:
+            dynamic = best(call, args.number, args.repeat)
+        finally:
+            omero.gateway._ACCESSORS[key] = accessors
+        print("%-40s dynamic %6.2f us  table %6.2f us  (%.1fx)" % (
+            "%s.%s()" % (wrapper.__class__.__name__, name),
+            dynamic * 1e6, table * 1e6, dynamic / table))
+
+
+if __name__ == "__main__":
+    main()
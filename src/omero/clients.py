@@ -823,15 +823,21 @@ class BaseClient(object):
         return digest.hexdigest()
 
     def upload(self, filename, name=None, path=None, type=None, ofile=None,
-               block_size=1024):
+               block_size=1024*1024, in_flight=4, progress=None):
         """
         Utility method to upload a file to the server.
+
+        The file is read once: each block is added to the SHA1 checksum
+        and sent with up to in_flight asynchronous RawFileStore.write
+        calls outstanding. If given, progress(written, size) is called
+        after each block is acknowledged by the server.
         """
         if not self.__sf:
             raise omero.ClientError("No session. Use createSession first.")
 
         import os
         import types
+        from hashlib import sha1
         if not filename or not isinstance(filename, str):
             raise omero.ClientError("Non-null filename must be provided")
 
@@ -850,7 +856,8 @@ class BaseClient(object):
             if not ofile:
                 ofile = omero.model.OriginalFileI()
 
-            ofile.hash = omero.rtypes.rstring(self.sha1(file.name))
+            # Set from the contents as they are sent, see below
+            ofile.hash = None
             ofile.hasher = omero.model.ChecksumAlgorithmI()
             ofile.hasher.value = omero.rtypes.rstring("SHA1-160")
 
@@ -877,32 +884,109 @@ class BaseClient(object):
             up = self.__sf.getUpdateService()
             ofile = up.saveAndReturnObject(ofile)
 
+            digest = sha1()
+            if progress is not None:
+                def written(count):
+                    progress(count, size)
+            else:
+                written = None
             prx = self.__sf.createRawFileStore()
             try:
                 prx.setFileId(ofile.id.val)
                 prx.truncate(size)  # ticket:2337
-                self.write_stream(file, prx, block_size)
+                self.write_stream(file, prx, block_size, in_flight=in_flight,
+                                  digest=digest, progress=written)
+                saved = prx.save()
             finally:
                 prx.close()
         finally:
             file.close()
 
+        if saved is not None:
+            ofile = saved
+        checksum = digest.hexdigest()
+        if ofile.hash is None:
+            ofile.hash = omero.rtypes.rstring(checksum)
+            ofile = up.saveAndReturnObject(ofile)
+        elif ofile.hash.val != checksum:
+            raise omero.ClientError(
+                "Checksum mismatch after upload of %s: %s != %s" % (
+                    filename, ofile.hash.val, checksum))
+
         return ofile
 
-    def write_stream(self, file, prx, block_size=1024*1024):
+    def write_stream(self, file, prx, block_size=1024*1024, in_flight=1,
+                     digest=None, progress=None):
+        """
+        Writes the contents of file to the RawFileStore prx in blocks of
+        block_size. If in_flight is greater than 1, up to that many writes
+        are kept outstanding with Ice asynchronous invocations. If given,
+        digest is updated with every block read and progress(written) is
+        called after every acknowledged write.
+        """
+        from collections import deque
+        in_flight = max(1, in_flight)
+        pending = deque()
         offset = 0
-        while True:
-            block = file.read(block_size)
-            if not block:
-                break
-            prx.write(block, offset, len(block))
-            offset += len(block)
+        written = 0
+        try:
+            while True:
+                block = file.read(block_size)
+                if not block:
+                    break
+                if digest is not None:
+                    digest.update(block)
+                if in_flight > 1:
+                    pending.append((prx.begin_write(
+                        block, offset, len(block)), len(block)))
+                else:
+                    prx.write(block, offset, len(block))
+                    pending.append((None, len(block)))
+                offset += len(block)
+                while len(pending) >= in_flight:
+                    result, length = pending.popleft()
+                    if result is not None:
+                        prx.end_write(result)
+                    written += length
+                    if progress is not None:
+                        progress(written)
+            while pending:
+                result, length = pending.popleft()
+                prx.end_write(result)
+                written += length
+                if progress is not None:
+                    progress(written)
+        finally:
+            # After a failure, still complete the outstanding writes
+            while pending:
+                result, length = pending.popleft()
+                if result is not None:
+                    try:
+                        prx.end_write(result)
+                    except Exception:
+                        pass
 
     def download(self, ofile, filename=None, block_size=1024*1024,
-                 filehandle=None):
+                 filehandle=None, workers=1, resume=False):
+        """
+        Utility method to download an OriginalFile from the server to
+        filename or to an open filehandle.
+
+        If workers is greater than 1 or resume is True, the file is
+        downloaded by :meth:`download_ranges` instead, which requires a
+        filename.
+        """
         if not self.__sf:
             raise omero.ClientError("No session. Use createSession first.")
 
+        if workers > 1 or resume:
+            if filehandle is not None or filename is None:
+                raise omero.ClientError(
+                    "parallel or resumed downloads require a filename")
+            return self.download_ranges(
+                ofile, filename, block_size=block_size, workers=workers,
+                resume=resume)
+
         # Search for objects in all groups. See #12146
         ctx = self.getContext(group=-1)
         prx = self.__sf.createRawFileStore()
@@ -960,6 +1044,176 @@ class BaseClient(object):
         finally:
             prx.close()
 
+    def download_ranges(self, ofile, filename, block_size=1024*1024,
+                        workers=4, resume=False, sync_interval=5.0):
+        """
+        Downloads an OriginalFile to filename, reading block_size ranges
+        concurrently over one RawFileStore per worker.
+
+        Data is written with os.pwrite() into "<filename>.part", which is
+        preallocated to the size of the file and renamed to filename once
+        complete. The SHA1-160 or MD5-128 checksum of the file, if known,
+        is verified as the ranges arrive in order. The number of bytes
+        received in order is synced to "<filename>.part.offset" at most
+        every sync_interval seconds, and once more when the download ends
+        or fails. A later call with resume=True continues from there, even
+        if the process was killed, re-reading at most sync_interval
+        seconds of data. A "<filename>.part" without that file is
+        downloaded again from the start. The offset file is removed once
+        the checksum has been verified.
+        """
+        import hashlib
+        import os
+        import time
+        from collections import deque
+        from concurrent.futures import ThreadPoolExecutor
+        from queue import Queue
+
+        if not self.__sf:
+            raise omero.ClientError("No session. Use createSession first.")
+        if not ofile or not ofile.id:
+            raise omero.ClientError("No file to download")
+
+        # Search for objects in all groups. See #12146
+        ctx = self.getContext(group=-1)
+        params = omero.sys.ParametersI()
+        params.addId(ofile.id.val)
+        ofile = self.__sf.getQueryService().findByQuery(
+            "select f from OriginalFile f left outer join fetch f.hasher "
+            "where f.id = :id", params, ctx)
+        if ofile is None:
+            raise omero.ClientError("No file to download")
+
+        digest = None
+        hasher = ofile.hasher and omero.rtypes.unwrap(ofile.hasher.value)
+        if ofile.hash is not None:
+            if hasher == "SHA1-160":
+                digest = hashlib.sha1()
+            elif hasher == "MD5-128":
+                digest = hashlib.md5()
+
+        stores = Queue()
+        opened = []
+        partname = filename + ".part"
+        offsetname = partname + ".offset"
+        filehandle = None
+        offsethandle = None
+        try:
+            for i in range(max(workers, 1)):
+                prx = self.__sf.createRawFileStore()
+                opened.append(prx)
+                prx.setFileId(ofile.id.val, ctx)
+                stores.put(prx)
+            size = opened[0].size()
+            if size is None:
+                name = omero.rtypes.unwrap(ofile.name)
+                mimetype = omero.rtypes.unwrap(ofile.mimetype)
+                raise omero.ClientError(
+                    ("invalid size for OriginalFile '%s' "
+                     "(mimetype:%s)") % (name, mimetype))
+
+            offset = 0
+            if (resume and os.path.exists(partname) and
+                    os.path.exists(offsetname)):
+                with open(offsetname, 'rb') as f:
+                    try:
+                        offset = int(f.read().strip() or 0)
+                    except ValueError:
+                        offset = 0
+                if not 0 <= offset <= min(size, os.path.getsize(partname)):
+                    offset = 0
+            filehandle = open(partname, offset and 'r+b' or 'wb')
+            offsethandle = open(offsetname, 'wb')
+            if digest is not None and offset:
+                remaining = offset
+                while remaining:
+                    block = filehandle.read(min(block_size, remaining))
+                    digest.update(block)
+                    remaining -= len(block)
+            fd = filehandle.fileno()
+            synced = [0]
+
+            def commit(offset):
+                # The data up to offset must be on disk before the offset
+                os.fsync(fd)
+                offsethandle.seek(0)
+                offsethandle.write(b"%020d\n" % offset)
+                offsethandle.flush()
+                os.fsync(offsethandle.fileno())
+                synced[0] = time.time()
+
+            commit(offset)
+            filehandle.truncate(size)
+            lock = threading.Lock()
+
+            def read(position, length):
+                prx = stores.get()
+                try:
+                    data = prx.read(position, length)
+                finally:
+                    stores.put(prx)
+                if hasattr(os, "pwrite"):
+                    os.pwrite(fd, data, position)
+                else:
+                    with lock:
+                        os.lseek(fd, position, os.SEEK_SET)
+                        os.write(fd, data)
+                return data
+
+            ranges = ((position, min(block_size, size - position))
+                      for position in range(offset, size, block_size))
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    pending = deque()
+                    try:
+                        for position, length in ranges:
+                            pending.append(
+                                executor.submit(read, position, length))
+                            if len(pending) >= 2 * workers:
+                                break
+                        while pending:
+                            data = pending.popleft().result()
+                            if digest is not None:
+                                digest.update(data)
+                            offset += len(data)
+                            if time.time() - synced[0] >= sync_interval:
+                                commit(offset)
+                            for position, length in ranges:
+                                pending.append(
+                                    executor.submit(read, position, length))
+                                break
+                    finally:
+                        for future in pending:
+                            future.cancel()
+                commit(offset)
+            except BaseException:
+                # Keep only what was received in order for a later resume
+                filehandle.truncate(offset)
+                try:
+                    commit(offset)
+                except Exception:
+                    self.__logger.warning(
+                        "Failed to save download offset", exc_info=True)
+                raise
+        finally:
+            if filehandle is not None:
+                filehandle.close()
+            if offsethandle is not None:
+                offsethandle.close()
+            for prx in opened:
+                try:
+                    prx.close()
+                except Exception:
+                    self.__logger.warning(
+                        "Failed to close RawFileStore", exc_info=True)
+
+        if digest is not None and digest.hexdigest() != ofile.hash.val:
+            raise omero.ClientError(
+                "%s checksum mismatch for OriginalFile %s: "
+                "remove %s and retry" % (hasher, ofile.id.val, partname))
+        os.remove(offsetname)
+        os.replace(partname, filename)
+
     def submit(self, req, loops=10, ms=500,
                failonerror=True, ctx=None, failontimeout=True):
         handle = self.getSession().submit(req, ctx)
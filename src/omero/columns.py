@@ -20,6 +20,10 @@ python_sys = __import__("sys")  # Python sys
 try:
     import numpy
     tables = __import__("tables")  # Pytables
+    # Types which fromrows() can pass to Ice as arrays, see numpy_values
+    NUMPY_VALUE_TYPES = (
+        numpy.dtype(numpy.int64), numpy.dtype(numpy.float64),
+        numpy.dtype(numpy.bool_))
     has_pytables = True
     if hasattr(tables, "open_file"):
         has_pytables3 = True
@@ -51,6 +55,12 @@ class AbstractColumn(object):
     Base logic for all columns
     """
 
+    # If True, fromrows() keeps one-dimensional numeric values as the
+    # numpy arrays read from PyTables rather than converting them to lists.
+    # Ice marshals such arrays directly from their buffers. See
+    # "omero.tables.numpy_values" in HdfStorage.cols()
+    numpy_values = False
+
     def __init__(self):
         # Note: don't rely on any properties such as self.name being set if
         # this has been called through Ice
@@ -144,9 +154,19 @@ class AbstractColumn(object):
 
         self.values = rows
 
+        if (self.numpy_values and rows.ndim == 1 and
+                rows.dtype in NUMPY_VALUE_TYPES):
+            self.values = numpy.ascontiguousarray(rows)
+            return
+
         # WORKAROUND:
         # http://www.zeroc.com/forums/bug-reports/4165-icepy-can-not-handle-buffers-longs-i64.html#post20468
         # see ticket:1951 and #2160
+        # Still used for all columns unless numpy_values is set, and then
+        # for every column other than the 1-D Long, Double and Bool ones
+        # whose dtype exactly matches the Ice sequence (native int64,
+        # float64 and bool): Ice marshals the raw array buffer, so any
+        # other dtype, byte order or shape must go through tolist()
         # d = self.recarrtypes[0][1]
         # Disabled until Ice 3.4
         # if isinstance(d, str):
@@ -347,18 +367,14 @@ class AbstractArrayColumn(AbstractColumn):
 
     def arrays(self):
         """
-        Arrays of size 1 have to be converted to scalars, otherwise the
-        column-to-row conversion in HdfStorage.append() will fail.
-        This is messy, but I can't think of a better way.
+        Check that every array has the column's length. Arrays are
+        reshaped to the column's field shape by HdfStorage.append().
         """
         for v in self.values:
             if len(v) != self.size:
                 raise omero.ValidationException(
                     None, None, "Column %s requires arrays of length %d" %
                     (self.name, self.size))
-
-        if self.size == 1:
-            return [[v[0] for v in self.values]]
         return [self.values]
 
     def dtypes(self):
@@ -501,7 +517,7 @@ class MaskColumnI(AbstractColumn, omero.grid.MaskColumn):
         AbstractColumn.readCoordinates(self, tbl, rowNumbers)
         masks = self._getmasks(tbl)
         if rowNumbers is None or len(rowNumbers) == 0:
-            rowNumbers = list(range(masks.nrows))
+            rowNumbers = range(masks.nrows)
         self.getbytes(masks, rowNumbers)
 
     def read(self, tbl, start, stop):
@@ -509,13 +525,26 @@ class MaskColumnI(AbstractColumn, omero.grid.MaskColumn):
         # calls fromrows
         AbstractColumn.read(self, tbl, start, stop)
         masks = self._getmasks(tbl)
-        rowNumbers = list(range(start, stop))
-        self.getbytes(masks, rowNumbers)
+        self.getbytes(masks, range(start, stop))
 
     def getbytes(self, masks, rowNumbers):
-        self.bytes = []
-        for idx in rowNumbers:
-            self.bytes.append(masks[idx].tolist())
+        """
+        Sets bytes to the masks of rowNumbers as bytes objects, reading
+        each contiguous run of the requested rows with a single call
+        """
+        if isinstance(rowNumbers, range) and rowNumbers.step == 1:
+            self.bytes = [m.tobytes() for m in
+                          masks.read(rowNumbers.start, rowNumbers.stop)]
+            return
+        rows = numpy.unique(numpy.asarray(rowNumbers, dtype=numpy.int64))
+        breaks = numpy.flatnonzero(numpy.diff(rows) != 1) + 1
+        found = {}
+        for run in numpy.split(rows, breaks):
+            if len(run):
+                start = int(run[0])
+                for i, m in enumerate(masks.read(start, int(run[-1]) + 1)):
+                    found[start + i] = m.tobytes()
+        self.bytes = [found[int(idx)] for idx in rowNumbers]
 
     def fromrows(self, rows, field_only=False):
 
@@ -524,6 +553,9 @@ class MaskColumnI(AbstractColumn, omero.grid.MaskColumn):
 
         # WORKAROUND:
         # http://www.zeroc.com/forums/bug-reports/4165-icepy-can-not-handle-buffers-longs-i64.html#post20468
+        # Always used here, whatever numpy_values is: these are the
+        # sequence<long> fields, and as fields of a record array they are
+        # strided views rather than the contiguous int64 buffer Ice needs
         self.imageId = rows["i"].tolist()
         self.theZ = rows["z"].tolist()  # ticket:1665
         self.theT = rows["t"].tolist()  # ticket:1665
@@ -535,13 +567,16 @@ class MaskColumnI(AbstractColumn, omero.grid.MaskColumn):
     def append(self, tbl):
         self.__sanitycheck()
         masks = self._getmasks(tbl)
+        # VLArray has no multi-row append, so only the per-row conversion
+        # is kept minimal and the rows are flushed together
+        append = masks.append
         for x in self.bytes:
             if isinstance(x, list):
                 # This occurs primarily in testing.
-                masks.append(numpy.array(x, dtype=tables.UInt8Atom()))
+                append(numpy.array(x, dtype=numpy.uint8))
             else:
-                masks.append(numpy.frombuffer(x, count=len(x),
-                                              dtype=tables.UInt8Atom()))
+                append(numpy.frombuffer(x, dtype=numpy.uint8))
+        masks.flush()
 
     def _getmasks(self, tbl):
         n = tbl._v_name
@@ -14,6 +14,7 @@
 # Set up the python include paths
 import numpy
 import os
+import types
 
 import warnings
 from collections import defaultdict
@@ -31,6 +32,7 @@ from omero.cmd import Chgrp2, Delete2, DoAll, SkipHead, Chown2
 from omero.cmd.graphs import ChildOption
 from omero.api import Save
 from omero.gateway.utils import ServiceOptsDict, GatewayConfig, toBoolean, image_to_html
+from omero.gateway.utils import ObjectCache
 from omero.model.enums import PixelsTypeint8, PixelsTypeuint8, PixelsTypeint16
 from omero.model.enums import PixelsTypeuint16, PixelsTypeint32
 from omero.model.enums import PixelsTypeuint32, PixelsTypefloat
@@ -208,6 +210,77 @@ class OmeroRestrictionWrapper (object):
             omero.constants.permissions.BINARYACCESS)
 
 
+def _unwrap_field(conn, rv):
+    """
+    Converts a model field value for BlitzObjectWrapper getters: rtypes
+    are unwrapped (except units), model objects are wrapped.
+    """
+    if hasattr(rv, 'val'):
+        # E.g. pixels.getPhysicalSizeX()
+        if not isinstance(rv.val, str) and hasattr(rv, "_unit"):
+            return rv
+        return rv.val
+    elif isinstance(rv, omero.model.IObject):
+        return BlitzObjectWrapper(conn, rv)
+    return rv
+
+
+# (wrapper class, model class) -> {getter name: accessor function}
+_ACCESSORS = {}
+
+
+def _build_accessors(wrapper, obj):
+    """
+    Resolves the 'get' methods that BlitzObjectWrapper.__getattr__ handles
+    for this wrapper and model object into functions taking the wrapper,
+    from the wrapper's _attrs and the model class' _field_info.
+    """
+    table = {}
+
+    def getter(field):
+        return 'get' + field[0].upper() + field[1:]
+
+    def value(obj, field):
+        # As BlitzObjectWrapper.__getattr__(field), without the probing
+        rv = getattr(obj, '_' + field)
+        if hasattr(rv, 'val') and not hasattr(rv, '_unit'):
+            rv = rv.val
+        return rv
+
+    for a in getattr(wrapper, '_attrs', ()):
+        if a.startswith('#'):
+            field = a[1:]
+
+            def get_enum(self, field=field):
+                v = value(self._obj, field)
+                if v is not None:
+                    v = v._value
+                return v
+            table.setdefault(getter(field), get_enum)
+        elif '|' in a:
+            field, wrapper_name = a.split('|', 1)
+
+            def get_wrapped(self, field=field, wrapper_name=wrapper_name):
+                return getattr(omero.gateway, wrapper_name)(
+                    self._conn, value(self._obj, field))
+            table.setdefault(getter(field), get_wrapped)
+
+    field_info = getattr(type(obj), '_field_info', None)
+    for field in (field_info._fields if field_info is not None else ()):
+        name = getter(field)
+        method = getattr(type(obj), name, None)
+        code = getattr(method, '__code__', None)
+        # Skip getters taking an argument, e.g. Image.getPixels(index)
+        if name in table or code is None or \
+                code.co_argcount - len(method.__defaults__ or ()) > 1:
+            continue
+
+        def get_field(self, name=name):
+            return _unwrap_field(self._conn, getattr(self._obj, name)())
+        table[name] = get_field
+    return table
+
+
 class BlitzObjectWrapper (object):
     """
     Object wrapper class which provides various methods for hierarchy
@@ -224,6 +297,10 @@ class BlitzObjectWrapper (object):
     LINK_CHILD = 'child'
     CHILD_WRAPPER_CLASS = None
     PARENT_WRAPPER_CLASS = None
+    # Parent links by LINK_CLASS, set by _BlitzGateway.prefetch()
+    _parentLinks = None
+    # Child count, set by _BlitzGateway.prefetch()
+    _prefetchedCountChildren = None
 
     @staticmethod
     def LINK_PARENT(x):
@@ -508,6 +585,7 @@ class BlitzObjectWrapper (object):
         self._obj = self._conn.getUpdateService().saveAndReturnObject(
             self._obj, ctx)
         self._oid = self._obj.id.val
+        self._conn._invalidateObjectCache(self._obj.__class__.__name__[:-1])
 
     def saveAs(self, details):
         """
@@ -685,10 +763,18 @@ class BlitzObjectWrapper (object):
         """
         Counts available number of child objects.
 
+        If the count was loaded by
+        _BlitzGateway.prefetch(wrappers, 'childCount'), it is returned
+        without querying. Note that it is NOT updated when children are
+        linked or unlinked afterwards.
+
         :return:    The number of child objects available
         :rtype:     Long
         """
 
+        if self._prefetchedCountChildren is not None:
+            self._cached_countChildren = self._prefetchedCountChildren
+            return self._cached_countChildren
         childw = self._getChildWrapper()
         klass = "%sLinks" % childw().OMERO_CLASS.lower()
         # self._cached_countChildren = len(
@@ -795,22 +881,21 @@ class BlitzObjectWrapper (object):
         parentnodes = []
         for pwc in parentw:
             pwck = pwc()
-            if withlinks:
-                parentnodes.extend(
-                    [(pwc(self._conn, pwck.LINK_PARENT(x), self._cache),
-                        BlitzObjectWrapper(self._conn, x))
-                        for x in self._conn.getQueryService(
-                            ).findAllByQuery(
-                                "from %s as c where c.%s.id=%i"
-                                % (pwck.LINK_CLASS, pwck.LINK_CHILD,
-                                   self._oid),
-                                param, self._conn.SERVICE_OPTS)])
+            if (self._parentLinks is not None and
+                    pwck.LINK_CLASS in self._parentLinks):
+                t = self._parentLinks[pwck.LINK_CLASS]
             else:
                 t = self._conn.getQueryService().findAllByQuery(
                     "from %s as c where c.%s.id=%i"
                     % (pwck.LINK_CLASS, pwck.LINK_CHILD,
                        self._oid),
                     param, self._conn.SERVICE_OPTS)
+            if withlinks:
+                parentnodes.extend(
+                    [(pwc(self._conn, pwck.LINK_PARENT(x), self._cache),
+                        BlitzObjectWrapper(self._conn, x))
+                        for x in t])
+            else:
                 parentnodes.extend(
                     [pwc(self._conn, pwck.LINK_PARENT(x), self._cache)
                         for x in t])
@@ -906,18 +991,31 @@ class BlitzObjectWrapper (object):
         ctx = self._conn.SERVICE_OPTS.copy()
         ctx.setOmeroGroup(self.details.group.id.val)
         if not self._obj.isAnnotationLinksLoaded():
-            query = ("select l from %sAnnotationLink as l join "
-                     "fetch l.details.owner join "
-                     "fetch l.details.creationEvent "
-                     "join fetch l.child as a join fetch a.details.owner "
-                     "left outer join fetch a.file "
-                     "join fetch a.details.creationEvent where l.parent.id=%i"
-                     % (self.OMERO_CLASS, self._oid))
+            query = self._annotationLinksQuery()
+            params = omero.sys.ParametersI().addIds([self._oid])
             links = self._conn.getQueryService().findAllByQuery(
-                query, None, ctx)
+                query, params, ctx)
             self._obj._annotationLinksLoaded = True
             self._obj._annotationLinksSeq = links
 
+    @classmethod
+    def _annotationLinksQuery(cls):
+        """
+        Query loading the annotation links, annotations and their files
+        for the parents in the :ids parameter.
+        Used by :meth:`_loadAnnotationLinks` and
+        :meth:`_BlitzGateway.prefetch`
+
+        :return:    String
+        """
+        return ("select l from %sAnnotationLink as l join "
+                "fetch l.details.owner join "
+                "fetch l.details.creationEvent "
+                "join fetch l.child as a join fetch a.details.owner "
+                "left outer join fetch a.file "
+                "join fetch a.details.creationEvent "
+                "where l.parent.id in (:ids)" % cls.OMERO_CLASS)
+
     # _listAnnotationLinks
     def _getAnnotationLinks(self, ns=None):
         """
@@ -1247,6 +1345,17 @@ class BlitzObjectWrapper (object):
         :rtype:         method, value (string, long etc)
         """
 
+        # 'get' methods known from '_attrs' and the model's '_field_info' are
+        # resolved once per wrapper and model class
+        if attr.startswith('get') and attr != 'get':
+            key = (self.__class__, self._obj.__class__)
+            accessors = _ACCESSORS.get(key)
+            if accessors is None:
+                accessors = _ACCESSORS[key] = _build_accessors(self, self._obj)
+            accessor = accessors.get(attr)
+            if accessor is not None:
+                return types.MethodType(accessor, self)
+
         # handle lookup of 'get' methods, using '_attrs' dict to define how we
         # wrap returned objects.
         if (attr != 'get' and
@@ -1281,20 +1390,8 @@ class BlitzObjectWrapper (object):
             attrName = attr[3].lower() + attr[4:]
             if hasattr(self._obj, attrName):
                 def wrap():
-                    rv = getattr(self._obj, attrName)
-                    if hasattr(rv, 'val'):
-                        if isinstance(rv.val, str):
-                            if isinstance(rv.val, str):
-                                return rv.val
-                            else:
-                                return rv.val.decode('utf8')
-                        # E.g. pixels.getPhysicalSizeX()
-                        if hasattr(rv, "_unit"):
-                            return rv
-                        return rv.val
-                    elif isinstance(rv, omero.model.IObject):
-                        return BlitzObjectWrapper(self._conn, rv)
-                    return rv
+                    return _unwrap_field(
+                        self._conn, getattr(self._obj, attrName))
                 return wrap
 
         # handle direct access of attributes. E.g. image.acquisitionDate
@@ -1510,6 +1607,40 @@ class _BlitzGateway (object):
     """
     ICE_CONFIG - Defines the path to the Ice configuration
     """
+    ID_CHUNK_SIZE = 1000
+    """
+    ID_CHUNK_SIZE - Maximum number of ids bound to a single 'in (:ids)'
+    query parameter. Longer id lists are split into chunks of this size.
+    """
+    ID_CHUNK_WORKERS = 4
+    """
+    ID_CHUNK_WORKERS - Number of threads used to query chunks of ids
+    concurrently
+    """
+    USE_OBJECT_CACHE = False
+    """
+    USE_OBJECT_CACHE - If True, new connections are created with an object
+    cache, see :meth:`setObjectCache`
+    """
+    CACHED_TYPES = ('experimenter', 'experimentergroup')
+    """
+    CACHED_TYPES - Object types that :meth:`getObject` and :meth:`getObjects`
+    keep in the connection's object cache when loaded by id
+    """
+    PLANE_CHUNK_BYTES = 256 * 1024
+    """
+    PLANE_CHUNK_BYTES - Size of the chunks of rows in which
+    :meth:`createImageFromNumpySeq` converts and reduces each plane
+    """
+    OBJECT_CACHE_SIZE = 1000
+    """
+    OBJECT_CACHE_SIZE - Maximum number of objects in the object cache
+    """
+    OBJECT_CACHE_TTL = 300
+    """
+    OBJECT_CACHE_TTL - Seconds before a cached object is loaded again
+    """
+    _objectCache = None
 # def __init__ (self, username, passwd, server, port, client_obj=None,
 # group=None, clone=False):
 
@@ -1611,6 +1742,9 @@ class _BlitzGateway (object):
         self._userid = None
         self._proxies = NoProxies()
         self._tracked_services = dict()
+        if self.USE_OBJECT_CACHE:
+            self._objectCache = ObjectCache(
+                self.OBJECT_CACHE_SIZE, self.OBJECT_CACHE_TTL)
         if self.c is None:
             self._resetOmeroClient()
         else:
@@ -1693,6 +1827,51 @@ class _BlitzGateway (object):
                     prefix, service_string, stack_msg))
         return count
 
+    def getObjectCache(self):
+        """
+        Returns the cache of rarely changing objects for this connection,
+        e.g. to check its stats(). See :attr:`CACHED_TYPES`
+
+        :return:    :class:`omero.gateway.utils.ObjectCache` or None
+        """
+        return self._objectCache
+
+    def setObjectCache(self, cache):
+        """
+        Replaces the object cache of this connection. There is none unless
+        :attr:`USE_OBJECT_CACHE` is set, e.g. to enable it::
+
+            conn.setObjectCache(ObjectCache(
+                conn.OBJECT_CACHE_SIZE, conn.OBJECT_CACHE_TTL))
+
+        Objects saved, deleted or moved through this connection are
+        dropped from the cache, but changes made directly through the
+        services, e.g. getAdminService().addGroups(), are not seen until
+        the entries expire or getObjectCache().clear() is called.
+
+        :param cache:   None to disable caching, or an object with the
+                        get(), set(), invalidate() and clear() methods of
+                        :class:`omero.gateway.utils.ObjectCache`
+        """
+        self._objectCache = cache
+
+    def _invalidateObjectCache(self, obj_type=None):
+        """
+        Drops cached objects of obj_type after they were saved, deleted or
+        moved, or every cached object if obj_type is None.
+        """
+        cache = self._objectCache
+        if cache is None:
+            return
+        if obj_type is None:
+            cache.clear()
+        elif obj_type.lower() in ('experimenter', 'experimentergroup'):
+            # Both are loaded with their group memberships
+            cache.invalidate('Experimenter')
+            cache.invalidate('ExperimenterGroup')
+        else:
+            cache.invalidate(obj_type)
+
     def createServiceOptsDict(self):
         serviceOpts = ServiceOptsDict(self.c.getImplicitContext().getContext())
         serviceOpts.setOmeroGroup(self.getDefaultOmeroGroup())
@@ -2070,6 +2249,7 @@ class _BlitzGateway (object):
         self._userid = None
         self._user = None
         self._ctx = None
+        self._invalidateObjectCache()
 
         if self._session_cb:  # pragma: no cover
             if self._was_join:
@@ -3034,6 +3214,7 @@ class _BlitzGateway (object):
             for user in group_members:
                 admin_serv.addGroups(
                     user, [omero.model.ExperimenterGroupI(gr_id, False)])
+        self._invalidateObjectCache('ExperimenterGroup')
 
         return gr_id
 
@@ -3220,8 +3401,6 @@ class _BlitzGateway (object):
         :param imageIds:    Image IDs list
         :return:            Dict of files 'count' and 'size'
         """
-        params = omero.sys.ParametersI()
-        params.addIds(imageIds)
         query = 'select count(link), sum(link.parent.size) '\
                 'from PixelsOriginalFileMap as link '\
                 'where link.id in ('\
@@ -3230,12 +3409,20 @@ class _BlitzGateway (object):
                 '    where i_link.child.image.id in (:ids)'\
                 ')'
         queryService = self.getQueryService()
-        count, size = queryService.projection(
-            query, params, self.SERVICE_OPTS
-        )[0]
-        if size is None:
-            size = 0
-        return {'fileset': False, 'count': unwrap(count), 'size': unwrap(size)}
+
+        def load(chunk):
+            params = omero.sys.ParametersI()
+            params.addIds(chunk)
+            return unwrap(queryService.projection(
+                query, params, self.SERVICE_OPTS
+            )[0])
+
+        # Each link belongs to a single image so chunks can be summed
+        count, size = 0, 0
+        for chunk_count, chunk_size in self._mapIdChunks(load, imageIds):
+            count += chunk_count or 0
+            size += chunk_size or 0
+        return {'fileset': False, 'count': count, 'size': size}
 
     ############################
     # Timeline service getters #
@@ -3281,6 +3468,47 @@ class _BlitzGateway (object):
     ###########################
     # Specific Object Getters #
 
+    def _chunkIds(self, ids):
+        """
+        Splits ids into lists of at most :attr:`ID_CHUNK_SIZE` longs,
+        dropping duplicates but otherwise keeping the order of ids.
+
+        :param ids:         List of Long or rlong
+        :return:            List of lists of Long
+        """
+        ids = list(dict.fromkeys(unwrap(list(ids))))
+        size = max(1, self.ID_CHUNK_SIZE)
+        return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+    def _mapIdChunks(self, fn, ids):
+        """
+        Calls fn with each chunk of ids from :meth:`_chunkIds`, running up to
+        :attr:`ID_CHUNK_WORKERS` chunks concurrently when there is more than
+        one of them.
+
+        :param fn:          Callable taking a list of Long
+        :param ids:         List of Long or rlong
+        :return:            List of the results of fn, in the order of
+                            the chunks
+        """
+        chunks = self._chunkIds(ids)
+        workers = min(self.ID_CHUNK_WORKERS, len(chunks))
+        if workers <= 1:
+            return [fn(chunk) for chunk in chunks]
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(fn, chunks))
+
+    @staticmethod
+    def _isPaged(params):
+        """
+        Returns True if the omero.sys.Parameters have an offset or limit,
+        which cannot be applied to each chunk of ids separately.
+        """
+        return (params is not None and params.theFilter is not None and
+                (params.theFilter.offset is not None or
+                 params.theFilter.limit is not None))
+
     def getObject(self, obj_type, oid=None, params=None, attributes=None,
                   opts=None):
         """
@@ -3299,22 +3527,35 @@ class _BlitzGateway (object):
                             E.g. 'name', 'ns'
         :return:
         """
+        cache = self._objectCacheFor(obj_type, params, attributes, opts)
+        if cache is not None and oid is not None:
+            key = (obj_type.lower(), unwrap(oid))
+            result = cache.get(key)
+            if result is not None:
+                return KNOWN_WRAPPERS[key[0]](self, result)
         oids = (oid is not None) and [oid] or None
         query, params, wrapper = self.buildQuery(
             obj_type, oids, params, attributes, opts)
         result = self.getQueryService().findByQuery(
             query, params, self.SERVICE_OPTS)
         if result is not None:
+            if cache is not None and oid is not None:
+                cache.set(key, result)
             return wrapper(self, result)
 
     def getObjects(self, obj_type, ids=None, params=None, attributes=None,
-                   respect_order=False, opts=None):
+                   respect_order=False, opts=None, page_size=None,
+                   prefetch=False):
         """
         Retrieve Objects by type E.g. "Image"
         Returns generator of appropriate :class:`BlitzObjectWrapper` type.
         E.g. :class:`ImageWrapper`. If ids is None, all available objects will
         be returned. i.e. listObjects() Filter objects by attributes. E.g.
         attributes={'name':name}
+        More than :attr:`ID_CHUNK_SIZE` ids are queried in concurrent chunks
+        unless results are paginated or ordered by opts or params.
+        :attr:`CACHED_TYPES` loaded by ids alone use the object cache, see
+        :meth:`getObjectCache`.
 
         :param obj_type:    Object type, e.g. "Project" see above
         :type obj_type:     String
@@ -3332,12 +3573,32 @@ class _BlitzGateway (object):
                             offset, limit and owner for all objects.
                             Additional opts handled by _getQueryString()
                             e.g. filter Dataset by 'project'
+        :param page_size:   If set, objects are loaded in pages of this size
+                            ordered by id, using 'obj.id > :last_id' rather
+                            than offsets, and yielded as each page arrives.
+                            A 'limit' in opts caps the total number of
+                            objects; 'offset', 'order_by' and respect_order
+                            are not supported.
+        :param prefetch:    With page_size, load the next page in a
+                            background thread while the current page is
+                            consumed
         :return:            Generator of :class:`BlitzObjectWrapper` subclasses
         """
-        query, params, wrapper = self.buildQuery(
-            obj_type, ids, params, attributes, opts)
-        qs = self.getQueryService()
-        result = qs.findAllByQuery(query, params, self.SERVICE_OPTS)
+        if ids is not None:
+            # May be a generator, but is iterated more than once below
+            ids = list(ids)
+        if page_size is not None:
+            for obj in self._getObjectPages(obj_type, ids, params, attributes,
+                                            respect_order, opts, page_size,
+                                            prefetch):
+                yield obj
+            return
+        cache = self._objectCacheFor(obj_type, params, attributes, opts)
+        if cache is not None and ids is not None:
+            result, wrapper = self._getCachedObjects(cache, obj_type, ids)
+        else:
+            result, wrapper = self._findAllObjects(
+                obj_type, ids, params, attributes, opts)
         if respect_order and ids is not None:
             idMap = {}
             for r in result:
@@ -3347,8 +3608,131 @@ class _BlitzGateway (object):
         for r in result:
             yield wrapper(self, r)
 
+    def _findAllObjects(self, obj_type, ids, params, attributes, opts):
+        """
+        Queries the objects for :meth:`getObjects`, in chunks of ids when
+        possible.
+
+        :return:            (list of omero.model objects, wrapper)
+        """
+        qs = self.getQueryService()
+        if (ids is not None and len(ids) > self.ID_CHUNK_SIZE and
+                not self._isPaged(params) and
+                not set(opts or {}).intersection(
+                    ('limit', 'offset', 'order_by'))):
+            # Pagination and ordering can't be merged across chunks
+            def load(chunk):
+                query, p, wrapper = self.buildQuery(
+                    obj_type, chunk, params, attributes, opts)
+                return qs.findAllByQuery(query, p, self.SERVICE_OPTS), wrapper
+            result = []
+            for rows, wrapper in self._mapIdChunks(load, ids):
+                result.extend(rows)
+        else:
+            query, params, wrapper = self.buildQuery(
+                obj_type, ids, params, attributes, opts)
+            result = qs.findAllByQuery(query, params, self.SERVICE_OPTS)
+        return result, wrapper
+
+    def _objectCacheFor(self, obj_type, params, attributes, opts):
+        """
+        Returns the object cache if obj_type is one of :attr:`CACHED_TYPES`
+        and the objects are loaded by id without other filters.
+        """
+        if (self._objectCache is not None and isinstance(obj_type, str) and
+                obj_type.lower() in self.CACHED_TYPES and params is None and
+                attributes is None and not opts):
+            return self._objectCache
+        return None
+
+    def _getCachedObjects(self, cache, obj_type, ids):
+        """
+        Returns the cached objects of ids, loading and caching the others.
+
+        :return:            (list of omero.model objects, wrapper)
+        """
+        obj_type = obj_type.lower()
+        wrapper = KNOWN_WRAPPERS[obj_type]
+        result = []
+        missing = []
+        for oid in dict.fromkeys(unwrap(list(ids))):
+            obj = cache.get((obj_type, oid))
+            if obj is None:
+                missing.append(oid)
+            else:
+                result.append(obj)
+        if missing:
+            rows, wrapper = self._findAllObjects(
+                obj_type, missing, None, None, None)
+            for obj in rows:
+                cache.set((obj_type, obj.id.val), obj)
+            result.extend(rows)
+        return result, wrapper
+
+    def _getObjectPages(self, obj_type, ids, params, attributes,
+                        respect_order, opts, page_size, prefetch):
+        """
+        Keyset paginated :meth:`getObjects`: loads pages of page_size
+        objects ordered by id, each starting after the last id of the
+        previous page.
+        """
+        if page_size < 1:
+            raise AttributeError("page_size must be positive: %s" % page_size)
+        opts = dict(opts or {})
+        limit = opts.pop('limit', None)
+        if (respect_order or 'order_by' in opts or opts.get('offset') or
+                (params is not None and params.theFilter is not None and
+                 (params.theFilter.offset is not None or
+                  params.theFilter.limit is not None))):
+            raise AttributeError(
+                "page_size cannot be combined with offset, limit in params, "
+                "order_by or respect_order")
+        opts.pop('offset', None)
+        qs = self.getQueryService()
+
+        def load(last_id, size):
+            # New parameters, with their own filter, for every page
+            page_opts = dict(opts, limit=size, offset=0)
+            query, p, wrapper = self.buildQuery(
+                obj_type, ids, params, attributes, page_opts,
+                after_id=last_id)
+            return qs.findAllByQuery(query, p, self.SERVICE_OPTS), wrapper
+
+        def page_length():
+            if limit is None:
+                return page_size
+            return min(page_size, limit - count)
+
+        executor = None
+        if prefetch:
+            from concurrent.futures import ThreadPoolExecutor
+            executor = ThreadPoolExecutor(max_workers=1)
+        count = 0
+        try:
+            page = []
+            if page_length() > 0:
+                page, wrapper = load(-1, page_length())
+            while page:
+                last_id = max(r.id.val for r in page)
+                count += len(page)
+                size = page_length()
+                pending = None
+                if executor is not None and size > 0:
+                    pending = executor.submit(load, last_id, size)
+                for r in page:
+                    yield wrapper(self, r)
+                if size <= 0:
+                    break
+                if pending is not None:
+                    page, wrapper = pending.result()
+                else:
+                    page, wrapper = load(last_id, size)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
+
     def buildQuery(self, obj_type, ids=None, params=None, attributes=None,
-                   opts=None):
+                   opts=None, after_id=None):
         """
         Prepares a query for iQuery. Also prepares params and determines
         appropriate wrapper for result Returns (query, params, wrapper) which
@@ -3370,6 +3754,8 @@ class _BlitzGateway (object):
                             Also 'order_by': 'obj.name' to order results.
                             Additional opts handled by _getQueryString()
                             e.g. filter Dataset by 'project'
+        :param after_id:    If set, only objects with a greater id, ordered
+                            by id, for keyset pagination
         :return:            (query, params, wrapper)
         """
 
@@ -3455,12 +3841,17 @@ class _BlitzGateway (object):
                 else:
                     rv = omero_type(v)
                 baseParams.map[k] = rv
+        if after_id is not None:
+            clauses.append("obj.id > :last_id")
+            baseParams.map["last_id"] = rlong(after_id)
         if clauses:
             query += " where " + (" and ".join(clauses))
 
         # Order by... e.g. 'lower(obj.name)' or 'obj.column, obj.row' for wells
         if order_by is not None:
             query += " order by %s, obj.id" % order_by
+        elif after_id is not None:
+            query += " order by obj.id"
 
         return (query, baseParams, wrapper)
 
@@ -3494,6 +3885,168 @@ class _BlitzGateway (object):
         query = query.split("order by")[0]
         return query, params
 
+    def prefetch(self, wrappers, *relations):
+        """
+        Loads relations for many wrappers with a few batched queries and
+        stores them in each wrapper, so that the accessors below use them
+        instead of querying once per object. Listing a page of Datasets
+        with their child counts and tags is then a constant number of
+        round-trips.
+
+        - 'annotations': :meth:`BlitzObjectWrapper.listAnnotations`,
+          :meth:`BlitzObjectWrapper.getAnnotation` etc.
+        - 'parents': :meth:`BlitzObjectWrapper.listParents` and
+          :meth:`BlitzObjectWrapper.getParent`
+        - 'childCount': :meth:`BlitzObjectWrapper.countChildren` and
+          :meth:`BlitzObjectWrapper.countChildren_cached`
+        - 'owner' and 'group': :meth:`BlitzObjectWrapper.getOwner` and
+          getDetails().getGroup()
+
+        Wrappers that override these accessors with their own queries are
+        left unchanged. Prefetched relations are not refreshed when links
+        are saved later.
+
+        :param wrappers:    Iterable of :class:`BlitzObjectWrapper`
+        :param relations:   Names of the relations to load, see above
+        :return:            List of the wrappers
+        """
+        loaders = {
+            'annotations': self._prefetchAnnotations,
+            'parents': self._prefetchParents,
+            'childCount': self._prefetchChildCounts,
+            'owner': lambda ws: self._prefetchDetails(
+                ws, 'Owner', 'Experimenter'),
+            'group': lambda ws: self._prefetchDetails(
+                ws, 'Group', 'ExperimenterGroup'),
+        }
+        for relation in relations:
+            if relation not in loaders:
+                raise AttributeError(
+                    "prefetch() does not support '%s'. Must be one of: %s"
+                    % (relation, ", ".join(sorted(loaders))))
+        wrappers = list(wrappers)
+        for relation in relations:
+            loaders[relation](wrappers)
+        return wrappers
+
+    def _prefetchAnnotations(self, wrappers):
+        """
+        Loads the annotation links of wrappers, for each OMERO_CLASS and
+        group. See :meth:`BlitzObjectWrapper._loadAnnotationLinks`
+        """
+        batches = defaultdict(list)
+        for w in wrappers:
+            if (hasattr(w._obj, 'isAnnotationLinksLoaded') and
+                    not w._obj.isAnnotationLinksLoaded()):
+                gid = w._obj.details.group.id.val
+                batches[(w.__class__, gid)].append(w)
+        qs = self.getQueryService()
+        for (wrapper, gid), batch in batches.items():
+            query = wrapper._annotationLinksQuery()
+            ctx = self.SERVICE_OPTS.copy()
+            ctx.setOmeroGroup(gid)
+
+            def load(chunk):
+                params = omero.sys.ParametersI().addIds(chunk)
+                return qs.findAllByQuery(query, params, ctx)
+
+            links = defaultdict(list)
+            for rows in self._mapIdChunks(load, [w._oid for w in batch]):
+                for link in rows:
+                    links[link.parent.id.val].append(link)
+            for w in batch:
+                w._obj._annotationLinksLoaded = True
+                w._obj._annotationLinksSeq = links[w._oid]
+
+    def _prefetchParents(self, wrappers):
+        """
+        Loads the parent links of wrappers using the default
+        :meth:`BlitzObjectWrapper.listParents`, fetching link parents.
+        """
+        batches = defaultdict(list)
+        for w in wrappers:
+            if (w.PARENT_WRAPPER_CLASS is not None and
+                    w.__class__.listParents is
+                    BlitzObjectWrapper.listParents):
+                batches[w.__class__].append(w)
+        qs = self.getQueryService()
+        for batch in batches.values():
+            for w in batch:
+                w._parentLinks = {}
+            for pwc in batch[0]._getParentWrappers():
+                pwck = pwc()
+                query = "select c from %s as c" % pwck.LINK_CLASS
+                if pwck.__class__.LINK_PARENT is \
+                        BlitzObjectWrapper.LINK_PARENT:
+                    query += " join fetch c.parent"
+                query += " where c.%s.id in (:ids)" % pwck.LINK_CHILD
+
+                def load(chunk):
+                    params = omero.sys.ParametersI().addIds(chunk)
+                    return qs.findAllByQuery(query, params, self.SERVICE_OPTS)
+
+                links = defaultdict(list)
+                for rows in self._mapIdChunks(load, [w._oid for w in batch]):
+                    for link in rows:
+                        child = getattr(link, pwck.LINK_CHILD)
+                        links[child.id.val].append(link)
+                for w in batch:
+                    w._parentLinks[pwck.LINK_CLASS] = links[w._oid]
+
+    def _prefetchChildCounts(self, wrappers):
+        """
+        Sets the cached child counts of wrappers using the default
+        :meth:`BlitzObjectWrapper.countChildren`
+        """
+        batches = defaultdict(list)
+        for w in wrappers:
+            if (w.CHILD_WRAPPER_CLASS is not None and
+                    w.__class__.countChildren is
+                    BlitzObjectWrapper.countChildren):
+                batches[w.OMERO_CLASS].append(w)
+        cs = self.getContainerService()
+        for omero_class, batch in batches.items():
+            klass = "%sLinks" % (
+                batch[0]._getChildWrapper()().OMERO_CLASS.lower())
+
+            def load(chunk):
+                return cs.getCollectionCount(
+                    omero_class, klass, chunk, None, self.SERVICE_OPTS)
+
+            counts = {}
+            for rv in self._mapIdChunks(load, [w._oid for w in batch]):
+                counts.update(rv)
+            for w in batch:
+                w._prefetchedCountChildren = counts.get(w._oid, 0)
+
+    def _prefetchDetails(self, wrappers, field, omero_class):
+        """
+        Replaces unloaded details.owner or details.group of wrappers with
+        the loaded objects.
+
+        :param field:       'Owner' or 'Group'
+        :param omero_class: 'Experimenter' or 'ExperimenterGroup'
+        """
+        unloaded = defaultdict(list)
+        for w in wrappers:
+            details = w._obj.getDetails()
+            obj = details and getattr(details, 'get%s' % field)()
+            if obj is not None and not obj.isLoaded():
+                unloaded[obj.id.val].append(details)
+        qs = self.getQueryService()
+        ctx = self.SERVICE_OPTS.copy()
+        ctx.setOmeroGroup(-1)
+        query = "select x from %s x where x.id in (:ids)" % omero_class
+
+        def load(chunk):
+            params = omero.sys.ParametersI().addIds(chunk)
+            return qs.findAllByQuery(query, params, ctx)
+
+        for rows in self._mapIdChunks(load, list(unloaded)):
+            for obj in rows:
+                for details in unloaded[obj.id.val]:
+                    getattr(details, 'set%s' % field)(obj)
+
     def listFileAnnotations(self, eid=None, toInclude=[], toExclude=[]):
         """
         Lists FileAnnotations created by users, filtering by namespaces if
@@ -3566,11 +4119,12 @@ class _BlitzGateway (object):
             params = omero.sys.Parameters()
         if params.map is None:
             params.map = {}
+        if parent_ids is not None:
+            parent_ids = list(parent_ids)
 
         clauses = []
         if parent_ids:
             clauses.append("parent.id in (:pids)")
-            params.map["pids"] = rlist([rlong(a) for a in parent_ids])
 
         if ann_ids:
             clauses.append("ann.id in (:ann_ids)")
@@ -3587,7 +4141,20 @@ class _BlitzGateway (object):
         if len(clauses) > 0:
             query += " where %s" % (" and ".join(clauses))
 
-        result = q.findAllByQuery(query, params, self.SERVICE_OPTS)
+        if parent_ids and len(parent_ids) > self.ID_CHUNK_SIZE and \
+                not self._isPaged(params):
+            def load(chunk):
+                p = omero.sys.Parameters(
+                    dict(params.map), params.theFilter, params.theOptions)
+                p.map["pids"] = rlist([rlong(a) for a in chunk])
+                return q.findAllByQuery(query, p, self.SERVICE_OPTS)
+            result = []
+            for rows in self._mapIdChunks(load, parent_ids):
+                result.extend(rows)
+        else:
+            if parent_ids:
+                params.map["pids"] = rlist([rlong(a) for a in parent_ids])
+            result = q.findAllByQuery(query, params, self.SERVICE_OPTS)
         for r in result:
             yield AnnotationLinkWrapper(self, r)
 
@@ -3608,12 +4175,41 @@ class _BlitzGateway (object):
             "MapAnnotation": 0,
             "OtherAnnotation": 0}
 
+        obj_ids = list(obj_ids or [])
         if obj_type is None or not obj_ids:
             return counts
 
         ctx = self.SERVICE_OPTS.copy()
         ctx.setOmeroGroup(-1)
 
+        if len(obj_ids) > self.ID_CHUNK_SIZE:
+            queryResult = self._countAnnotationChunks(obj_type, obj_ids, ctx)
+        else:
+            queryResult = self._countAnnotations(obj_type, obj_ids, ctx)
+
+        for r in queryResult:
+            ur = unwrap(r)
+            if ur[3] == 'ome.model.annotations.LongAnnotation':
+                counts['LongAnnotation'] += ur[0]
+                counts['OtherAnnotation'] += ur[1]
+            elif ur[3] == 'ome.model.annotations.CommentAnnotation':
+                counts['CommentAnnotation'] += ur[2]
+            elif ur[3] == 'ome.model.annotations.TagAnnotation':
+                counts['TagAnnotation'] += ur[2]
+            elif ur[3] == 'ome.model.annotations.FileAnnotation':
+                counts['FileAnnotation'] += ur[2]
+            elif ur[3] == 'ome.model.annotations.MapAnnotation':
+                counts['MapAnnotation'] += ur[2]
+            else:
+                counts['OtherAnnotation'] += ur[2]
+
+        return counts
+
+    def _countAnnotations(self, obj_type, obj_ids, ctx):
+        """
+        Projection behind :meth:`countAnnotations`, returning rows of
+        (rating, other long, not long) counts and the annotation class.
+        """
         params = omero.sys.ParametersI()
         params.addIds(obj_ids)
         params.add('ratingns',
@@ -3636,25 +4232,45 @@ class _BlitzGateway (object):
                     group by an.class
             """ % obj_type
 
-        queryResult = self.getQueryService().projection(q, params, ctx)
+        return self.getQueryService().projection(q, params, ctx)
 
-        for r in queryResult:
-            ur = unwrap(r)
-            if ur[3] == 'ome.model.annotations.LongAnnotation':
-                counts['LongAnnotation'] += ur[0]
-                counts['OtherAnnotation'] += ur[1]
-            elif ur[3] == 'ome.model.annotations.CommentAnnotation':
-                counts['CommentAnnotation'] += ur[2]
-            elif ur[3] == 'ome.model.annotations.TagAnnotation':
-                counts['TagAnnotation'] += ur[2]
-            elif ur[3] == 'ome.model.annotations.FileAnnotation':
-                counts['FileAnnotation'] += ur[2]
-            elif ur[3] == 'ome.model.annotations.MapAnnotation':
-                counts['MapAnnotation'] += ur[2]
-            else:
-                counts['OtherAnnotation'] += ur[2]
+    def _countAnnotationChunks(self, obj_type, obj_ids, ctx):
+        """
+        Chunked equivalent of :meth:`_countAnnotations`. Annotations linked
+        to objects in more than one chunk must only be counted once, so each
+        chunk loads the distinct annotation ids which are then counted here.
+        """
+        q = """
+            select distinct ann.id, type(ann.class),
+                case when ann.ns = :ratingns then 1 else 0 end
+                from %sAnnotationLink ial
+                    join ial.child as ann
+                    join ial.parent as i
+                where i.id in (:ids)
+            """ % obj_type
+        qs = self.getQueryService()
 
-        return counts
+        def load(chunk):
+            params = omero.sys.ParametersI()
+            params.addIds(chunk)
+            params.add('ratingns',
+                       rstring(omero.constants.metadata.NSINSIGHTRATING))
+            return unwrap(qs.projection(q, params, ctx))
+
+        annotations = {}
+        for rows in self._mapIdChunks(load, obj_ids):
+            for ann_id, ann_class, rating in rows:
+                annotations[ann_id] = (ann_class, rating)
+        rows = {}
+        for ann_class, rating in annotations.values():
+            row = rows.setdefault(ann_class, [0, 0, 0, ann_class])
+            if ann_class != 'ome.model.annotations.LongAnnotation':
+                row[2] += 1
+            elif rating:
+                row[0] += 1
+            else:
+                row[1] += 1
+        return list(rows.values())
 
     def listOrphanedAnnotations(self, parent_type, parent_ids, eid=None,
                                 ns=None, anntype=None, addedByMe=True):
@@ -3762,12 +4378,29 @@ class _BlitzGateway (object):
 
     def createImageFromNumpySeq(self, zctPlanes, imageName, sizeZ=1, sizeC=1,
                                 sizeT=1, description=None, dataset=None,
-                                sourceImageId=None, channelList=None):
+                                sourceImageId=None, channelList=None,
+                                tiled=False, planeStats=None,
+                                histogramBins=256):
         """
         Creates a new multi-dimensional image from the sequence of 2D numpy
         arrays in zctPlanes. zctPlanes should be a generator of numpy 2D
         arrays of shape (sizeY, sizeX) ordered to iterate through T first,
         then C then Z.
+
+        If tiled is True, each plane is uploaded tile by tile with the tile
+        size preferred by the server, so a whole plane never needs to be
+        held in memory. The planes may then be any 2D array-like objects
+        supporting shape, dtype and slicing, e.g. dask or zarr arrays.
+
+        Otherwise each plane is converted into a single reused send buffer
+        in chunks of rows (:attr:`PLANE_CHUNK_BYTES`), taking the min and
+        max of every chunk while it is in cache, so that the channel
+        ranges need no further passes over the plane. If planeStats is a
+        list, a dict with the z, c, t, min, max, mean and histogram (a
+        (counts, bin edges) tuple with histogramBins bins over [min, max],
+        or None if the range is not finite) of each plane is appended to
+        it. The mean is accumulated in the same pass, the histogram needs
+        a second one.
         Example usage::
 
             original = conn.getObject("Image", 1)
@@ -3801,8 +4434,18 @@ class _BlitzGateway (object):
                                 then add pixel data
         :param channelList:     Copies metadata from these channels in
                                 source image (if specified). E.g. [0,2]
+        :param tiled:           If True, upload the planes tile by tile
+        :param planeStats:      If a list, collect statistics of each
+                                plane into it, see above. Not supported
+                                with tiled
+        :param histogramBins:   Number of histogram bins for planeStats
         :return: The new OMERO image: omero.model.ImageI
         """
+        from omero.util.tiles import PlaneTileLoop, PlaneTileUpload
+
+        if tiled and planeStats is not None:
+            raise AttributeError("planeStats is not supported with tiled")
+
         queryService = self.getQueryService()
         pixelsService = self.getPixelsService()
         # Make sure we don't get an existing rpStore
@@ -3864,15 +4507,56 @@ class _BlitzGateway (object):
             return (containerService.getImages(
                 "Image", [imageId], None, self.SERVICE_OPTS)[0], convertToType)
 
+        sendBuffer = None
+
         def uploadPlane(plane, z, c, t, convertToType):
-            # if we're given a numpy dtype, need to convert plane to that dtype
-            if convertToType is not None:
-                p = numpy.zeros(plane.shape, dtype=convertToType)
-                p += plane
-                plane = p
-            byteSwappedPlane = plane.byteswap()
-            convertedPlane = byteSwappedPlane.tobytes()
-            rawPixelsStore.setPlane(convertedPlane, z, c, t, self.SERVICE_OPTS)
+            nonlocal sendBuffer
+            # big-endian buffer of the pixels type, reused across planes
+            dtype = numpy.dtype(convertToType or plane.dtype)
+            dtype = dtype.newbyteorder('>')
+            if (sendBuffer is None or sendBuffer.shape != plane.shape or
+                    sendBuffer.dtype != dtype):
+                sendBuffer = numpy.empty(plane.shape, dtype=dtype)
+            # converts type and byte order chunk by chunk, reducing each
+            # chunk of the source plane while it is still in cache
+            step = max(1, self.PLANE_CHUNK_BYTES // max(1, plane[:1].nbytes))
+            minValue = maxValue = None
+            total = 0.0
+            for y in range(0, plane.shape[0], step):
+                chunk = plane[y:y + step]
+                numpy.copyto(sendBuffer[y:y + step], chunk, casting='unsafe')
+                low = numpy.minimum.reduce(chunk, axis=None)
+                high = numpy.maximum.reduce(chunk, axis=None)
+                if minValue is None:
+                    minValue, maxValue = low, high
+                else:
+                    minValue = numpy.minimum(minValue, low)
+                    maxValue = numpy.maximum(maxValue, high)
+                if planeStats is not None:
+                    total += chunk.sum(dtype=numpy.float64)
+            rawPixelsStore.setPlane(
+                sendBuffer.view(numpy.uint8), z, c, t, self.SERVICE_OPTS)
+            if planeStats is not None:
+                histogram = None
+                if numpy.isfinite([minValue, maxValue]).all():
+                    histogram = numpy.histogram(
+                        plane, histogramBins,
+                        (float(minValue), float(maxValue)))
+                planeStats.append({
+                    'z': z, 'c': c, 't': t,
+                    'min': minValue, 'max': maxValue,
+                    'mean': total / plane.size,
+                    'histogram': histogram})
+            return minValue, maxValue
+
+        def uploadTiles(plane, z, c, t, convertToType):
+            sizeY, sizeX = plane.shape
+            tileWidth, tileHeight = rawPixelsStore.getTileSize(
+                self.SERVICE_OPTS)
+            upload = PlaneTileUpload(plane, convertToType)
+            loop = PlaneTileLoop(rawPixelsStore, z, c, t, self.SERVICE_OPTS)
+            loop.forEachTile(sizeX, sizeY, tileWidth, tileHeight, upload)
+            return upload.minValue, upload.maxValue
 
         image = None
         dtype = None
@@ -3890,10 +4574,13 @@ class _BlitzGateway (object):
                                 ).getId().getValue()
                             rawPixelsStore.setPixelsId(
                                 pixelsId, True, self.SERVICE_OPTS)
-                        uploadPlane(plane, theZ, theC, theT, dtype)
+                        if tiled:
+                            minValue, maxValue = uploadTiles(
+                                plane, theZ, theC, theT, dtype)
+                        else:
+                            minValue, maxValue = uploadPlane(
+                                plane, theZ, theC, theT, dtype)
                         # init or update min and max for this channel
-                        minValue = plane.min()
-                        maxValue = plane.max()
                         # first plane of each channel
                         if len(channelsMinMax) < (theC + 1):
                             channelsMinMax.append([minValue, maxValue])
@@ -4278,8 +4965,15 @@ class _BlitzGateway (object):
         :rtype:         :class:`EnumerationWrapper` generator
         """
 
-        types = self.getTypesService()
-        for e in types.allEnumerations(str(klass)):
+        key = ('enumeration', str(klass))
+        cache = self._objectCache
+        entries = cache.get(key) if cache is not None else None
+        if entries is None:
+            types = self.getTypesService()
+            entries = types.allEnumerations(str(klass))
+            if cache is not None:
+                cache.set(key, entries)
+        for e in entries:
             yield EnumerationWrapper(self, e)
 
     def getEnumeration(self, klass, string):
@@ -4294,8 +4988,14 @@ class _BlitzGateway (object):
         :rtype:         :class:`EnumerationWrapper`
         """
 
-        types = self.getTypesService()
-        obj = types.getEnumeration(str(klass), str(string))
+        key = ('enumeration', str(klass), 'value', str(string))
+        cache = self._objectCache
+        obj = cache.get(key) if cache is not None else None
+        if obj is None:
+            types = self.getTypesService()
+            obj = types.getEnumeration(str(klass), str(string))
+            if obj is not None and cache is not None:
+                cache.set(key, obj)
         if obj is not None:
             return EnumerationWrapper(self, obj)
         else:
@@ -4313,13 +5013,28 @@ class _BlitzGateway (object):
         :rtype:         :class:`EnumerationWrapper`
         """
 
-        query_serv = self.getQueryService()
-        obj = query_serv.find(klass, int(eid), self.SERVICE_OPTS)
+        obj = self._findEnumeration(klass, eid)
         if obj is not None:
             return EnumerationWrapper(self, obj)
         else:
             return None
 
+    def _findEnumeration(self, klass, eid):
+        """
+        Loads an enumeration object by class and ID through the object cache
+
+        :return:        omero.model object or None
+        """
+        key = ('enumeration', str(klass), int(eid))
+        cache = self._objectCache
+        obj = cache.get(key) if cache is not None else None
+        if obj is None:
+            query_serv = self.getQueryService()
+            obj = query_serv.find(klass, int(eid), self.SERVICE_OPTS)
+            if obj is not None and cache is not None:
+                cache.set(key, obj)
+        return obj
+
     def getOriginalEnumerations(self):
         """
         Gets original enumerations. Returns a dictionary of enumeration class:
@@ -4375,6 +5090,7 @@ class _BlitzGateway (object):
 
         types = self.getTypesService()
         types.deleteEnumeration(obj)
+        self._invalidateObjectCache('Enumeration')
 
     def createEnumeration(self, obj):
         """
@@ -4386,6 +5102,7 @@ class _BlitzGateway (object):
 
         types = self.getTypesService()
         types.createEnumeration(obj)
+        self._invalidateObjectCache('Enumeration')
 
     def resetEnumerations(self, klass):
         """
@@ -4397,6 +5114,7 @@ class _BlitzGateway (object):
 
         types = self.getTypesService()
         types.resetEnumerations(klass)
+        self._invalidateObjectCache('Enumeration')
 
     def updateEnumerations(self, new_entries):
         """
@@ -4408,6 +5126,7 @@ class _BlitzGateway (object):
 
         types = self.getTypesService()
         types.updateEnumerations(new_entries)
+        self._invalidateObjectCache('Enumeration')
 
     ###################
     # Delete          #
@@ -4525,6 +5244,7 @@ class _BlitzGateway (object):
         logger.debug('Delete2: \n%s' % str(delete))
 
         handle = self.c.sf.submit(delete, self.SERVICE_OPTS)
+        self._invalidateObjectCache(graph[0])
         if wait:
             try:
                 self._waitOnCmd(handle)
@@ -4633,6 +5353,7 @@ class _BlitzGateway (object):
         # NB: For Save to work, we need to be in target group
         ctx.setOmeroGroup(group_id)
         prx = self.c.sf.submit(da, ctx)
+        self._invalidateObjectCache(graph[0])
         return prx
 
     def chownObjects(self, graph_spec, obj_ids, owner_id, wait=False):
@@ -4802,24 +5523,29 @@ class _BlitzGateway (object):
             if ctx.getOmeroGroup() is None:
                 ctx.setOmeroGroup(-1)
             tb = self.createThumbnailStore()
-            p = omero.sys.ParametersI().addIds(image_ids)
             sql = """select new map(
                         i.id as im_id, p.id as pix_id
                      )
                      from Pixels as p join p.image as i
                      where i.id in (:ids) """
+            qs = self.getQueryService()
+
+            def load(chunk):
+                p = omero.sys.ParametersI().addIds(chunk)
+                return qs.projection(sql, p, ctx)
 
-            img_pixel_ids = self.getQueryService().projection(
-                sql, p, ctx)
             _temp = dict()
-            for e in img_pixel_ids:
-                e = unwrap(e)
-                _temp[e[0]['pix_id']] = e[0]['im_id']
-
-            thumbs_map = tb.getThumbnailByLongestSideSet(
-                rint(max_size), list(_temp), ctx)
-            for (pix, thumb) in list(thumbs_map.items()):
-                _resp[_temp[pix]] = thumb
+            for img_pixel_ids in self._mapIdChunks(load, image_ids):
+                for e in img_pixel_ids:
+                    e = unwrap(e)
+                    _temp[e[0]['pix_id']] = e[0]['im_id']
+
+            # The stateful thumbnail store is called for one chunk at a time
+            for pix_ids in self._chunkIds(list(_temp)):
+                thumbs_map = tb.getThumbnailByLongestSideSet(
+                    rint(max_size), pix_ids, ctx)
+                for (pix, thumb) in list(thumbs_map.items()):
+                    _resp[_temp[pix]] = thumb
         except Exception:
             logger.error(traceback.format_exc())
         finally:  # pragma: no cover
@@ -7480,7 +8206,12 @@ class _PixelsWrapper (BlitzObjectWrapper):
 
         It has the methods :meth:`getValue` and :meth:`getBitSize`.
         """
-        return BlitzObjectWrapper(self._conn, self._obj.getPixelsType())
+        pixelsType = self._obj.getPixelsType()
+        if (self._conn is not None and pixelsType is not None and
+                not pixelsType.isLoaded()):
+            pixelsType = self._conn._findEnumeration(
+                pixelsType.__class__.__name__, pixelsType.id.val)
+        return BlitzObjectWrapper(self._conn, pixelsType)
 
     def copyPlaneInfo(self, theC=None, theT=None, theZ=None):
         """
@@ -7521,19 +8252,24 @@ class _PixelsWrapper (BlitzObjectWrapper):
         for pi in result:
             yield PlaneInfoWrapper(self._conn, pi)
 
-    def getPlanes(self, zctList):
+    def getPlanes(self, zctList, workers=1, readAhead=None):
         """
         Returns generator of numpy 2D planes from this set of pixels for a
         list of Z, C, T indexes.
 
         :param zctList:     A list of indexes: [(z,c,t), ]
+        :param workers:     Number of RawPixelsStores to read concurrently
+                            with. See :meth:`getTiles`
+        :param readAhead:   Maximum number of planes requested ahead of the
+                            one being yielded. See :meth:`getTiles`
         """
 
         zctTileList = []
         for zct in zctList:
             z, c, t = zct
             zctTileList.append((z, c, t, None))
-        return self.getTiles(zctTileList)
+        return self.getTiles(zctTileList, workers=workers,
+                             readAhead=readAhead)
 
     def getPlane(self, theZ=0, theC=0, theT=0):
         """
@@ -7555,47 +8291,60 @@ class _PixelsWrapper (BlitzObjectWrapper):
         pixels_type = self.getPixelsType().value
         return OMERO_NUMPY_TYPES[pixels_type]
 
-    def getTiles(self, zctTileList):
+    def _readTile(self, rawPixelsStore, zctTile, pixelType):
+        """
+        Reads a single plane or tile from rawPixelsStore and decodes it into
+        a 2D numpy array.
+
+        :param rawPixelsStore:  An initialised RawPixelsStore
+        :param zctTile:         (z, c, t, tile) where tile is
+                                (x, y, width, height) or None
+        :param pixelType:       The OMERO pixels type, e.g. 'uint16'
+        """
+        from omero.util.pixelstypetopython import toNumpyPlane
+
+        z, c, t, tile = zctTile
+        if tile is None:
+            rawPlane = rawPixelsStore.getPlane(z, c, t)
+            planeY = self.sizeY
+            planeX = self.sizeX
+        else:
+            x, y, width, height = tile
+            rawPlane = rawPixelsStore.getTile(
+                z, c, t, x, y, width, height)
+            planeY = height
+            planeX = width
+        return toNumpyPlane(rawPlane, pixelType, planeY, planeX)
+
+    def getTiles(self, zctTileList, workers=1, readAhead=None):
         """
         Returns generator of numpy 2D planes from this set of pixels for a
         list of (Z, C, T, tile) where tile is (x, y, width, height) or None if
         you want the whole plane.
 
-        :param zctrList:     A list of indexes: [(z,c,t, region), ]
+        If workers is greater than 1, that many RawPixelsStores are opened
+        for these pixels and the tiles are fetched concurrently, at most
+        readAhead tiles ahead of the one being consumed (default is twice
+        the number of workers). Tiles are always yielded in the order of
+        zctTileList.
+
+        :param zctrList:    A list of indexes: [(z,c,t, region), ]
+        :param workers:     Number of RawPixelsStores to read with
+        :param readAhead:   Maximum number of tiles in flight
         """
 
-        from struct import unpack
+        if workers > 1:
+            yield from self._getTilesConcurrently(
+                zctTileList, workers, readAhead)
+            return
 
         rawPixelsStore = None
-        sizeX = self.sizeX
-        sizeY = self.sizeY
         pixelType = self.getPixelsType().value
-        numpyType = self.get_numpy_type()
         exc = None
         try:
             rawPixelsStore = self._prepareRawPixelsStore()
             for zctTile in zctTileList:
-                z, c, t, tile = zctTile
-                if tile is None:
-                    rawPlane = rawPixelsStore.getPlane(z, c, t)
-                    planeY = sizeY
-                    planeX = sizeX
-                else:
-                    x, y, width, height = tile
-                    rawPlane = rawPixelsStore.getTile(
-                        z, c, t, x, y, width, height)
-                    planeY = height
-                    planeX = width
-                np_char = numpy.dtype(OMERO_NUMPY_TYPES[pixelType]).char
-                convertType = '>%d%s' % ((planeY*planeX), np_char)
-                if isinstance(rawPlane, bytes):
-                    convertedPlane = unpack(convertType, rawPlane)
-                else:
-                    encoded = rawPlane.encode("utf-8")
-                    convertedPlane = unpack(convertType, encoded)
-                remappedPlane = numpy.array(convertedPlane, numpyType)
-                remappedPlane.resize(planeY, planeX)
-                yield remappedPlane
+                yield self._readTile(rawPixelsStore, zctTile, pixelType)
         except Exception as e:
             logger.error(
                 "Failed to getPlane() or getTile() from rawPixelsStore",
@@ -7611,6 +8360,156 @@ class _PixelsWrapper (BlitzObjectWrapper):
         if exc is not None:
             raise exc
 
+    def _getTilesConcurrently(self, zctTileList, workers, readAhead=None):
+        """
+        Generator behind :meth:`getTiles` when more than one worker is
+        requested. Each worker thread borrows one of the RawPixelsStores
+        from a queue for the duration of a single read.
+        """
+        from collections import deque
+        from concurrent.futures import ThreadPoolExecutor
+        from queue import Queue
+
+        if readAhead is None:
+            readAhead = 2 * workers
+        readAhead = max(readAhead, workers)
+        pixelType = self.getPixelsType().value
+        stores = Queue()
+        opened = []
+
+        def read(zctTile):
+            rawPixelsStore = stores.get()
+            try:
+                return self._readTile(rawPixelsStore, zctTile, pixelType)
+            finally:
+                stores.put(rawPixelsStore)
+
+        pending = deque()
+        try:
+            for i in range(workers):
+                rawPixelsStore = self._conn.createRawPixelsStore().clone()
+                opened.append(rawPixelsStore)
+                rawPixelsStore.setPixelsId(
+                    self._obj.id.val, True, self._conn.SERVICE_OPTS)
+                stores.put(rawPixelsStore)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                tiles = iter(zctTileList)
+                try:
+                    for zctTile in tiles:
+                        pending.append(executor.submit(read, zctTile))
+                        if len(pending) >= readAhead:
+                            break
+                    while pending:
+                        plane = pending.popleft().result()
+                        for zctTile in tiles:
+                            pending.append(executor.submit(read, zctTile))
+                            break
+                        yield plane
+                finally:
+                    for future in pending:
+                        future.cancel()
+        except Exception:
+            logger.error(
+                "Failed to getPlane() or getTile() from rawPixelsStore",
+                exc_info=True)
+            raise
+        finally:
+            for rawPixelsStore in opened:
+                try:
+                    rawPixelsStore.close()
+                except Exception:
+                    logger.error("Failed to close rawPixelsStore",
+                                 exc_info=True)
+
+    def getHyperstack(self, zRange=None, cRange=None, tRange=None,
+                      tile=None, step=None, filename=None, out=None):
+        """
+        Reads a 5D region of this set of pixels into a single numpy array of
+        shape (T, C, Z, Y, X), allocated once and filled in place.
+
+        Whole Z stacks are read with RawPixelsStore.getStack() when they fit
+        in one Ice message, whole planes with getPlane() and regions or
+        strided reads with getHypercube(). No intermediate per-plane arrays
+        are kept, so peak memory is the size of the result. If filename is
+        given the result is a numpy.memmap on local disk, allowing volumes
+        larger than RAM to be read.
+
+        :param zRange:      (start, stop) of Z indexes, default all
+        :param cRange:      (start, stop) of Channel indexes, default all
+        :param tRange:      (start, stop) of Time indexes, default all
+        :param tile:        (x, y, width, height) or None for whole planes
+        :param step:        (x, y, z, c, t) step along each dimension,
+                            default 1 everywhere
+        :param filename:    If set, path of a numpy.memmap to create
+        :param out:         Existing array of the correct shape and type to
+                            fill instead of allocating a new one
+        :return:            numpy array of shape (T, C, Z, Y, X)
+        """
+        sizeX = self.getSizeX()
+        sizeY = self.getSizeY()
+        sizeZ = self.getSizeZ()
+        if tile is None:
+            tile = (0, 0, sizeX, sizeY)
+        x, y, width, height = tile
+        if step is None:
+            step = (1, 1, 1, 1, 1)
+        stepX, stepY, stepZ, stepC, stepT = step
+        zs = range(*(zRange or (0, sizeZ)), stepZ)
+        cs = range(*(cRange or (0, self.getSizeC())), stepC)
+        ts = range(*(tRange or (0, self.getSizeT())), stepT)
+        ys = range(y, y + height, stepY)
+        xs = range(x, x + width, stepX)
+        shape = (len(ts), len(cs), len(zs), len(ys), len(xs))
+
+        dtype = numpy.dtype(self.get_numpy_type())
+        rawType = dtype.newbyteorder('>')
+        if out is not None:
+            if out.shape != shape or out.dtype != dtype:
+                raise ValueError(
+                    "out must have shape %s and dtype %s" % (shape, dtype))
+        elif filename is not None:
+            out = numpy.memmap(filename, dtype=dtype, mode='w+', shape=shape)
+        else:
+            out = numpy.empty(shape, dtype=dtype)
+
+        wholePlane = (ys == range(0, sizeY) and xs == range(0, sizeX))
+        stackBytes = sizeZ * sizeY * sizeX * dtype.itemsize
+        wholeStack = (wholePlane and zs == range(0, sizeZ) and
+                      stackBytes <= omero.constants.MESSAGESIZEMAX * 512)
+
+        rawPixelsStore = self._prepareRawPixelsStore()
+        try:
+            for ti, theT in enumerate(ts):
+                for ci, theC in enumerate(cs):
+                    if wholeStack:
+                        rawStack = rawPixelsStore.getStack(theC, theT)
+                        out[ti, ci] = numpy.frombuffer(
+                            rawStack, dtype=rawType).reshape(shape[2:])
+                        continue
+                    for zi, theZ in enumerate(zs):
+                        if wholePlane:
+                            rawPlane = rawPixelsStore.getPlane(
+                                theZ, theC, theT)
+                        else:
+                            rawPlane = rawPixelsStore.getHypercube(
+                                [x, y, theZ, theC, theT],
+                                [width, height, 1, 1, 1],
+                                [stepX, stepY, 1, 1, 1])
+                        out[ti, ci, zi] = numpy.frombuffer(
+                            rawPlane, dtype=rawType).reshape(shape[3:])
+        except Exception:
+            logger.error("Failed to read hyperstack from rawPixelsStore",
+                         exc_info=True)
+            raise
+        finally:
+            try:
+                rawPixelsStore.close()
+            except Exception:
+                logger.error("Failed to close rawPixelsStore", exc_info=True)
+        if isinstance(out, numpy.memmap):
+            out.flush()
+        return out
+
     def getTile(self, theZ=0, theC=0, theT=0, tile=None):
         """
         Gets the specified plane as a 2D numpy array by calling
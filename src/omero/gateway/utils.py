@@ -23,8 +23,13 @@
 # Version: 1.0
 #
 
+import copy
 import logging
 import json
+import threading
+import time
+
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
@@ -171,6 +176,102 @@ class ServiceOptsDict(dict):
         return False
 
 
+class ObjectCache(object):
+
+    """
+    Thread safe LRU cache whose entries expire ttl seconds after they were
+    stored. Used by the gateway to keep rarely changing objects such as
+    Experimenters, Groups and enumerations for the lifetime of a session.
+
+    Keys are tuples whose first item is the lower case object type, so
+    that :meth:`invalidate` can drop all entries of a type. Values are
+    copied when they are stored and returned, since omero.model objects
+    are mutable and each caller must get its own.
+    """
+
+    def __init__(self, max_size=1000, ttl=300):
+        """
+        :param max_size:    Maximum number of entries
+        :param ttl:         Seconds an entry stays valid, None for no expiry
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored under key, or default if it is missing or
+        has expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and \
+                    time.monotonic() - entry[0] >= self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Copied outside of the lock
+        return copy.deepcopy(entry[1])
+
+    def set(self, key, value):
+        """
+        Stores value under key, evicting the least recently used entries
+        beyond max_size
+        """
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, obj_type=None):
+        """
+        Drops all entries of obj_type, e.g. 'Experimenter', or every entry
+        if obj_type is None
+        """
+        with self._lock:
+            if obj_type is None:
+                keys = list(self._entries)
+            else:
+                obj_type = obj_type.lower()
+                keys = [k for k in self._entries if k[0] == obj_type]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+
+    def clear(self):
+        """Drops all entries, keeping the statistics"""
+        self.invalidate()
+
+    def stats(self):
+        """
+        Returns a dict of the number of hits, misses, evictions,
+        expirations and invalidations and the current size
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'expirations': self.expirations,
+                    'invalidations': self.invalidations,
+                    'size': len(self._entries)}
+
+
 def toBoolean(val):
     """
     Get the boolean value of the provided input.
@@ -16,6 +16,8 @@ import logging
 import threading
 import traceback
 
+from collections import OrderedDict
+
 from os import W_OK
 
 import omero  # Do we need both??
@@ -37,6 +39,12 @@ tables = __import__("tables")  # Pytables
 
 TABLES_METADATA_INT_TYPES = (int, numpy.int64)
 VERSION = '2'
+# Metadata key holding a comma-separated list of columns to index
+INDEX_KEY = 'omero_tables_index'
+# Storage options for new tables, given either as metadata keys with this
+# prefix or as call context keys "omero.tables.<option>"
+OPTION_PREFIX = 'omero_tables_'
+DEFAULT_COMPRESSION_LEVEL = 5
 
 
 def internal_attr(s):
@@ -99,13 +107,23 @@ class HdfList(object):
     This also holds a global lock for all HDF5 calls since libhdf5 is usually
     compiled without --enable-threadsafe, see
     https://trac.openmicroscopy.org/ome/ticket/10464
+
+    All tables opened on one path share a single HdfStorage. A writable
+    open is refused while the path is held read-only by other tables.
+    Read-only storages which are no longer used by any table are kept
+    open for idle_ttl seconds (at most max_idle of them) so that hot
+    files are not reopened by every getTable().
     """
 
+    idle_ttl = 60.0
+    max_idle = 32
+
     def __init__(self):
         self.logger = logging.getLogger("omero.tables.HdfList")
         self._lock = threading.RLock()
         self.__filenos = {}
         self.__paths = {}
+        self.__idle = OrderedDict()
 
     @locked
     def addOrThrow(self, hdfpath, hdfstorage, read_only=False):
@@ -147,15 +165,70 @@ class HdfList(object):
 
     @locked
     def getOrCreate(self, hdfpath, table, read_only=False):
-        storage = None
-        try:
-            storage = self.__paths[hdfpath]
-        except KeyError:
+        self.evict_idle()
+        storage = self.__paths.get(hdfpath)
+        if storage is not None and not read_only and \
+                storage.is_read_only() and path(hdfpath).access(W_OK):
+            # A file which isn't writable would be reopened read-only
+            # anyway (see HdfStorage.openfile), so the storage is shared
+            # and writes fail as they would on a fresh open
+            if hdfpath not in self.__idle:
+                raise omero.LockTimeout(
+                    None, None, "Path opened read-only: %s" % hdfpath, 0)
+            # Reopen writable
+            del self.__idle[hdfpath]
+            storage.cleanup()
+            storage = None
+        if storage is None:
             # Adds itself to the global list
             storage = HdfStorage(hdfpath, self._lock, read_only=read_only)
+        elif self.__idle.pop(hdfpath, None) is not None:
+            self.logger.debug("Reusing idle storage: %s", hdfpath)
         storage.incr(table)
         return storage
 
+    @locked
+    def release(self, hdfpath, storage):
+        """
+        Called by a storage once its last table is detached. Read-only
+        storages are kept open as idle, all others are cleaned up.
+        """
+        if self.idle_ttl > 0 and self.max_idle > 0 and \
+                storage.is_read_only():
+            # Don't hold on to cached results while nobody is reading
+            storage._clear_where_cache()
+            self.__idle[hdfpath] = time.time()
+            self.evict_idle()
+        else:
+            storage.cleanup()
+
+    @locked
+    def evict_idle(self, force=False):
+        """
+        Cleans up idle storages older than idle_ttl, beyond max_idle,
+        or all of them if force is True.
+        """
+        expiry = time.time() - self.idle_ttl
+        for hdfpath, since in list(self.__idle.items()):
+            if force or since < expiry or len(self.__idle) > self.max_idle:
+                del self.__idle[hdfpath]
+                self.logger.debug("Evicting idle storage: %s", hdfpath)
+                self.__paths[hdfpath].cleanup()
+
+    def check(self):
+        """
+        Periodic sweep (see omero.util.Resources) so that idle storages
+        are evicted even when no other table is opened or released
+        """
+        self.evict_idle()
+        return True
+
+    def cleanup(self):
+        """
+        Closes all idle storages on shutdown
+        """
+        self.evict_idle(force=True)
+
     @locked
     def remove(self, hdfpath, hdffile):
         del self.__filenos[hdffile.fileno()]
@@ -172,6 +245,19 @@ class HdfStorage(object):
     instance will be available for any given physical HDF5 file.
     """
 
+    # update() writes each contiguous run of rows with modify_column()
+    # while there are at most this many runs, otherwise it rewrites the
+    # affected records with a single modify_coordinates()
+    UPDATE_MAX_RUNS = 16
+
+    # Rows read per chunk by aggregate()
+    AGGREGATE_CHUNK = 1 << 20
+
+    # Bounds for the getWhereList() result cache: number of entries and
+    # total size of the cached row numbers (8 bytes each) per storage
+    WHERE_CACHE_SIZE = 64
+    WHERE_CACHE_BYTES = 16 * 1024 * 1024
+
     def __init__(self, file_path, hdf5lock, read_only=False):
         """
         file_path should be the path to a file in a valid directory where
@@ -197,6 +283,8 @@ class HdfStorage(object):
         # These are what we'd like to have
         self.__mea = None
         self.__ome = None
+        # Decoded (type, name, description) per column, see __schema()
+        self.__schema_cache = None
 
         try:
             self.__ome = self.__hdf_file.root.OME
@@ -209,6 +297,13 @@ class HdfStorage(object):
 
         self._modified = False
 
+        # getWhereList() results, cleared by flush() or a new stamp
+        self.__where_cache = OrderedDict()
+        self.__where_cache_bytes = 0
+        self.__where_cache_stamp = self._stamp
+        self.__where_hits = 0
+        self.__where_misses = 0
+
     #
     # Non-locked methods
     #
@@ -328,13 +423,98 @@ class HdfStorage(object):
         self._modified = True
         if self.__mea:
             self.__mea.flush()
+            if self.__mea.indexed and not self.__mea.autoindex:
+                # Index maintenance deferred by add_indexes()
+                self.__mea.flush_rows_to_index()
+                self.__mea.reindex_dirty()
+        self._clear_where_cache()
         self.logger.debug("Modified flag set")
 
+    def _clear_where_cache(self):
+        self.__where_cache.clear()
+        self.__where_cache_bytes = 0
+        self.__where_cache_stamp = self._stamp
+
+    def _where_cached(self, key):
+        """
+        Returns the cached getWhereList() result for key or None,
+        dropping all results if the stamp has moved since they were cached
+        """
+        if self.__where_cache_stamp != self._stamp:
+            self._clear_where_cache()
+        rv = self.__where_cache.get(key)
+        if rv is None:
+            self.__where_misses += 1
+        else:
+            self.__where_hits += 1
+            self.__where_cache.move_to_end(key)
+        self.logger.debug("getWhereList cache %s: hits=%s misses=%s",
+                          rv is None and "miss" or "hit",
+                          self.__where_hits, self.__where_misses)
+        return rv
+
+    def _where_cache(self, key, rows):
+        """
+        Caches the row numbers array for key, evicting the least recently
+        used results beyond WHERE_CACHE_SIZE or WHERE_CACHE_BYTES
+        """
+        if rows.nbytes > self.WHERE_CACHE_BYTES:
+            return
+        rows.flags.writeable = False
+        self.__where_cache[key] = rows
+        self.__where_cache_bytes += rows.nbytes
+        while (len(self.__where_cache) > self.WHERE_CACHE_SIZE or
+               self.__where_cache_bytes > self.WHERE_CACHE_BYTES):
+            old_key, old_rows = self.__where_cache.popitem(last=False)
+            self.__where_cache_bytes -= old_rows.nbytes
+
+    def __filters(self, metadata, current):
+        """
+        Returns the tables.Filters and expected number of rows for a new
+        table from the "compression" (e.g. "blosc:zstd", "zlib"),
+        "compression_level", "shuffle" and "expectedrows" options
+        """
+        ctx = getattr(current, "ctx", None) or {}
+
+        def option(name):
+            value = metadata.get(OPTION_PREFIX + name)
+            if value is None:
+                value = ctx.get("omero.tables." + name)
+            return unwrap(value)
+
+        complib = option("compression")
+        level = option("compression_level")
+        shuffle = option("shuffle")
+        expectedrows = option("expectedrows")
+        try:
+            if level is not None:
+                level = int(level)
+            elif complib:
+                level = DEFAULT_COMPRESSION_LEVEL
+            else:
+                level = 0
+            if shuffle is None:
+                shuffle = True
+            elif isinstance(shuffle, str):
+                shuffle = shuffle.lower() == "true"
+            if expectedrows is not None:
+                expectedrows = int(expectedrows)
+            filters = tables.Filters(
+                complevel=level, complib=complib or "zlib",
+                shuffle=bool(shuffle))
+        except ValueError as ve:
+            raise omero.ApiUsageException(
+                None, None, "Bad storage options: %s" % ve)
+        return filters, expectedrows
+
     @locked
     @modifies
-    def initialize(self, cols, metadata=None):
+    def initialize(self, cols, metadata=None, current=None):
         """
-
+        Creates the Measurements table with columns cols. Compression and
+        the expected number of rows can be set for the new table via
+        metadata or the call context, see __filters(). Existing tables
+        are read whatever their filters.
         """
         if metadata is None:
             metadata = {}
@@ -353,11 +533,16 @@ class HdfStorage(object):
                 raise omero.ApiUsageException(
                     None, None, "Reserved column name: %s" % c.name)
 
+        filters, expectedrows = self.__filters(metadata, current)
         self.__definition = columns2definition(cols)
         self.__ome = self.__hdf_file.create_group("/", "OME")
+        kwargs = {"filters": filters}
+        if expectedrows:
+            kwargs["expectedrows"] = expectedrows
         self.__mea = self.__hdf_file.create_table(
-            self.__ome, "Measurements", self.__definition)
+            self.__ome, "Measurements", self.__definition, **kwargs)
 
+        self.__schema_cache = None
         self.__types = [x.ice_staticId() for x in cols]
         self.__descriptions = [
             (x.description is not None) and x.description or "" for x in cols]
@@ -374,6 +559,7 @@ class HdfStorage(object):
 
         self.__hdf_file.flush()
         self.__initialized = True
+        self._index_from_metadata(md)
 
     @locked
     def incr(self, table):
@@ -396,9 +582,12 @@ class HdfStorage(object):
             raise omero.ApiUsageException(None, None, "Unknown table")
         self.__tables.remove(table)
         if sz <= 1:
-            self.cleanup()
+            HDFLIST.release(self.__hdf_path, self)
         return sz - 1
 
+    def is_read_only(self):
+        return self.__hdf_file is not None and self.__hdf_file.mode == "r"
+
     @locked
     def uptodate(self, stamp):
         return self._stamp <= stamp
@@ -408,28 +597,45 @@ class HdfStorage(object):
         self.__initcheck()
         return self.__mea.nrows
 
+    def __schema(self):
+        """
+        Returns the decoded (type, name, description) of every column,
+        cached until the columns are redefined by initialize()
+        """
+        if self.__schema_cache is None:
+            schema = []
+            for t, n, d in zip(self.__types, self.__mea.colnames,
+                               self.__descriptions):
+                if isinstance(t, bytes):
+                    t = t.decode("utf-8")
+                if isinstance(d, bytes):
+                    d = d.decode("utf-8")
+                schema.append((t, n, d))
+            self.__schema_cache = schema
+        return self.__schema_cache
+
     @locked
-    def cols(self, size, current):
+    def cols(self, size, current, colNumbers=None):
+        """
+        Creates the column objects for this table, or only those at the
+        indexes in colNumbers if given
+        """
         self.__initcheck()
         ic = current.adapter.getCommunicator()
-        types = self.__types
-        names = self.__mea.colnames
-        descs = self.__descriptions
+        numpy_values = self._numpy_values(current)
+        schema = self.__schema()
+        if colNumbers is None:
+            colNumbers = range(len(schema))
         cols = []
-        for i in range(len(types)):
-            t = types[i]
-            if isinstance(t, bytes):
-                t = t.decode("utf-8")
-            n = names[i]
-            d = descs[i]
-            if isinstance(d, bytes):
-                d = d.decode("utf-8")
+        for i in colNumbers:
+            t, n, d = schema[i]
             try:
                 col = ic.findObjectFactory(t).create(t)
                 col.name = n
                 col.description = d
                 col.setsize(size)
                 col.settable(self.__mea)
+                col.numpy_values = numpy_values
                 cols.append(col)
             except:
                 msg = traceback.format_exc()
@@ -493,6 +699,45 @@ class HdfStorage(object):
             # This uses the default pytables type conversion, which may
             # convert it to a numpy type or keep it as a native Python type
             attr[k] = unwrap(v)
+        if not init:
+            self._index_from_metadata(m)
+
+    def _index_from_metadata(self, m):
+        """
+        Creates the indexes listed under INDEX_KEY in metadata map m
+        """
+        names = unwrap(m.get(INDEX_KEY))
+        if names:
+            self.add_indexes([n.strip() for n in names.split(",")
+                              if n.strip()])
+
+    @locked
+    @modifies
+    def add_indexes(self, names):
+        """
+        Creates completely sorted indexes on the named columns, which are
+        then used by getWhereList(). Index maintenance after appends and
+        updates is deferred to flush(), and indexes are made completely
+        sorted again on cleanup().
+        """
+        self.__initcheck()
+        cols = []
+        for name in names:
+            try:
+                col = getattr(self.__mea.cols, name)
+            except (AttributeError, KeyError):
+                raise omero.ApiUsageException(
+                    None, None, "Unknown column: %s" % name)
+            if not isinstance(col, tables.Column) or len(col.shape) > 1:
+                raise omero.ApiUsageException(
+                    None, None, "Column cannot be indexed: %s" % name)
+            cols.append(col)
+        for col in cols:
+            if not col.is_indexed:
+                self.logger.info("Indexing column %s of %s",
+                                 col.name, self.__hdf_path)
+                col.create_csindex()
+        self.__mea.autoindex = False
 
     @locked
     @modifies
@@ -513,8 +758,12 @@ class HdfStorage(object):
             dtypes.extend(col.dtypes())
             col.append(self.__mea)  # Potential corruption !!!
 
-        # Convert column-wise data to row-wise records
-        records = numpy.array(list(zip(*arrays)), dtype=dtypes)
+        # Fill a preallocated record array one column at a time rather
+        # than building a tuple per row
+        records = numpy.empty(sz or 0, dtype=dtypes)
+        for dtype, array in zip(dtypes, arrays):
+            field = records[dtype[0]]
+            field[...] = numpy.asarray(array).reshape(field.shape)
 
         self.__mea.append(records)
 
@@ -527,23 +776,78 @@ class HdfStorage(object):
     def update(self, stamp, data):
         self.__initcheck()
         self.__sizecheck(None, data.rowNumbers)
-        if data:
-            for i, rn in enumerate(data.rowNumbers):
-                for col in data.columns:
-                    getattr(self.__mea.cols, col.name)[rn] = col.values[i]
+        if not data:
+            return
+        # Sort the rows, keeping the last value given for any duplicate row
+        rows = numpy.asarray(data.rowNumbers, dtype=numpy.int64)
+        order = numpy.argsort(rows, kind="stable")
+        rows = rows[order]
+        last = numpy.append(rows[1:] != rows[:-1], True)
+        rows = rows[last]
+        order = order[last]
+        # Contiguous runs of rows as [start, stop) offsets into rows
+        breaks = numpy.flatnonzero(numpy.diff(rows) != 1) + 1
+        starts = numpy.concatenate(([0], breaks))
+        stops = numpy.append(breaks, len(rows))
+
+        values = {}
+        for col in data.columns:
+            tblcol = getattr(self.__mea.cols, col.name)
+            values[col.name] = self._update_values(col, tblcol)[order]
+
+        if len(starts) <= self.UPDATE_MAX_RUNS:
+            for name, vals in values.items():
+                for b, e in zip(starts, stops):
+                    self.__mea.modify_column(
+                        start=rows[b], stop=rows[e - 1] + 1,
+                        column=vals[b:e], colname=name)
+        else:
+            records = self.__mea.read_coordinates(rows)
+            for name, vals in values.items():
+                records[name] = vals
+            self.__mea.modify_coordinates(rows, records)
+
+    def _update_values(self, col, tblcol):
+        """
+        Converts the values of an update column to an array of the stored
+        dtype, one element per row.
+        """
+        dtype = tblcol.dtype
+        vals = col.values
+        if dtype.kind == "S":
+            vals = [v.encode() if isinstance(v, str) else v for v in vals]
+            for v in vals:
+                if len(v) > dtype.itemsize:
+                    raise omero.ValidationException(
+                        None, None,
+                        "Maximum string (byte) length in column %s is %d" %
+                        (col.name, dtype.itemsize))
+        arr = numpy.asarray(vals, dtype=dtype.base)
+        return arr.reshape((len(vals),) + tuple(tblcol.shape[1:]))
 
     @stamped
     def getWhereList(self, stamp, condition, variables, unused,
                      start, stop, step):
         self.__initcheck()
         try:
+            # Row numbers are cached as int64 arrays and every call
+            # returns a new list
+            cache_key = (condition,
+                         tuple(sorted((k, repr(v))
+                                      for k, v in (variables or {}).items())),
+                         start, stop, step)
+            rv = self._where_cached(cache_key)
+            if rv is not None:
+                return rv.tolist()
             condvars = variables
             if variables:
                 for key, value in condvars.items():
                     if isinstance(value, str):
                         condvars[key] = getattr(self.__mea.cols, value)
-            return self.__mea.get_where_list(condition, condvars, None,
-                                             start, stop, step).tolist()
+            rv = self.__mea.get_where_list(condition, condvars, None,
+                                           start, stop, step)
+            self._where_cache(cache_key, rv)
+            return rv.tolist()
         except (NameError, SyntaxError, TypeError, ValueError) as err:
             aue = omero.ApiUsageException()
             aue.message = "Bad condition: %s, %s" % (condition, variables)
@@ -551,9 +855,209 @@ class HdfStorage(object):
             aue.serverExceptionClass = str(err.__class__.__name__)
             raise aue
 
+    def __numeric(self, colNumber, kinds="biuf"):
+        self.__sizecheck([colNumber], None)
+        name = self.__mea.colnames[colNumber]
+        col = getattr(self.__mea.cols, name, None)
+        if not isinstance(col, tables.Column) or len(col.shape) > 1 or \
+                col.dtype.kind not in kinds:
+            raise omero.ApiUsageException(
+                None, None, "Column cannot be aggregated: %s" % name)
+        return name
+
+    def __chunks(self, names, start, stop):
+        """
+        Yields the values of the named columns in chunks of at most
+        AGGREGATE_CHUNK rows of [start, stop)
+        """
+        for s in range(start, stop, self.AGGREGATE_CHUNK):
+            e = min(s + self.AGGREGATE_CHUNK, stop)
+            yield [self.__mea.read(s, e, field=n) for n in names]
+
+    @stamped
+    def aggregate(self, stamp, colNumber, functions, groupBy=None,
+                  start=None, stop=None, bins=10):
+        """
+        Computes aggregates of the numeric column colNumber over the rows
+        [start, stop) in chunks, without returning the column itself.
+
+        functions is a list of "count", "sum", "mean", "min", "max" and
+        "histogram". Returns a dict from function name to result; the
+        histogram is a (counts, bin edges) tuple of arrays with bins bins.
+
+        If groupBy is the number of an integer column (e.g. an
+        ImageColumn or WellColumn), every result is an array with one
+        value per distinct id, and the ids are returned under "groupBy".
+        "histogram" cannot be grouped.
+
+        NaN values are ignored, so "count" is the number of non-NaN
+        values, and groups with none have a NaN mean, min and max. Only
+        finite values are counted by "histogram". Sums of integer and
+        Bool columns are integers.
+        """
+        self.__initcheck()
+        known = ("count", "sum", "mean", "min", "max", "histogram")
+        for f in functions:
+            if f not in known:
+                raise omero.ApiUsageException(
+                    None, None, "Unknown aggregate: %s" % f)
+        name = self.__numeric(colNumber)
+        start = start or 0
+        stop = self.__length() if stop is None else min(stop, self.__length())
+        if groupBy is not None:
+            if "histogram" in functions:
+                raise omero.ApiUsageException(
+                    None, None, "histogram cannot be grouped")
+            return self.__grouped(
+                name, self.__numeric(groupBy, "iu"), functions, start, stop)
+
+        count = 0
+        total = self.__sum_dtype(self.__mea.coldtypes[name]).type(0)
+        low = high = None
+        for (vals,) in self.__chunks([name], start, stop):
+            if vals.dtype.kind == "f":
+                vals = vals[~numpy.isnan(vals)]
+            if not len(vals):
+                continue
+            count += len(vals)
+            total += vals.sum(dtype=total.dtype)
+            low = vals.min() if low is None else min(low, vals.min())
+            high = vals.max() if high is None else max(high, vals.max())
+        rv = {}
+        for f in functions:
+            if f == "count":
+                rv[f] = count
+            elif f == "sum":
+                rv[f] = total
+            elif f == "mean":
+                rv[f] = total / count if count else None
+            elif f == "min":
+                rv[f] = low
+            elif f == "max":
+                rv[f] = high
+        if "histogram" in functions:
+            rv["histogram"] = self.__histogram(
+                name, start, stop, bins, low, high)
+        return rv
+
+    @staticmethod
+    def __sum_dtype(dtype):
+        """
+        float64 for floating point columns, otherwise numpy's default
+        (int64 or uint64) so that integer sums stay exact
+        """
+        if dtype.kind == "f":
+            return numpy.dtype(numpy.float64)
+        return numpy.zeros(0, dtype).sum().dtype
+
+    def __histogram(self, name, start, stop, bins, low, high):
+        def finite(vals):
+            if vals.dtype.kind == "f":
+                return vals[numpy.isfinite(vals)]
+            # numpy cannot bin Bool values
+            return vals.astype(numpy.int64, copy=False)
+
+        if low is not None and not numpy.isfinite([low, high]).all():
+            # Infinite values are not binned, find the finite range
+            low = high = None
+            for (vals,) in self.__chunks([name], start, stop):
+                vals = finite(vals)
+                if len(vals):
+                    low = vals.min() if low is None else min(low, vals.min())
+                    high = vals.max() if high is None else max(high,
+                                                               vals.max())
+        edges = numpy.histogram_bin_edges(
+            [], bins, None if low is None else (float(low), float(high)))
+        counts = numpy.zeros(bins, dtype=numpy.int64)
+        for (vals,) in self.__chunks([name], start, stop):
+            counts += numpy.histogram(finite(vals), edges)[0]
+        return (counts, edges)
+
+    @staticmethod
+    def __extremes(lows, highs, inv, n):
+        """
+        Minimum of lows and maximum of highs per group. Floating point
+        groups start as NaN, which fmin/fmax replace by any other value.
+        """
+        if lows.dtype.kind == "f":
+            low = numpy.full(n, numpy.nan, lows.dtype)
+            high = numpy.full(n, numpy.nan, highs.dtype)
+            numpy.fmin.at(low, inv, lows)
+            numpy.fmax.at(high, inv, highs)
+        else:
+            low = numpy.full(n, lows.max() if len(lows) else 0, lows.dtype)
+            high = numpy.full(n, highs.min() if len(highs) else 0,
+                              highs.dtype)
+            numpy.minimum.at(low, inv, lows)
+            numpy.maximum.at(high, inv, highs)
+        return low, high
+
+    def __grouped(self, name, group, functions, start, stop):
+        sum_dtype = self.__sum_dtype(self.__mea.coldtypes[name])
+        # Per chunk: distinct ids with their count, sum, min and max
+        parts = []
+        for vals, ids in self.__chunks([name, group], start, stop):
+            uniq, inv = numpy.unique(ids, return_inverse=True)
+            n = len(uniq)
+            count = numpy.zeros(n, numpy.int64)
+            total = numpy.zeros(n, sum_dtype)
+            if vals.dtype.kind == "f":
+                valid = ~numpy.isnan(vals)
+                numpy.add.at(count, inv[valid], 1)
+                numpy.add.at(total, inv[valid], vals[valid])
+            else:
+                numpy.add.at(count, inv, 1)
+                numpy.add.at(total, inv, vals)
+            low, high = self.__extremes(vals, vals, inv, n)
+            parts.append((uniq, count, total, low, high))
+        if not parts:
+            rv = {"groupBy": numpy.empty(0, self.__mea.coldtypes[group])}
+            for f in functions:
+                rv[f] = numpy.empty(0)
+            return rv
+        ids, counts, sums, lows, highs = [numpy.concatenate(x)
+                                          for x in zip(*parts)]
+        uniq, inv = numpy.unique(ids, return_inverse=True)
+        n = len(uniq)
+        count = numpy.zeros(n, numpy.int64)
+        numpy.add.at(count, inv, counts)
+        total = numpy.zeros(n, sum_dtype)
+        numpy.add.at(total, inv, sums)
+        if "min" in functions or "max" in functions:
+            low, high = self.__extremes(lows, highs, inv, n)
+        rv = {"groupBy": uniq}
+        for f in functions:
+            if f == "count":
+                rv[f] = count
+            elif f == "sum":
+                rv[f] = total
+            elif f == "mean":
+                rv[f] = numpy.divide(total, count,
+                                     out=numpy.full(n, numpy.nan),
+                                     where=count > 0)
+            elif f == "min":
+                rv[f] = low
+            elif f == "max":
+                rv[f] = high
+        return rv
+
+    def _numpy_values(self, current):
+        """
+        Whether the "omero.tables.numpy_values" call context key asks for
+        numeric values and row numbers to be returned as numpy arrays.
+        """
+        try:
+            return current.ctx.get(
+                "omero.tables.numpy_values", "false"
+            ).lower() == "true"
+        except Exception:
+            return False
+
     def _as_data(self, cols, rowNumbers, current):
         """
         Constructs a omero.grid.Data object for returning to the client.
+        rowNumbers may be a range, which is only expanded if the row
+        numbers are to be included.
         """
         include_row_numbers = True
         try:
@@ -565,6 +1069,12 @@ class HdfStorage(object):
         data = omero.grid.Data()
         data.columns = cols
         if include_row_numbers:
+            if isinstance(rowNumbers, range):
+                if self._numpy_values(current):
+                    rowNumbers = numpy.arange(
+                        rowNumbers.start, rowNumbers.stop, dtype=numpy.int64)
+                else:
+                    rowNumbers = list(rowNumbers)
             data.rowNumbers = rowNumbers
         # Convert to millis since epoch
         data.lastModification = int(self._stamp * 1000)
@@ -583,19 +1093,42 @@ class HdfStorage(object):
     def read(self, stamp, colNumbers, start, stop, current):
         self.__initcheck()
         self.__sizecheck(colNumbers, None)
-        all_cols = self.cols(None, current)
-        cols = [all_cols[i] for i in colNumbers]
+        cols = self.cols(None, current, colNumbers)
 
+        if start is None:
+            start = 0
+        if stop is None:
+            stop = self.__length()
         for col in cols:
             col.read(self.__mea, start, stop)
-        if start is not None and stop is not None:
-            rowNumbers = list(range(start, stop))
-        elif start is not None and stop is None:
-            rowNumbers =  list(range(start, self.__length()))
-        elif start is None and stop is None:
-            rowNumbers = list(range(self.__length()))
 
-        return self._as_data(cols, rowNumbers, current)
+        return self._as_data(cols, range(start, stop), current)
+
+    @stamped
+    def iterread(self, stamp, colNumbers, start, stop, batch_size, current):
+        """
+        Iterator over the rows from start to stop as omero.grid.Data
+        objects of at most batch_size rows, so that a servant can stream
+        a large table without holding all of it in memory. Each batch is
+        a separate read(), which takes the lock and checks the stamp.
+        """
+        self.__initcheck()
+        self.__sizecheck(colNumbers, None)
+        if batch_size is None or batch_size < 1:
+            raise omero.ApiUsageException(
+                None, None, "Invalid batch size: %s" % batch_size)
+
+        if start is None:
+            start = 0
+        if stop is None:
+            stop = self.__length()
+        return self._iterread(
+            stamp, colNumbers, start, stop, batch_size, current)
+
+    def _iterread(self, stamp, colNumbers, start, stop, batch_size, current):
+        for offset in range(start, stop, batch_size):
+            yield self.read(stamp, colNumbers, offset,
+                            min(offset + batch_size, stop), current)
 
     @stamped
     def slice(self, stamp, colNumbers, rowNumbers, current):
@@ -604,15 +1137,17 @@ class HdfStorage(object):
         if colNumbers is None or len(colNumbers) == 0:
             colNumbers = list(range(self.__width()))
         if rowNumbers is None or len(rowNumbers) == 0:
-            rowNumbers = list(range(self.__length()))
-
-        self.__sizecheck(colNumbers, rowNumbers)
-        cols = self.cols(None, current)
-        rv = []
-        for i in colNumbers:
-            col = cols[i]
-            col.readCoordinates(self.__mea, rowNumbers)
-            rv.append(col)
+            # All rows: a contiguous read, no coordinate list needed
+            rowNumbers = range(self.__length())
+            self.__sizecheck(colNumbers, None)
+        else:
+            self.__sizecheck(colNumbers, rowNumbers)
+        rv = self.cols(None, current, colNumbers)
+        for col in rv:
+            if isinstance(rowNumbers, range):
+                col.read(self.__mea, rowNumbers.start, rowNumbers.stop)
+            else:
+                col.readCoordinates(self.__mea, rowNumbers)
         return self._as_data(rv, rowNumbers, current)
 
     #
@@ -625,6 +1160,16 @@ class HdfStorage(object):
     @locked
     def cleanup(self):
         self.logger.info("Cleaning storage: %s", self.__hdf_path)
+        self.logger.info("getWhereList cache: hits=%s misses=%s",
+                         self.__where_hits, self.__where_misses)
+        self._clear_where_cache()
+        if self.__mea is not None and self.__mea.indexed and \
+                self.__hdf_file.mode != "r":
+            self.__mea.flush_rows_to_index()
+            for name in self.__mea.colindexes:
+                col = getattr(self.__mea.cols, name)
+                if col.index.dirty or not col.index.is_csi:
+                    col.reindex()
         if self.__mea:
             self.__mea = None
         if self.__ome:
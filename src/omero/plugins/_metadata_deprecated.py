@@ -217,6 +217,9 @@ class MetadataControl(BaseControl):
         populateroi.add_argument(
             "--measurement", type=int, default=None,
             help="Index of the measurement to populate. By default, all")
+        populateroi.add_argument(
+            "--threads", type=int, default=1,
+            help="Number of threads saving ROI (default: 1)")
 
         pixelsize.add_argument(
             "--x", type=float, default=None, help="Physical pixel size X")
@@ -559,7 +562,8 @@ class MetadataControl(BaseControl):
             populate_roi.log.setLevel(logging.DEBUG)
         else:
             populate_roi.log.setLevel(logging.INFO)
-        factory = populate_roi.PlateAnalysisCtxFactory(client.sf)
+        factory = populate_roi.PlateAnalysisCtxFactory(
+            client.sf, args.threads)
         ctx = factory.get_analysis_ctx(md.get_id())
         count = ctx.get_measurement_count()
         if not count:
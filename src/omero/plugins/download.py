@@ -12,9 +12,12 @@
    defined here will be added to the Cli class for later use.
 """
 
+import hashlib
 import sys
+import time
 import omero
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from omero.cli import BaseControl, CLI, ProxyStringType
 from omero.gateway import BlitzGateway
 
@@ -36,8 +39,30 @@ Examples:
     omero download Image:5 output_dir
     # Download the OriginalFiles linked to Fileset 6 into a directory
     omero download Fileset:6 output_dir
+    # ... downloading 8 files at a time
+    omero download Fileset:6 output_dir --jobs 8
+
+Files which already exist locally are skipped if their size and checksum
+match the OriginalFile, and downloaded again otherwise.
 """
 
+HASHERS = {
+    "SHA1-160": hashlib.sha1,
+    "MD5-128": hashlib.md5,
+}
+
+
+class DownloadError(Exception):
+    """
+    Raised by DownloadControl.fetch_file so that failures in worker
+    threads can be passed to ctx.die from the main thread
+    """
+
+    def __init__(self, rc, msg):
+        super().__init__(msg)
+        self.rc = rc
+        self.msg = msg
+
 
 class StdOutHandle():
     """
@@ -61,6 +86,9 @@ class DownloadControl(BaseControl):
             "filename", help="Local filename (or path for Fileset) to be saved to. '-' for stdout")
         parser.add_argument(
             "--insert_fileset_folder", action="store_true", help="Adding 'Fileset_xxxx' folder in the download path")
+        parser.add_argument(
+            "--jobs", type=int, default=1,
+            help="Number of files of a Fileset to download concurrently")
         parser.set_defaults(func=self.__call__)
         parser.add_login_arguments()
 
@@ -72,62 +100,166 @@ class DownloadControl(BaseControl):
         conn = BlitzGateway(client_obj=client)
         conn.SERVICE_OPTS.setOmeroGroup(-1)
         insert_fileset_folder = args.insert_fileset_folder
+        jobs = max(args.jobs, 1)
 
         if dtype == "Fileset":
             fileset = self.get_object(conn, dtype, obj.id.val)
-            self.download_fileset(conn, fileset, args.filename, insert_fileset_folder)
+            self.download_fileset(conn, fileset, args.filename,
+                                  insert_fileset_folder, jobs)
         elif dtype == "Image":
             image = self.get_object(conn, dtype, obj.id.val)
             fileset = image.getFileset()
             if fileset is None:
                 self.ctx.die(602, 'Input image has no associated Fileset')
-            self.download_fileset(conn, fileset, args.filename, insert_fileset_folder)
+            self.download_fileset(conn, fileset, args.filename,
+                                  insert_fileset_folder, jobs)
         else:
             orig_file = self.get_file(client.sf, dtype, obj.id.val)
             target_file = str(args.filename)
             # only expect single file
             self.download_file(client, orig_file, target_file)
 
-    def download_fileset(self, conn, fileset, dir_path, insert_fileset_folder=False):
+    def download_fileset(self, conn, fileset, dir_path,
+                         insert_fileset_folder=False, jobs=1):
         self.ctx.out(f"Fileset: {fileset.id}")
         template_prefix = fileset.getTemplatePrefix()
         if insert_fileset_folder:
             dir_path = os.path.join(dir_path, f"Fileset_{fileset.id}")
+        targets = []
         for orig_file in fileset.listFiles():
             file_path = orig_file.path.replace(template_prefix, "")
             target_dir = os.path.join(dir_path, file_path)
             os.makedirs(target_dir, exist_ok=True)
             target_path = os.path.join(target_dir, orig_file.name)
-            self.download_file(conn.c, orig_file._obj, target_path)
+            targets.append((orig_file._obj, target_path))
+        hashers = self.get_hashers(conn, [f.id.val for f, _ in targets])
+
+        start = time.time()
+        error = None
+        sizes = []
+        total = 0
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            # Workers only collect their messages, which are printed
+            # here as each file completes so that they don't interleave
+            futures = {}
+            for orig_file, target_path in targets:
+                messages = []
+                future = executor.submit(
+                    self.fetch_file, conn.c, orig_file, target_path,
+                    hashers.get(orig_file.id.val), messages.append)
+                futures[future] = messages
+            try:
+                for future in as_completed(futures):
+                    for message in futures[future]:
+                        self.ctx.out(message)
+                    size = future.result()
+                    sizes.append(size)
+                    total += size or 0
+                    elapsed = max(time.time() - start, 1e-6)
+                    self.ctx.out(
+                        "[%s/%s] %s byte(s) downloaded in %.1fs "
+                        "(%.2f MB/s)" % (
+                            len(sizes), len(targets), total, elapsed,
+                            total / elapsed / 1000000))
+            except DownloadError as de:
+                error = de
+            finally:
+                # No-op for finished futures; on failure don't start
+                # the downloads which are still queued
+                for future in futures:
+                    future.cancel()
+        if error is not None:
+            self.ctx.die(error.rc, error.msg)
+        elapsed = max(time.time() - start, 1e-6)
+        downloaded = [size for size in sizes if size is not None]
+        self.ctx.out(
+            "Downloaded %s file(s), %s byte(s) in %.1fs (%.2f MB/s). "
+            "Skipped %s existing file(s)" % (
+                len(downloaded), total, elapsed, total / elapsed / 1000000,
+                len(sizes) - len(downloaded)))
+
+    def get_hashers(self, conn, file_ids):
+        """
+        Returns a dict of the checksum algorithm names of the OriginalFiles
+        with the given ids, loaded in a single query.
+        """
+        if not file_ids:
+            return {}
+        params = omero.sys.ParametersI()
+        params.addIds(file_ids)
+        rows = conn.getQueryService().projection(
+            "select f.id, h.value from OriginalFile f "
+            "left outer join f.hasher h where f.id in (:ids)",
+            params, conn.SERVICE_OPTS)
+        return dict((row[0].val, row[1] and row[1].val) for row in rows)
+
+    def is_downloaded(self, orig_file, target_file, hasher=None):
+        """
+        Returns True if target_file exists and matches the size and, if
+        the checksum algorithm is known, the hash of orig_file.
+        """
+        if not os.path.exists(target_file):
+            return False
+        size = orig_file.size and orig_file.size.val
+        if size is not None and os.path.getsize(target_file) != size:
+            return False
+        if orig_file.hash is None or hasher not in HASHERS:
+            return True
+        digest = HASHERS[hasher]()
+        with open(target_file, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest() == orig_file.hash.val
+
+    def download_file(self, client, orig_file, target_file, hasher=None):
+        """
+        Downloads orig_file to target_file, returning the number of bytes
+        downloaded or None if an identical local file was kept.
+        """
+        try:
+            return self.fetch_file(client, orig_file, target_file, hasher)
+        except DownloadError as de:
+            self.ctx.die(de.rc, de.msg)
 
-    def download_file(self, client, orig_file, target_file):
+    def fetch_file(self, client, orig_file, target_file, hasher=None,
+                   out=None):
+        """
+        As download_file but raises DownloadError rather than calling
+        ctx.die, and passes its messages to out (default: ctx.out), so
+        that it can be run in a worker thread.
+        """
+        if out is None:
+            out = self.ctx.out
         perms = orig_file.details.permissions
         name = omero.constants.permissions.BINARYACCESS
 
         if perms.isRestricted(name):
-            self.ctx.die(66, ("Download of OriginalFile:"
-                              "%s is restricted") % orig_file.id.val)
+            raise DownloadError(66, ("Download of OriginalFile:"
+                                     "%s is restricted") % orig_file.id.val)
 
         try:
             if target_file == "-":
                 client.download(orig_file, filehandle=StdOutHandle())
                 sys.stdout.flush()
+                return 0
             else:
-                self.ctx.out(
-                    f"Downloading file ID: {orig_file.id.val} to {target_file}")
+                out(f"Downloading file ID: {orig_file.id.val} to {target_file}")
+                if self.is_downloaded(orig_file, target_file, hasher):
+                    out(f"File exists! Skipping...")
+                    return None
                 if os.path.exists(target_file):
-                    self.ctx.out(f"File exists! Skipping...")
-                else:
-                    client.download(orig_file, target_file)
+                    out(f"File exists but does not match! Downloading...")
+                client.download(orig_file, target_file)
+                return os.path.getsize(target_file)
         except omero.ClientError as ce:
-            self.ctx.die(67, "ClientError: %s" % ce)
+            raise DownloadError(67, "ClientError: %s" % ce)
         except omero.ValidationException as ve:
             # Possible, though unlikely after previous check
-            self.ctx.die(67, "Unknown ValidationException: %s"
-                         % ve.message)
+            raise DownloadError(67, "Unknown ValidationException: %s"
+                                % ve.message)
         except omero.ResourceError as re:
             # ID exists in DB, but not on FS
-            self.ctx.die(67, "ResourceError: %s" % re.message)
+            raise DownloadError(67, "ResourceError: %s" % re.message)
 
     def get_object(self, conn, dtype, obj_id):
         result = conn.getObject(dtype, obj_id)
@@ -268,7 +268,7 @@ class TableI(omero.grid.Table, omero.util.SimpleServant):
     @perf
     def initialize(self, cols, current=None):
         self.assert_write()
-        self.storage.initialize(cols)
+        self.storage.initialize(cols, current=current)
         if cols:
             self.logger.info("Initialized %s with %s col(s)", self, slen(cols))
 
@@ -393,6 +393,8 @@ class TablesI(omero.grid.Tables, omero.util.Servant):
         if storage_factory is None:
             from omero.hdfstorageV2 import HDFLIST
             self._storage_factory = HDFLIST
+            # Sweeps idle read-only storages every resources check
+            self.resources.add(HDFLIST)
         else:
             self._storage_factory = storage_factory
         self.logger.info("Using storage factory: %s.%s",
@@ -443,6 +445,17 @@ class TablesI(omero.grid.Tables, omero.util.Servant):
         if exc:
             raise exc
 
+    def cleanup(self):
+        """
+        Cleans up the tables and then closes the storages which they
+        left idle
+        """
+        try:
+            omero.util.Servant.cleanup(self)
+        finally:
+            if hasattr(self._storage_factory, "evict_idle"):
+                self._storage_factory.evict_idle(force=True)
+
     def _get_dir(self):
         """
         Second step in initialization is to find the .omero/repository
@@ -85,6 +85,37 @@ def toNumpy(pixelType):
         return numpy.double
 
 
+def toNumpyPlane(rawPlane, pixelType, sizeY, sizeX):
+    """
+    Decodes the big-endian bytes returned by RawPixelsStore.getPlane() or
+    getTile() into a 2D numpy array in native byte order.
+
+    The bytes are viewed with numpy.frombuffer() rather than unpacked into
+    Python objects. If the buffer is writable (e.g. a bytearray) it is
+    byteswapped in place, otherwise a single native-order copy is made,
+    so that the returned array is always writable.
+
+    :param rawPlane The bytes of the plane or tile.
+    :param pixelType The OMERO pixels type, e.g. 'uint16'.
+    :param sizeY The height of the plane or tile.
+    :param sizeX The width of the plane or tile.
+    :return: A numpy array of shape (sizeY, sizeX).
+    """
+    import numpy
+    if isinstance(rawPlane, str):
+        rawPlane = rawPlane.encode("utf-8")
+    dtype = numpy.dtype('>' + toPython(pixelType))
+    native = dtype.newbyteorder('=')
+    plane = numpy.frombuffer(rawPlane, dtype=dtype, count=sizeY * sizeX)
+    if plane.flags.writeable:
+        if dtype != native:
+            plane.byteswap(inplace=True)
+        plane = plane.view(native)
+    else:
+        plane = plane.astype(native)
+    return plane.reshape(sizeY, sizeX)
+
+
 def toArray(pixelType):
     if(pixelType == INT_8):
         return 'b'
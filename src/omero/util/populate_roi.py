@@ -39,6 +39,7 @@ from omero.model import OriginalFileI, PlateI, PlateAnnotationLinkI, ImageI, \
     FileAnnotationI, RoiI, EllipseI, PointI
 from omero.grid import ImageColumn, WellColumn, RoiColumn, LongColumn, \
     DoubleColumn
+from omero.constants import MESSAGESIZEMAX
 
 from omero.sys import ParametersI
 from omero.util.temp_files import create_path
@@ -119,13 +120,33 @@ class ThreadPool(object):
 thread_pool = None
 
 
-def get_thread_pool():
+def get_thread_pool(num_threads=1):
+    """
+    Returns the global thread pool, creating it with num_threads workers
+    on first use. Its task queue holds at most num_threads batches, so
+    parsing blocks while all workers are busy.
+    """
     global thread_pool
     if thread_pool is None:
-        thread_pool = ThreadPool(1)
+        thread_pool = ThreadPool(num_threads)
     return thread_pool
 
 
+def estimate_roi_size(roi):
+    """
+    Rough upper bound of the marshalled size of an ROI in bytes, used to
+    keep saveAndReturnIds() batches below the Ice message limit.
+    """
+    size = 256
+    for shape in roi.copyShapes():
+        size += 512
+        for field in ("_points", "_bytes", "_textValue"):
+            value = unwrap(getattr(shape, field, None))
+            if value:
+                size += len(value)
+    return size
+
+
 class MeasurementError(Exception):
 
     """
@@ -181,9 +202,13 @@ class AbstractPlateAnalysisCtx(object):
 
     DEFAULT_ORIGINAL_FILE_PROVIDER = DownloadingOriginalFileProvider
 
+    # The number of worker threads saving ROI for the measurements
+    thread_count = 1
+
     def __init__(self, images, original_files, original_file_image_map,
                  plate_id, service_factory):
         super(AbstractPlateAnalysisCtx, self).__init__()
+        self.thread_pool = None
         self.images = images
         self.numcols, self.numrows = self.guess_geometry(self.images)
         self.original_files = original_files
@@ -194,6 +219,15 @@ class AbstractPlateAnalysisCtx(object):
         self.detail_files = dict()
         self.measurements = dict()
 
+    def get_thread_pool(self):
+        """
+        Returns the thread pool shared by the measurements of this plate,
+        creating it with thread_count workers on first use.
+        """
+        if self.thread_pool is None:
+            self.thread_pool = ThreadPool(self.thread_count)
+        return self.thread_pool
+
     def guess_geometry(self, images):
         max_col = 0
         max_row = 0
@@ -467,9 +501,10 @@ class PlateAnalysisCtxFactory(object):
     implementations = (FlexPlateAnalysisCtx, MIASPlateAnalysisCtx,
                        InCellPlateAnalysisCtx)
 
-    def __init__(self, service_factory):
+    def __init__(self, service_factory, thread_count=1):
         self.service_factory = service_factory
         self.query_service = self.service_factory.getQueryService()
+        self.thread_count = thread_count
 
     def find_images_for_plate(self, plate_id):
         """
@@ -559,9 +594,11 @@ class PlateAnalysisCtxFactory(object):
                     image, original_files, original_file_image_map)
         for klass in self.implementations:
             if klass.is_this_type(original_files):
-                return klass(images, original_files,
-                             original_file_image_map,
-                             plate_id, self.service_factory)
+                analysis_ctx = klass(images, original_files,
+                                     original_file_image_map,
+                                     plate_id, self.service_factory)
+                analysis_ctx.thread_count = self.thread_count
+                return analysis_ctx
         raise MeasurementError(
             "Unable to find suitable analysis context for plate: %d" %
             plate_id)
@@ -595,10 +632,14 @@ class AbstractMeasurementCtx(object):
     # The number of ROI to have parsed before streaming them to the server
     ROI_UPDATE_LIMIT = 1000
 
+    # Maximum estimated size of a batch of ROI, a quarter of the Ice
+    # message limit (MESSAGESIZEMAX is in KiB)
+    ROI_UPDATE_BYTES = MESSAGESIZEMAX * 1024 // 4
+
     def __init__(self, analysis_ctx, service_factory, original_file_provider,
                  original_file, result_files):
         super(AbstractMeasurementCtx, self).__init__()
-        self.thread_pool = get_thread_pool()
+        self.thread_pool = analysis_ctx.get_thread_pool()
         self.analysis_ctx = analysis_ctx
         self.service_factory = service_factory
         self.original_file_provider = original_file_provider
@@ -709,6 +750,40 @@ class AbstractMeasurementCtx(object):
                  (batch_no, int(time.time() * 1000) - t0))
         batches[batch_no] = roi_ids
 
+    def save_rois(self, rois):
+        """
+        Saves the ROI from the iterable rois on the thread pool, in
+        batches of at most ROI_UPDATE_LIMIT ROI and ROI_UPDATE_BYTES
+        estimated bytes, and returns the saved IDs in the order of rois.
+        """
+        batches = dict()
+        batch = list()
+        batch_bytes = 0
+        batch_no = 0
+        for roi in rois:
+            batch.append(roi)
+            batch_bytes += estimate_roi_size(roi)
+            if len(batch) >= self.ROI_UPDATE_LIMIT or \
+                    batch_bytes >= self.ROI_UPDATE_BYTES:
+                batch_no += 1
+                self.thread_pool.add_task(
+                    self.update_rois, batch, batches, batch_no)
+                batch = list()
+                batch_bytes = 0
+        if batch:
+            batch_no += 1
+            self.thread_pool.add_task(
+                self.update_rois, batch, batches, batch_no)
+        self.thread_pool.wait_completion()
+        missing = [k for k in range(1, batch_no + 1) if k not in batches]
+        if missing:
+            raise MeasurementError(
+                "Failed to save ROI batches: %s" % missing)
+        roi_ids = list()
+        for k in range(1, batch_no + 1):
+            roi_ids += batches[k]
+        return roi_ids
+
     def image_from_original_file(self, original_file):
         """Returns the image from which an original file has originated."""
         m = self.analysis_ctx.original_file_image_map
@@ -848,15 +923,16 @@ class MIASMeasurementCtx(AbstractMeasurementCtx):
         """Parses out ROI from OmeroTables columns for 'NEO' datasets."""
         log.debug("Parsing %s NEO ROIs..." % (len(columns[0].values)))
         image_ids = columns[self.IMAGE_COL].values
-        rois = list()
         # Save our file annotation to the database so we can use an unloaded
         # annotation for the saveAndReturnIds that will be triggered below.
         self.file_annotation = \
             self.update_service.saveAndReturnObject(self.file_annotation)
         unloaded_file_annotation = \
             FileAnnotationI(self.file_annotation.id.val, False)
-        batch_no = 1
-        batches = dict()
+        columns[self.ROI_COL].values += self.save_rois(self._neo_rois(
+            columns, image_ids, unloaded_file_annotation))
+
+    def _neo_rois(self, columns, image_ids, unloaded_file_annotation):
         for i, image_id in enumerate(image_ids):
             unloaded_image = ImageI(image_id, False)
             roi = RoiI()
@@ -874,32 +950,22 @@ class MIASMeasurementCtx(AbstractMeasurementCtx):
             roi.addShape(shape)
             roi.image = unloaded_image
             roi.linkAnnotation(unloaded_file_annotation)
-            rois.append(roi)
-            if len(rois) == self.ROI_UPDATE_LIMIT:
-                self.thread_pool.add_task(
-                    self.update_rois, rois, batches, batch_no)
-                rois = list()
-                batch_no += 1
-        self.thread_pool.add_task(self.update_rois, rois, batches, batch_no)
-        self.thread_pool.wait_completion()
-        batch_keys = list(batches.keys())
-        batch_keys.sort()
-        for k in batch_keys:
-            columns[self.ROI_COL].values += batches[k]
+            yield roi
 
     def _parse_mnu_roi(self, columns):
         """Parses out ROI from OmeroTables columns for 'MNU' datasets."""
         log.debug("Parsing %s MNU ROIs..." % (len(columns[0].values)))
         image_ids = columns[self.IMAGE_COL].values
-        rois = list()
         # Save our file annotation to the database so we can use an unloaded
         # annotation for the saveAndReturnIds that will be triggered below.
         self.file_annotation = \
             self.update_service.saveAndReturnObject(self.file_annotation)
         unloaded_file_annotation = \
             FileAnnotationI(self.file_annotation.id.val, False)
-        batch_no = 1
-        batches = dict()
+        columns[self.ROI_COL].values += self.save_rois(self._mnu_rois(
+            columns, image_ids, unloaded_file_annotation))
+
+    def _mnu_rois(self, columns, image_ids, unloaded_file_annotation):
         for i, image_id in enumerate(image_ids):
             unloaded_image = ImageI(image_id, False)
             roi = RoiI()
@@ -913,18 +979,7 @@ class MIASMeasurementCtx(AbstractMeasurementCtx):
             roi.addShape(shape)
             roi.image = unloaded_image
             roi.linkAnnotation(unloaded_file_annotation)
-            rois.append(roi)
-            if len(rois) == self.ROI_UPDATE_LIMIT:
-                self.thread_pool.add_task(
-                    self.update_rois, rois, batches, batch_no)
-                rois = list()
-                batch_no += 1
-        self.thread_pool.add_task(self.update_rois, rois, batches, batch_no)
-        self.thread_pool.wait_completion()
-        batch_keys = list(batches.keys())
-        batch_keys.sort()
-        for k in batch_keys:
-            columns[self.ROI_COL].values += batches[k]
+            yield roi
 
     def parse_and_populate_roi(self, columns):
         names = [column.name for column in columns]
@@ -1212,7 +1267,6 @@ class InCellMeasurementCtx(AbstractMeasurementCtx):
         for column in columns_as_list:
             columns[column.name] = column
         image_ids = columns['Image'].values
-        rois = list()
         # Save our file annotation to the database so we can use an unloaded
         # annotation for the saveAndReturnIds that will be triggered below.
         self.file_annotation = \
@@ -1220,47 +1274,35 @@ class InCellMeasurementCtx(AbstractMeasurementCtx):
         unloaded_file_annotation = \
             FileAnnotationI(self.file_annotation.id.val, False)
         # Parse and append ROI
-        batch_no = 1
-        batches = dict()
-        for i, image_id in enumerate(image_ids):
-            unloaded_image = ImageI(image_id, False)
-            if False in nuclei_expected:
-                # Cell centre of gravity
-                roi = RoiI()
-                shape = PointI()
-                shape.theZ = rint(0)
-                shape.theT = rint(0)
-                shape.x = rdouble(float(columns['Cell: cgX'].values[i]))
-                shape.y = rdouble(float(columns['Cell: cgY'].values[i]))
-                roi.addShape(shape)
-                roi.image = unloaded_image
-                roi.linkAnnotation(unloaded_file_annotation)
-                rois.append(roi)
-            elif False in cells_expected:
-                # Nucleus centre of gravity
-                roi = RoiI()
-                shape = PointI()
-                shape.theZ = rint(0)
-                shape.theT = rint(0)
-                shape.x = rdouble(float(columns['Nucleus: cgX'].values[i]))
-                shape.y = rdouble(float(columns['Nucleus: cgY'].values[i]))
-                roi.addShape(shape)
-                roi.image = unloaded_image
-                roi.linkAnnotation(unloaded_file_annotation)
-                rois.append(roi)
-            else:
-                raise MeasurementError('Not a nucleus or cell ROI')
-            if len(rois) == self.ROI_UPDATE_LIMIT:
-                self.thread_pool.add_task(
-                    self.update_rois, rois, batches, batch_no)
-                rois = list()
-                batch_no += 1
-        self.thread_pool.add_task(self.update_rois, rois, batches, batch_no)
-        self.thread_pool.wait_completion()
-        batch_keys = list(batches.keys())
-        batch_keys.sort()
-        for k in batch_keys:
-            columns['ROI'].values += batches[k]
+
+        def rois():
+            for i, image_id in enumerate(image_ids):
+                yield self._cg_roi(columns, i, image_id,
+                                   unloaded_file_annotation,
+                                   cells_expected, nuclei_expected)
+        columns['ROI'].values += self.save_rois(rois())
+
+    def _cg_roi(self, columns, i, image_id, unloaded_file_annotation,
+                cells_expected, nuclei_expected):
+        """Creates the cell or nucleus centre of gravity ROI of row i."""
+        if False in nuclei_expected:
+            # Cell centre of gravity
+            prefix = 'Cell'
+        elif False in cells_expected:
+            # Nucleus centre of gravity
+            prefix = 'Nucleus'
+        else:
+            raise MeasurementError('Not a nucleus or cell ROI')
+        roi = RoiI()
+        shape = PointI()
+        shape.theZ = rint(0)
+        shape.theT = rint(0)
+        shape.x = rdouble(float(columns['%s: cgX' % prefix].values[i]))
+        shape.y = rdouble(float(columns['%s: cgY' % prefix].values[i]))
+        roi.addShape(shape)
+        roi.image = ImageI(image_id, False)
+        roi.linkAnnotation(unloaded_file_annotation)
+        return roi
 
     def populate(self, columns):
         self.update_table(columns)
@@ -1321,8 +1363,7 @@ if __name__ == "__main__":
             service_factory = c.createSession(username, password)
 
         log.debug('Creating pool of %d threads' % thread_count)
-        thread_pool = ThreadPool(thread_count)
-        factory = PlateAnalysisCtxFactory(service_factory)
+        factory = PlateAnalysisCtxFactory(service_factory, thread_count)
         analysis_ctx = factory.get_analysis_ctx(plate_id)
         n_measurements = analysis_ctx.get_measurement_count()
         if measurement is not None and measurement >= n_measurements:
@@ -26,8 +26,7 @@ import logging
 import os
 import warnings
 
-from struct import unpack
-from numpy import add, array, asarray, frombuffer, reshape, zeros
+from numpy import add, asarray, frombuffer, reshape, zeros
 from os.path import exists
 
 import omero.clients
@@ -657,13 +656,8 @@ def download_plane(raw_pixels_store, pixels, z, c, t):
     size_x = pixels.getSizeX().getValue()
     size_y = pixels.getSizeY().getValue()
     pixel_type = pixels.getPixelsType().getValue().getValue()
-    convert_type = '>' + str(size_x * size_y) + \
-        pixelstypetopython.toPython(pixel_type)
-    converted_plane = unpack(convert_type, raw_plane)
-    numpy_type = pixelstypetopython.toNumpy(pixel_type)
-    remapped_plane = array(converted_plane, numpy_type)
-    remapped_plane.resize(size_y, size_x)
-    return remapped_plane
+    return pixelstypetopython.toNumpyPlane(
+        raw_plane, pixel_type, size_y, size_x)
 
 
 def getPlaneFromImage(imagePath, rgbIndex=None):
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2026 University of Dundee & Open Microscopy Environment.
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Batched reads from OMERO.tables
+
+A TableCursor pulls the rows of a Table in fixed size batches with the
+existing read() and slice() calls, so that neither the client, the
+tables servant nor any single Ice message ever holds more than one batch
+regardless of the size of the table.
+"""
+
+
+class TableCursor(object):
+    """
+    Iterates over omero.grid.Data batches of at most batch_size rows.
+
+    Rows are taken either from the range [start, stop) or, if rowNumbers
+    is given (e.g. the result of Table.getWhereList()), from that list in
+    order. Usage::
+
+        table = session.sharedResources().openTable(ofile)
+        rows = table.getWhereList("(Image == 12345)", {}, 0, 0, 1)
+        for data in TableCursor(table, [0, 2], rowNumbers=rows):
+            process(data.columns)
+    """
+
+    def __init__(self, table, colNumbers=None, start=0, stop=None,
+                 rowNumbers=None, batch_size=10000, ctx=None):
+        """
+        :param table:       an omero.grid.TablePrx
+        :param colNumbers:  indexes of the columns to read, default all
+        :param start:       first row to read
+        :param stop:        row after the last to read, default all rows
+        :param rowNumbers:  explicit rows to read instead of a range
+        :param batch_size:  maximum number of rows per batch
+        :param ctx:         optional Ice call context, e.g. with
+                            "omero.tables.numpy_values"
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive: %s" % batch_size)
+        self.table = table
+        self.colNumbers = colNumbers
+        self.start = start
+        self.stop = stop
+        self.rowNumbers = rowNumbers
+        self.batch_size = batch_size
+        self.ctx = ctx
+
+    def __len__(self):
+        """
+        Returns the number of rows the cursor will read.
+        """
+        if self.rowNumbers is not None:
+            return len(self.rowNumbers)
+        return max(0, self._stop() - self.start)
+
+    def _stop(self):
+        if self.stop is None:
+            self.stop = self.table.getNumberOfRows(self.ctx)
+        return self.stop
+
+    def _columns(self):
+        if self.colNumbers is None:
+            headers = self.table.getHeaders(self.ctx)
+            self.colNumbers = list(range(len(headers)))
+        return self.colNumbers
+
+    def __iter__(self):
+        colNumbers = self._columns()
+        if self.rowNumbers is not None:
+            rows = self.rowNumbers
+            for i in range(0, len(rows), self.batch_size):
+                yield self.table.slice(
+                    colNumbers, list(rows[i:i + self.batch_size]), self.ctx)
+        else:
+            stop = self._stop()
+            for i in range(self.start, stop, self.batch_size):
+                yield self.table.read(
+                    colNumbers, i, min(i + self.batch_size, stop), self.ctx)
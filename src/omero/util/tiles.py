@@ -4,6 +4,9 @@
 # Copyright 2011 Glencoe Software, Inc. All rights reserved.
 # Use is subject to license terms supplied in LICENSE.txt
 
+import numpy
+
+
 class TileLoopIteration(object):
     """
     "Interface" which must be passed to forEachTile
@@ -134,6 +137,94 @@ class RPSTileData(TileData):
         self.rps.close()
 
 
+class PlaneTileData(TileData):
+    """
+    TileData for a single plane of an already initialised RawPixelsStore.
+    The z, c and t passed by the loop are ignored in favour of the plane
+    given here, and the store is left open on close() so that the caller
+    can reuse it for further planes.
+    """
+    def __init__(self, rps, z, c, t, ctx=None):
+        self.rps = rps
+        self.z = z
+        self.c = c
+        self.t = t
+        self.ctx = ctx
+
+    def getTile(self, z, c, t, x, y, w, h):
+        return self.rps.getTile(self.z, self.c, self.t, x, y, w, h, self.ctx)
+
+    def setTile(self, buffer, z, c, t, x, y, w, h):
+        self.rps.setTile(
+            buffer, self.z, self.c, self.t, x, y, w, h, self.ctx)
+
+    def close(self):
+        pass
+
+
+class PlaneTileLoop(TileLoop):
+    """
+    Iterates over the tiles of a single plane of an already initialised
+    RawPixelsStore, e.g. to stream a large plane into a new image.
+    """
+
+    def __init__(self, rps, z, c, t, ctx=None):
+        self.rps = rps
+        self.z = z
+        self.c = c
+        self.t = t
+        self.ctx = ctx
+
+    def createData(self):
+        return PlaneTileData(self.rps, self.z, self.c, self.t, self.ctx)
+
+    def forEachTile(self, sizeX, sizeY, tileWidth, tileHeight, iteration):
+        """
+        Iterates over every tile of the plane.
+        :param sizeX: int
+        :param sizeY: int
+        :param tileWidth: <b>Maximum</b> width of the tile requested.
+        :param tileHeight: <b>Maximum</b> height of the tile requested.
+        :param iteration: Invoker to call for each tile.
+        :returns: The total number of tiles iterated over.
+        """
+        return TileLoop.forEachTile(
+            self, sizeX, sizeY, 1, 1, 1, tileWidth, tileHeight, iteration)
+
+
+class PlaneTileUpload(TileLoopIteration):
+    """
+    Uploads the tiles of one 2D plane, which may be any array-like object
+    supporting slicing, e.g. a numpy, dask or zarr array. Tracks the min
+    and max of the uploaded values.
+    """
+
+    def __init__(self, plane, convertToType=None):
+        """
+        :param plane: 2D array of shape (sizeY, sizeX)
+        :param convertToType: numpy type of the pixels, if not plane.dtype
+        """
+        self.plane = plane
+        self.convertToType = convertToType
+        self.minValue = None
+        self.maxValue = None
+
+    def run(self, data, z, c, t, x, y, tileWidth, tileHeight, tileCount):
+        tile = numpy.asarray(self.plane[y:y + tileHeight, x:x + tileWidth])
+        minValue = tile.min()
+        maxValue = tile.max()
+        if self.minValue is None:
+            self.minValue = minValue
+            self.maxValue = maxValue
+        else:
+            self.minValue = min(self.minValue, minValue)
+            self.maxValue = max(self.maxValue, maxValue)
+        dtype = numpy.dtype(self.convertToType or tile.dtype)
+        tile = tile.astype(dtype.newbyteorder('>'), copy=False)
+        data.setTile(numpy.ascontiguousarray(tile).view(numpy.uint8),
+                     z, c, t, x, y, tileWidth, tileHeight)
+
+
 class RPSTileLoop(TileLoop):
 
     def __init__(self, session, pixels):
@@ -19,9 +19,81 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
+import hashlib
+import threading
+import time
+
 import pytest
+import omero
+from omero.model import OriginalFileI, PermissionsI
 from omero.plugins.download import DownloadControl
 from omero.cli import CLI, NonZeroReturnCode
+from omero.rtypes import rlong, rstring
+
+
+def original_file(file_id, data=None, name=None):
+    orig_file = OriginalFileI(file_id, True)
+    orig_file.details.permissions = PermissionsI("rw----")
+    orig_file.name = rstring(name or "file%s" % file_id)
+    orig_file.path = rstring("prefix/")
+    if data is not None:
+        orig_file.size = rlong(len(data))
+        orig_file.hash = rstring(hashlib.sha1(data).hexdigest())
+    return orig_file
+
+
+class MockFileWrapper(object):
+
+    def __init__(self, orig_file):
+        self._obj = orig_file
+        self.path = orig_file.path.val
+        self.name = orig_file.name.val
+
+
+class MockFileset(object):
+
+    id = 1
+
+    def __init__(self, files):
+        self.files = files
+
+    def getTemplatePrefix(self):
+        return "prefix/"
+
+    def listFiles(self):
+        return [MockFileWrapper(f) for f in self.files]
+
+
+class MockDownloadClient(object):
+
+    def __init__(self, fail=()):
+        self.fail = fail
+        self.downloaded = []
+
+    def download(self, orig_file, target_file):
+        if orig_file.id.val in self.fail:
+            raise omero.ClientError("failed")
+        time.sleep(0.01)
+        self.downloaded.append(orig_file.id.val)
+        with open(target_file, "wb") as f:
+            f.write(b"data")
+
+
+class MockQueryConnection(object):
+
+    SERVICE_OPTS = None
+
+    def __init__(self, rows, client=None):
+        self.rows = rows
+        self.c = client
+        self.queries = []
+
+    def getQueryService(self):
+        return self
+
+    def projection(self, query, params, opts):
+        self.queries.append(params.map["ids"].val)
+        return self.rows
 
 
 class TestDownload(object):
@@ -42,3 +114,102 @@ class TestDownload(object):
         self.args += [bad_input, '-']
         with pytest.raises(NonZeroReturnCode):
             self.cli.invoke(self.args, strict=True)
+
+    def testJobsArgument(self):
+        args = self.cli.parser.parse_args(self.args + ["Fileset:1", "dir"])
+        assert args.jobs == 1
+        args = self.cli.parser.parse_args(
+            self.args + ["Fileset:1", "dir", "--jobs", "4"])
+        assert args.jobs == 4
+
+
+class TestDownloadControl(object):
+
+    def setup_method(self, method):
+        self.cli = CLI()
+        self.control = DownloadControl(ctx=self.cli)
+
+    def testGetHashers(self):
+        conn = MockQueryConnection([
+            [rlong(1), rstring("SHA1-160")], [rlong(2), None]])
+        hashers = self.control.get_hashers(conn, [1, 2])
+        assert hashers == {1: "SHA1-160", 2: None}
+        assert [[x.val for x in ids] for ids in conn.queries] == [[1, 2]]
+
+    def testGetHashersEmpty(self):
+        conn = MockQueryConnection([])
+        assert self.control.get_hashers(conn, []) == {}
+        assert conn.queries == []
+
+    @pytest.mark.parametrize('hasher', ["SHA1-160", None, "unknown"])
+    def testIsDownloaded(self, tmpdir, hasher):
+        target = tmpdir.join("target")
+        orig_file = original_file(1, b"data")
+        assert not self.control.is_downloaded(orig_file, str(target), hasher)
+        target.write_binary(b"data")
+        assert self.control.is_downloaded(orig_file, str(target), hasher)
+        # Same size, different contents
+        target.write_binary(b"diff")
+        assert self.control.is_downloaded(
+            orig_file, str(target), hasher) == (hasher != "SHA1-160")
+        target.write_binary(b"longer")
+        assert not self.control.is_downloaded(
+            orig_file, str(target), hasher)
+
+    @pytest.mark.parametrize('jobs', [1, 4])
+    def testDownloadFileset(self, tmpdir, jobs):
+        files = [original_file(i) for i in range(1, 9)]
+        client = MockDownloadClient()
+        conn = MockQueryConnection([], client)
+        self.control.download_fileset(
+            conn, MockFileset(files), str(tmpdir), jobs=jobs)
+        assert sorted(client.downloaded) == list(range(1, 9))
+        for i in range(1, 9):
+            assert tmpdir.join("file%s" % i).read_binary() == b"data"
+
+    def testDownloadFilesetOutput(self, tmpdir):
+        files = [original_file(i) for i in range(1, 9)]
+        client = MockDownloadClient()
+        conn = MockQueryConnection([], client)
+        lines = []
+        threads = set()
+
+        def record_out(text, newline=True):
+            threads.add(threading.current_thread())
+            lines.append(text)
+        self.cli.out = record_out
+        self.control.download_fileset(
+            conn, MockFileset(files), str(tmpdir), jobs=4)
+        assert threads == set([threading.main_thread()])
+        downloading = [line for line in lines
+                       if line.startswith("Downloading")]
+        progress = [line for line in lines if line.startswith("[")]
+        assert len(downloading) == 8
+        assert [line.split("]")[0] for line in progress] == [
+            "[%s/8" % i for i in range(1, 9)]
+        assert progress[-1].split("] ")[1].startswith("32 byte(s)")
+        # Each file's message comes right before its progress line
+        for i, line in enumerate(lines[1:-1]):
+            if line.startswith("Downloading"):
+                assert lines[i + 2].startswith("[")
+
+    @pytest.mark.parametrize('jobs', [1, 4])
+    def testDownloadFilesetFailure(self, tmpdir, jobs):
+        files = [original_file(i) for i in range(1, 51)]
+        client = MockDownloadClient(fail=(1,))
+        conn = MockQueryConnection([], client)
+        threads = []
+        die = self.cli.die
+
+        def record_die(rc, text, newline=True):
+            threads.append(threading.current_thread())
+            die(rc, text, newline)
+        self.cli.die = record_die
+
+        with pytest.raises(NonZeroReturnCode) as exc:
+            self.control.download_fileset(
+                conn, MockFileset(files), str(tmpdir), jobs=jobs)
+        assert exc.value.rv == 67
+        assert threads == [threading.main_thread()]
+        # Downloads still queued when the first one failed are cancelled
+        assert len(client.downloaded) < 49
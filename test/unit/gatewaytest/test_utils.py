@@ -12,6 +12,8 @@
 from omero.gateway.utils import ServiceOptsDict
 from omero.gateway.utils import toBoolean
 from omero.gateway.utils import propertiesToDict
+from omero.gateway.utils import ObjectCache
+import time
 import pytest
 
 
@@ -225,6 +227,45 @@ class TestServiceOptsDict (object):
         assert d.get("omero.share") == d.getOmeroShare()
 
 
+class TestObjectCache (object):
+
+    def test_lru(self):
+        cache = ObjectCache(max_size=2)
+        cache.set(('experimenter', 1), 'a')
+        cache.set(('experimenter', 2), 'b')
+        assert cache.get(('experimenter', 1)) == 'a'
+        cache.set(('experimenter', 3), 'c')
+        assert cache.get(('experimenter', 2)) is None
+        assert cache.get(('experimenter', 1)) == 'a'
+        assert cache.get(('experimenter', 3)) == 'c'
+        assert cache.stats() == {
+            'hits': 3, 'misses': 1, 'evictions': 1, 'expirations': 0,
+            'invalidations': 0, 'size': 2}
+
+    def test_ttl(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+        cache = ObjectCache(ttl=10)
+        cache.set(('enumeration', 'PixelsType'), 'a')
+        now[0] += 9
+        assert cache.get(('enumeration', 'PixelsType')) == 'a'
+        now[0] += 1
+        assert cache.get(('enumeration', 'PixelsType')) is None
+        assert cache.stats()['expirations'] == 1
+        assert len(cache) == 0
+
+    def test_invalidate(self):
+        cache = ObjectCache()
+        cache.set(('experimenter', 1), 'a')
+        cache.set(('experimentergroup', 1), 'b')
+        cache.invalidate('Experimenter')
+        assert cache.get(('experimenter', 1)) is None
+        assert cache.get(('experimentergroup', 1)) == 'b'
+        cache.clear()
+        assert len(cache) == 0
+        assert cache.stats()['invalidations'] == 2
+
+
 class TestHelpers (object):
 
     @pytest.mark.parametrize('true_val',
@@ -9,7 +9,9 @@
 
 """
 
+import os
 import time
+import numpy
 import pytest
 import omero.columns
 import logging
@@ -441,6 +443,391 @@ class TestHdfStorage(TestCase):
         assert data.rowNumbers == [1, 2]
         hdf.cleanup()
 
+    def testIterRead(self):
+        hdf = HdfStorage(self.hdfpath(), self.lock)
+        cols = [
+            omero.columns.LongColumnI('a'),
+            omero.columns.LongColumnI('b')]
+        hdf.initialize(cols)
+        cols[0].values = list(range(7))
+        cols[1].values = list(range(10, 17))
+        hdf.append(cols)
+
+        batches = hdf.iterread(hdf._stamp, [1], None, None, 3, self.current)
+        batches = [(d.rowNumbers, d.columns[0].values) for d in batches]
+        assert batches == [
+            ([0, 1, 2], [10, 11, 12]),
+            ([3, 4, 5], [13, 14, 15]),
+            ([6], [16])]
+
+        batches = list(hdf.iterread(
+            hdf._stamp, [0, 1], 2, 6, 10, self.current))
+        assert len(batches) == 1
+        assert batches[0].columns[0].values == [2, 3, 4, 5]
+        assert batches[0].columns[1].values == [12, 13, 14, 15]
+
+        assert list(hdf.iterread(
+            hdf._stamp, [0], 4, 4, 2, self.current)) == []
+        pytest.raises(omero.ApiUsageException, hdf.iterread,
+                      hdf._stamp, [0], None, None, 0, self.current)
+        pytest.raises(omero.ApiUsageException, hdf.iterread,
+                      hdf._stamp, [2], None, None, 2, self.current)
+
+        # A modification between batches stops the iteration
+        batches = hdf.iterread(hdf._stamp, [0], None, None, 3, self.current)
+        next(batches)
+        hdf._stamp = time.time() + 1
+        pytest.raises(omero.OptimisticLockException, next, batches)
+        hdf.cleanup()
+
+    def testAppendArrayColumns(self):
+        hdf = HdfStorage(self.hdfpath(), self.lock)
+        cols = [
+            omero.columns.LongColumnI('a'),
+            omero.columns.DoubleArrayColumnI('b', '', 1),
+            omero.columns.LongArrayColumnI('c', '', 3),
+            omero.columns.StringColumnI('d', '', 4)]
+        hdf.initialize(cols)
+        cols = hdf.cols(None, self.current)
+        cols[0].values = [1, 2]
+        cols[1].values = [[0.5], [1.5]]
+        cols[2].values = [[1, 2, 3], [4, 5, 6]]
+        cols[3].values = ["ab", "cdef"]
+        hdf.append(cols)
+
+        data = hdf.read(hdf._stamp, [0, 1, 2, 3], 0, 2, self.current)
+        assert data.columns[0].values == [1, 2]
+        assert data.columns[1].values == [[0.5], [1.5]]
+        assert data.columns[2].values == [[1, 2, 3], [4, 5, 6]]
+        assert data.columns[3].values == ["ab", "cdef"]
+        hdf.cleanup()
+
+    def testWhereListCache(self):
+        hdf = HdfStorage(self.hdfpath(), self.lock)
+        self.init(hdf, True)
+        self.append(hdf, {"a": 1, "b": 2, "c": 3})
+        self.append(hdf, {"a": 5, "b": 6, "c": 7})
+        rows = hdf.getWhereList(time.time(), '(a==x)', {"x": 1}, None,
+                                None, None, None)
+        assert rows == [0]
+        hits = hdf._HdfStorage__where_hits
+        again = hdf.getWhereList(time.time(), '(a==x)', {"x": 1}, None,
+                                 None, None, None)
+        assert hdf._HdfStorage__where_hits == hits + 1
+        # Callers get their own copy
+        assert again == rows
+        assert again is not rows
+        again.append(5)
+        assert hdf.getWhereList(time.time(), '(a==x)', {"x": 1}, None,
+                                None, None, None) == [0]
+        other = hdf.getWhereList(time.time(), '(a==x)', {"x": 5}, None,
+                                 None, None, None)
+        assert other == [1]
+
+        # Modifications invalidate the cache
+        self.append(hdf, {"a": 1, "b": 8, "c": 9})
+        rows = hdf.getWhereList(time.time(), '(a==x)', {"x": 1}, None,
+                                None, None, None)
+        assert rows == [0, 2]
+
+        # Bounded by entries and total bytes
+        hdf.WHERE_CACHE_SIZE = 1
+        hdf.getWhereList(time.time(), '(a>0)', None, None, None, None, None)
+        assert len(hdf._HdfStorage__where_cache) == 1
+        hdf.WHERE_CACHE_BYTES = 16
+        big = hdf.getWhereList(time.time(), '(b>0)', None, None, None,
+                               None, None)
+        assert big == [0, 1, 2]
+        # Too big to be cached
+        assert [k[0] for k in hdf._HdfStorage__where_cache] == ['(a>0)']
+        assert hdf._HdfStorage__where_cache_bytes == 24
+        hdf.cleanup()
+
+    def testCompression(self):
+        hdf = HdfStorage(self.hdfpath(), self.lock)
+        hdf.initialize(self.cols(), {
+            "omero_tables_compression": "blosc:lz4",
+            "omero_tables_compression_level": 3,
+            "omero_tables_expectedrows": 1000000})
+        for i in range(5):
+            self.append(hdf, {"a": i, "b": i, "c": i})
+        filters = hdf._HdfStorage__mea.filters
+        assert filters.complib == "blosc:lz4"
+        assert filters.complevel == 3
+        assert filters.shuffle
+        data = hdf.read(hdf._stamp, [0], 0, 5, self.current)
+        assert data.columns[0].values == [0, 1, 2, 3, 4]
+        hdf.cleanup()
+
+    def testCompressionFromContext(self):
+        hdf = HdfStorage(self.hdfpath(), self.lock)
+        self.current.ctx = {"omero.tables.compression": "zlib",
+                            "omero.tables.shuffle": "false"}
+        hdf.initialize(self.cols(), None, self.current)
+        filters = hdf._HdfStorage__mea.filters
+        assert filters.complib == "zlib"
+        assert filters.complevel == storage_module.DEFAULT_COMPRESSION_LEVEL
+        assert not filters.shuffle
+        hdf.cleanup()
+
+        hdf = HdfStorage(self.hdfpath() + "2", self.lock)
+        self.current.ctx = {"omero.tables.compression": "unknown"}
+        with pytest.raises(omero.ApiUsageException):
+            hdf.initialize(self.cols(), None, self.current)
+        hdf.cleanup()
+
+    def testAggregate(self):
+        hdf = HdfStorage(self.hdfpath(), self.lock)
+        hdf.AGGREGATE_CHUNK = 4
+        cols = [
+            omero.columns.WellColumnI('well'),
+            omero.columns.DoubleColumnI('area'),
+            omero.columns.StringColumnI('name', '', 4)]
+        hdf.initialize(cols)
+        cols = hdf.cols(None, self.current)
+        cols[0].values = [3, 1, 3, 2, 1, 3, 1, 2, 3, 3]
+        cols[1].values = [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]
+        cols[2].values = ["x"] * 10
+        hdf.append(cols)
+
+        rv = hdf.aggregate(hdf._stamp, 1,
+                           ["count", "sum", "mean", "min", "max", "histogram"])
+        assert rv["count"] == 10
+        assert rv["sum"] == 55.0
+        assert rv["mean"] == 5.5
+        assert rv["min"] == 1.0
+        assert rv["max"] == 10.0
+        counts, edges = rv["histogram"]
+        assert counts.tolist() == [1] * 10
+        assert edges[0] == 1.0 and edges[-1] == 10.0
+
+        rv = hdf.aggregate(hdf._stamp, 1, ["count", "mean", "min", "max"],
+                           groupBy=0)
+        assert rv["groupBy"].tolist() == [1, 2, 3]
+        assert rv["count"].tolist() == [3, 2, 5]
+        assert rv["mean"].tolist() == [14.0 / 3, 6.0, 29.0 / 5]
+        assert rv["min"].tolist() == [2.0, 4.0, 1.0]
+        assert rv["max"].tolist() == [7.0, 8.0, 10.0]
+
+        rv = hdf.aggregate(hdf._stamp, 1, ["sum"], groupBy=0, start=8)
+        assert rv["groupBy"].tolist() == [3]
+        assert rv["sum"].tolist() == [19.0]
+
+        with pytest.raises(omero.ApiUsageException):
+            hdf.aggregate(hdf._stamp, 2, ["sum"])
+        with pytest.raises(omero.ApiUsageException):
+            hdf.aggregate(hdf._stamp, 0, ["sum"], groupBy=1)
+        with pytest.raises(omero.ApiUsageException):
+            hdf.aggregate(hdf._stamp, 1, ["median"])
+        hdf.cleanup()
+
+    def testAggregateNaN(self, recwarn):
+        hdf = HdfStorage(self.hdfpath(), self.lock)
+        hdf.AGGREGATE_CHUNK = 3
+        cols = [
+            omero.columns.WellColumnI('well'),
+            omero.columns.DoubleColumnI('area')]
+        hdf.initialize(cols)
+        cols = hdf.cols(None, self.current)
+        nan = float("nan")
+        cols[0].values = [1, 2, 1, 2, 3, 1, 3]
+        cols[1].values = [1.0, nan, 3.0, 4.0, nan, nan, nan]
+        hdf.append(cols)
+
+        rv = hdf.aggregate(hdf._stamp, 1,
+                           ["count", "sum", "mean", "min", "max", "histogram"],
+                           bins=3)
+        assert rv["count"] == 3
+        assert rv["sum"] == 8.0
+        assert rv["mean"] == 8.0 / 3
+        assert rv["min"] == 1.0
+        assert rv["max"] == 4.0
+        counts, edges = rv["histogram"]
+        assert counts.tolist() == [1, 0, 2]
+        assert edges.tolist() == [1.0, 2.0, 3.0, 4.0]
+
+        rv = hdf.aggregate(hdf._stamp, 1,
+                           ["count", "sum", "mean", "min", "max"], groupBy=0)
+        assert rv["groupBy"].tolist() == [1, 2, 3]
+        assert rv["count"].tolist() == [2, 1, 0]
+        assert rv["sum"].tolist() == [4.0, 4.0, 0.0]
+        assert rv["mean"][:2].tolist() == [2.0, 4.0]
+        assert rv["min"][:2].tolist() == [1.0, 4.0]
+        assert rv["max"][:2].tolist() == [3.0, 4.0]
+        for f in ("mean", "min", "max"):
+            assert numpy.isnan(rv[f][2])
+
+        # Only finite values are binned
+        cols[0].values = [1, 1]
+        cols[1].values = [float("inf"), 2.5]
+        hdf.append(cols)
+        rv = hdf.aggregate(hdf._stamp, 1, ["min", "max", "histogram"],
+                           bins=3)
+        assert rv["min"] == 1.0
+        assert rv["max"] == float("inf")
+        counts, edges = rv["histogram"]
+        assert counts.tolist() == [1, 1, 2]
+        assert edges.tolist() == [1.0, 2.0, 3.0, 4.0]
+        assert [str(w.message) for w in recwarn
+                if w.category is RuntimeWarning] == []
+        hdf.cleanup()
+
+    def testAggregateBoolAndLong(self):
+        hdf = HdfStorage(self.hdfpath(), self.lock)
+        hdf.AGGREGATE_CHUNK = 2
+        cols = [
+            omero.columns.ImageColumnI('image'),
+            omero.columns.BoolColumnI('flag'),
+            omero.columns.LongColumnI('big')]
+        hdf.initialize(cols)
+        cols = hdf.cols(None, self.current)
+        big = 2 ** 60
+        cols[0].values = [1, 2, 1, 1, 2]
+        cols[1].values = [True, False, True, False, True]
+        cols[2].values = [big, 1, 1, big, 2]
+        hdf.append(cols)
+
+        rv = hdf.aggregate(hdf._stamp, 1,
+                           ["count", "sum", "mean", "min", "max", "histogram"],
+                           bins=2)
+        assert rv["count"] == 5
+        assert rv["sum"] == 3
+        assert rv["mean"] == 0.6
+        assert not rv["min"]
+        assert rv["max"]
+        counts, edges = rv["histogram"]
+        assert counts.tolist() == [2, 3]
+        assert edges.tolist() == [0.0, 0.5, 1.0]
+
+        rv = hdf.aggregate(hdf._stamp, 1, ["sum", "min", "max"], groupBy=0)
+        assert rv["sum"].dtype.kind == "i"
+        assert rv["sum"].tolist() == [2, 1]
+        assert rv["min"].tolist() == [False, False]
+        assert rv["max"].tolist() == [True, True]
+
+        # Integer sums are exact
+        rv = hdf.aggregate(hdf._stamp, 2, ["sum"])
+        assert rv["sum"] == 2 * big + 4
+        rv = hdf.aggregate(hdf._stamp, 2, ["sum", "mean"], groupBy=0)
+        assert rv["sum"].dtype == numpy.int64
+        assert rv["sum"].tolist() == [2 * big + 1, 3]
+        assert rv["mean"].tolist() == [(2 * big + 1) / 3, 1.5]
+        hdf.cleanup()
+
+    def testColsSubset(self):
+        hdf = HdfStorage(self.hdfpath(), self.lock)
+        self.init(hdf, False)
+        self.append(hdf, {"a": 1, "b": 2, "c": 3})
+        cols = hdf.cols(None, self.current, [2, 0])
+        assert [c.name for c in cols] == ["c", "a"]
+        schema = hdf._HdfStorage__schema_cache
+        assert [x[1] for x in schema] == ["a", "b", "c"]
+        data = hdf.slice(hdf._stamp, [1], [0], self.current)
+        assert hdf._HdfStorage__schema_cache is schema
+        assert [c.name for c in data.columns] == ["b"]
+        assert data.columns[0].values == [2]
+        hdf.cleanup()
+
+    def testIndexes(self):
+        p = self.hdfpath()
+        hdf = HdfStorage(p, self.lock)
+        hdf.initialize(self.cols(), {storage_module.INDEX_KEY: "a"})
+        for i in range(20):
+            self.append(hdf, {"a": i % 5, "b": i, "c": 0})
+        mea = hdf._HdfStorage__mea
+        assert mea.cols.a.is_indexed
+        assert not mea.cols.b.is_indexed
+        rows = hdf.getWhereList(time.time(), '(a==3)', None, None,
+                                None, None, None)
+        assert rows == [3, 8, 13, 18]
+
+        hdf.add_meta_map({storage_module.INDEX_KEY: rstring("a, b")})
+        assert mea.cols.b.is_indexed
+        data = hdf.readCoordinates(hdf._stamp, [3, 19], self.current)
+        data.columns[0].values = [0, 3]
+        hdf.update(hdf._stamp, data)
+        rows = hdf.getWhereList(time.time(), '(a==3)', None, None,
+                                None, None, None)
+        assert rows == [8, 13, 18, 19]
+
+        with pytest.raises(omero.ApiUsageException):
+            hdf.add_indexes(["missing"])
+        hdf.cleanup()
+
+        hdf = HdfStorage(p, self.lock)
+        mea = hdf._HdfStorage__mea
+        assert mea.cols.a.index.is_csi
+        assert not mea.cols.a.index.dirty
+        rows = hdf.getWhereList(time.time(), '(b>17)', None, None,
+                                None, None, None)
+        assert rows == [18, 19]
+        hdf.cleanup()
+
+    @pytest.mark.parametrize("max_runs", [0, 16])
+    def testUpdateRuns(self, max_runs):
+        hdf = HdfStorage(self.hdfpath(), self.lock)
+        hdf.UPDATE_MAX_RUNS = max_runs
+        cols = [
+            omero.columns.LongColumnI('a'),
+            omero.columns.LongArrayColumnI('b', '', 2),
+            omero.columns.StringColumnI('c', '', 4)]
+        hdf.initialize(cols)
+        cols = hdf.cols(None, self.current)
+        cols[0].values = list(range(10))
+        cols[1].values = [[i, -i] for i in range(10)]
+        cols[2].values = ["r%d" % i for i in range(10)]
+        hdf.append(cols)
+
+        # Unsorted, with a duplicate (last wins) and two runs
+        data = hdf.readCoordinates(hdf._stamp, [7, 2, 3, 8, 2], self.current)
+        data.columns[0].values = [70, 20, 30, 80, 21]
+        data.columns[1].values = [[7, 7], [2, 2], [3, 3], [8, 8], [1, 1]]
+        data.columns[2].values = ["x7", "x2", "x3", "x8", "y2"]
+        hdf.update(hdf._stamp, data)
+
+        data = hdf.read(hdf._stamp, [0, 1, 2], 0, 10, self.current)
+        assert data.columns[0].values == [
+            0, 1, 21, 30, 4, 5, 6, 70, 80, 9]
+        assert data.columns[1].values[1:4] == [[1, -1], [1, 1], [3, 3]]
+        assert data.columns[2].values[6:9] == ["r6", "x7", "x8"]
+
+        data = hdf.readCoordinates(hdf._stamp, [0], self.current)
+        data.columns[2].values = ["toolong"]
+        with pytest.raises(omero.ValidationException):
+            hdf.update(hdf._stamp, data)
+        hdf.cleanup()
+
+    def testReadNumpyValues(self):
+        hdf = HdfStorage(self.hdfpath(), self.lock)
+        cols = [
+            omero.columns.LongColumnI('a'),
+            omero.columns.DoubleColumnI('b'),
+            omero.columns.StringColumnI('c', '', 4)]
+        hdf.initialize(cols)
+        cols = hdf.cols(None, self.current)
+        cols[0].values = [1, 2, 3]
+        cols[1].values = [0.5, 1.5, 2.5]
+        cols[2].values = ["x", "y", "z"]
+        hdf.append(cols)
+
+        self.current.ctx = {"omero.tables.numpy_values": "true"}
+        data = hdf.read(hdf._stamp, [0, 1, 2], 0, 3, self.current)
+        assert isinstance(data.columns[0].values, numpy.ndarray)
+        assert isinstance(data.columns[1].values, numpy.ndarray)
+        assert data.columns[2].values == ["x", "y", "z"]
+        assert data.columns[0].values.tolist() == [1, 2, 3]
+        assert data.columns[1].values.tolist() == [0.5, 1.5, 2.5]
+        hdf.cleanup()
+
+    @pytest.mark.parametrize('dtype', ['>i8', '<i4', '>f8', '<f4'])
+    def testNumpyValuesOtherDtype(self, dtype):
+        # Only native int64/float64/bool can be marshalled from the buffer
+        col = omero.columns.LongColumnI('a')
+        col.numpy_values = True
+        col.fromrows(numpy.array([1, 2, 3], dtype=dtype), field_only=True)
+        assert col.values == [1, 2, 3]
+        assert not isinstance(col.values, numpy.ndarray)
+
     #
     # ROIs
     #
@@ -467,7 +854,7 @@ class TestHdfStorage(TestCase):
         assert 5 == data.columns[0].y[0]
         assert 6 == data.columns[0].w[0]
         assert 7 == data.columns[0].h[0]
-        assert [0] == data.columns[0].bytes[0]
+        assert b"\x00" == data.columns[0].bytes[0]
 
         assert 2 == data.columns[0].imageId[1]
         assert 2 == data.columns[0].theZ[1]
@@ -476,7 +863,7 @@ class TestHdfStorage(TestCase):
         assert 5 == data.columns[0].y[1]
         assert 6 == data.columns[0].w[1]
         assert 7 == data.columns[0].h[1]
-        assert [0, 1, 2, 3, 4] == data.columns[0].bytes[1]
+        assert bytes([0, 1, 2, 3, 4]) == data.columns[0].bytes[1]
 
         data = hdf.read(hdf._stamp, [0], 0, 1, self.current)
         assert len(data.columns) == 1
@@ -488,7 +875,13 @@ class TestHdfStorage(TestCase):
         assert 5 == data.columns[0].y[0]
         assert 6 == data.columns[0].w[0]
         assert 7 == data.columns[0].h[0]
-        assert [0] == data.columns[0].bytes[0]
+        assert b"\x00" == data.columns[0].bytes[0]
+
+        mask.bytes = [b"\x05\x06", b"\x07"]
+        hdf.append([mask])
+        data = hdf.readCoordinates(hdf._stamp, [3, 0, 3, 2], self.current)
+        assert data.columns[0].bytes == [
+            b"\x07", b"\x00", b"\x07", b"\x05\x06"]
         hdf.cleanup()
 
 
@@ -523,3 +916,97 @@ class TestHdfList(TestCase):
         monkeypatch.undo()
 
         hdf1.cleanup()
+
+    def testIdleReadOnlyStorage(self, monkeypatch):
+        hdflist = storage_module.HDFLIST
+        tmp = str(self.hdfpath())
+        hdf = HdfStorage(tmp, threading.RLock())
+        hdf.initialize([omero.columns.LongColumnI('a')])
+        hdf.cleanup()
+
+        s1 = hdflist.getOrCreate(tmp, "t1", read_only=True)
+        s2 = hdflist.getOrCreate(tmp, "t2", read_only=True)
+        assert s1 is s2
+        assert s1.is_read_only()
+        with pytest.raises(omero.LockTimeout):
+            hdflist.getOrCreate(tmp, "w", read_only=False)
+
+        s1.getWhereList(s1._stamp, '(a>0)', None, None, None, None, None)
+        assert len(s1._HdfStorage__where_cache) == 1
+
+        # Kept open once the last reader is gone, without cached results
+        s1.decr("t1")
+        s1.decr("t2")
+        assert len(s1._HdfStorage__where_cache) == 0
+        assert s1.rows() == 0
+        s3 = hdflist.getOrCreate(tmp, "t3", read_only=True)
+        assert s3 is s1
+        s3.decr("t3")
+
+        # Expired
+        monkeypatch.setattr(hdflist, "idle_ttl", -1)
+        hdflist.evict_idle()
+        with pytest.raises(AttributeError):
+            s1.rows()
+        monkeypatch.undo()
+
+        # A writer reopens an idle read-only storage
+        s4 = hdflist.getOrCreate(tmp, "t4", read_only=True)
+        s4.decr("t4")
+        s5 = hdflist.getOrCreate(tmp, "w", read_only=False)
+        assert s5 is not s4
+        assert not s5.is_read_only()
+        s5.decr("w")
+
+    def testReadOnlyFile(self, monkeypatch):
+        hdflist = storage_module.HDFLIST
+        tmp = str(self.hdfpath())
+        hdf = HdfStorage(tmp, threading.RLock())
+        hdf.initialize([omero.columns.LongColumnI('a')])
+        hdf.cleanup()
+        # As root, os.access() ignores the file mode
+        os.chmod(tmp, 0o444)
+        monkeypatch.setattr(
+            path, "access", lambda self, mode: mode != os.W_OK)
+
+        # Writers share the storage rather than waiting for the readers
+        s1 = hdflist.getOrCreate(tmp, "t1", read_only=True)
+        s2 = hdflist.getOrCreate(tmp, "w", read_only=False)
+        assert s2 is s1
+        assert s2.is_read_only()
+        s1.decr("t1")
+        s2.decr("w")
+
+        # Also once idle, since the file would be reopened read-only
+        s3 = hdflist.getOrCreate(tmp, "w", read_only=False)
+        assert s3 is s1
+        assert s3.is_read_only()
+        s3.decr("w")
+        hdflist.evict_idle(force=True)
+
+    def testIdleSweep(self, monkeypatch):
+        hdflist = HdfList()
+        monkeypatch.setattr(storage_module, 'HDFLIST', hdflist)
+        tmp = str(self.hdfpath())
+        hdf = HdfStorage(tmp, threading.RLock())
+        hdf.initialize([omero.columns.LongColumnI('a')])
+        hdf.cleanup()
+
+        # Periodic check without any other table being opened
+        s1 = hdflist.getOrCreate(tmp, "t1", read_only=True)
+        s1.decr("t1")
+        assert hdflist.check()
+        assert s1.rows() == 0
+        hdflist.idle_ttl = -1
+        assert hdflist.check()
+        with pytest.raises(AttributeError):
+            s1.rows()
+
+        # Shutdown closes storages which have not expired yet
+        hdflist.idle_ttl = 60
+        s2 = hdflist.getOrCreate(tmp, "t2", read_only=True)
+        s2.decr("t2")
+        assert s2.rows() == 0
+        hdflist.cleanup()
+        with pytest.raises(AttributeError):
+            s2.rows()
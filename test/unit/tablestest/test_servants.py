@@ -304,6 +304,25 @@ class TestTables(TestCase):
         self.sf.return_values.append(omero.model.OriginalFileI(1, False))
         self.tablesI()
 
+    def testTablesICleanupEvictsIdle(self):
+        self.repofile(self.sf.db_uuid)
+        self.sf.return_values.append(omero.model.OriginalFileI(1, False))
+        storage_factory = mock_storage_factory()
+        evicted = []
+        storage_factory.evict_idle = lambda force=False: evicted.append(force)
+        tables = omero.tables.TablesI(
+            self.ctx, mock_table(), mock_internal_repo(self.tmp),
+            storage_factory=storage_factory)
+        tables.cleanup()
+        assert evicted == [True]
+
+    def testTablesISweepsHdfList(self):
+        from omero.hdfstorageV2 import HDFLIST
+        self.repofile(self.sf.db_uuid)
+        self.sf.return_values.append(omero.model.OriginalFileI(1, False))
+        tables = self.tablesI()
+        assert HDFLIST in [m[0] for m in tables.resources.stuff]
+
     def testTables(self):
         table = self.new_table()
         assert table
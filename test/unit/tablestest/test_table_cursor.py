@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+   Test of the client-side batched iteration over OMERO.tables.
+
+   Copyright 2026 Glencoe Software, Inc. All rights reserved.
+   Use is subject to license terms supplied in LICENSE.txt
+
+"""
+
+import pytest
+
+from omero.util.table_cursor import TableCursor
+
+
+class MockTablePrx(object):
+
+    def __init__(self, nrows, ncols):
+        self.nrows = nrows
+        self.ncols = ncols
+        self.calls = []
+
+    def getHeaders(self, ctx=None):
+        return [object()] * self.ncols
+
+    def getNumberOfRows(self, ctx=None):
+        return self.nrows
+
+    def read(self, colNumbers, start, stop, ctx=None):
+        self.calls.append(("read", colNumbers, start, stop))
+        return list(range(start, stop))
+
+    def slice(self, colNumbers, rowNumbers, ctx=None):
+        self.calls.append(("slice", colNumbers, rowNumbers))
+        return rowNumbers
+
+
+class TestTableCursor(object):
+
+    def test_read_batches(self):
+        table = MockTablePrx(25, 3)
+        cursor = TableCursor(table, batch_size=10)
+        assert len(cursor) == 25
+        batches = list(cursor)
+        assert [len(b) for b in batches] == [10, 10, 5]
+        assert sum(batches, []) == list(range(25))
+        assert table.calls[-1] == ("read", [0, 1, 2], 20, 25)
+
+    def test_read_range(self):
+        table = MockTablePrx(25, 3)
+        cursor = TableCursor(table, [1], start=3, stop=7, batch_size=3)
+        assert sum(list(cursor), []) == [3, 4, 5, 6]
+        assert table.calls == [("read", [1], 3, 6), ("read", [1], 6, 7)]
+
+    def test_slice_batches(self):
+        table = MockTablePrx(25, 3)
+        rows = [1, 4, 9, 16, 24]
+        cursor = TableCursor(table, [0], rowNumbers=rows, batch_size=2)
+        assert len(cursor) == 5
+        assert list(cursor) == [[1, 4], [9, 16], [24]]
+
+    def test_empty(self):
+        table = MockTablePrx(0, 1)
+        assert list(TableCursor(table)) == []
+        with pytest.raises(ValueError):
+            TableCursor(table, batch_size=0)
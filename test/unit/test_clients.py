@@ -22,7 +22,9 @@ import pytest
 import Ice
 import logging
 import threading
+import omero
 import omero.clients as base
+from omero.rtypes import rstring
 
 
 class MockCommunicator(object):
@@ -237,3 +239,280 @@ class TestClientInit(object):
                 # When this is run on Travis ice.config overrides this property
                 assert (props.getProperty(k) == v) or (
                     props.getProperty(k) == 'localhost')
+
+
+class MockRawFileStore(object):
+
+    def __init__(self, data, fail_at=None):
+        self.data = data
+        self.fail_at = fail_at
+        self.closed = False
+        self.reads = []
+
+    def setFileId(self, file_id, ctx=None):
+        pass
+
+    def size(self):
+        return len(self.data)
+
+    def read(self, position, length):
+        if position == self.fail_at:
+            raise Exception("read failed")
+        self.reads.append(position)
+        return self.data[position:position + length]
+
+    def close(self):
+        self.closed = True
+
+
+class MockDownloadSession(object):
+
+    def __init__(self, data, fail_at=None):
+        from hashlib import sha1
+        self.data = data
+        self.fail_at = fail_at
+        self.stores = []
+        self.ofile = omero.model.OriginalFileI(1, True)
+        self.ofile.hash = rstring(sha1(data).hexdigest())
+        self.ofile.hasher = omero.model.ChecksumAlgorithmI()
+        self.ofile.hasher.value = rstring("SHA1-160")
+
+    def getQueryService(self):
+        return self
+
+    def findByQuery(self, query, params, ctx=None):
+        return self.ofile
+
+    def createRawFileStore(self):
+        self.stores.append(MockRawFileStore(self.data, self.fail_at))
+        return self.stores[-1]
+
+
+class MockDownloadClient(MockClient):
+
+    def setSession(self, session):
+        self._BaseClient__sf = session
+
+    def getContext(self, group=None):
+        return {"omero.group": str(group)}
+
+
+class TestDownloadRanges(object):
+
+    def setup_method(self, method):
+        self.mc = MockDownloadClient()
+        self.data = bytes(bytearray(range(256))) * 41
+
+    def teardown_method(self, method):
+        self.mc.__del__()
+
+    @pytest.mark.parametrize('workers', [1, 4])
+    def test_download(self, tmpdir, workers):
+        session = MockDownloadSession(self.data)
+        self.mc.setSession(session)
+        target = str(tmpdir.join("file"))
+        self.mc.download_ranges(session.ofile, target, block_size=1000,
+                                workers=workers)
+        with open(target, "rb") as f:
+            assert f.read() == self.data
+        assert not tmpdir.join("file.part").exists()
+        assert all(store.closed for store in session.stores)
+
+    def test_resume(self, tmpdir):
+        target = str(tmpdir.join("file"))
+        self.mc.setSession(MockDownloadSession(self.data, fail_at=5000))
+        with pytest.raises(Exception):
+            self.mc.download(omero.model.OriginalFileI(1, False), target,
+                             block_size=1000, workers=3)
+        assert tmpdir.join("file.part").size() == 5000
+        assert int(tmpdir.join("file.part.offset").read()) == 5000
+        session = MockDownloadSession(self.data)
+        self.mc.setSession(session)
+        self.mc.download(session.ofile, target, block_size=1000,
+                         resume=True)
+        with open(target, "rb") as f:
+            assert f.read() == self.data
+
+    def killed_session(self, tmpdir, received):
+        """
+        Leaves the preallocated .part of a download killed after receiving
+        the first received bytes, with no checksum to catch a bad resume
+        """
+        tmpdir.join("file.part").write_binary(
+            self.data[:received] + b"\0" * (len(self.data) - received))
+        session = MockDownloadSession(self.data)
+        session.ofile.hash = None
+        self.mc.setSession(session)
+        return session
+
+    def test_resume_killed(self, tmpdir):
+        session = self.killed_session(tmpdir, 3000)
+        tmpdir.join("file.part.offset").write("%020d\n" % 3000)
+        self.mc.download_ranges(session.ofile, str(tmpdir.join("file")),
+                                block_size=1000, workers=1, resume=True)
+        assert tmpdir.join("file").read_binary() == self.data
+        assert session.stores[0].reads[0] == 3000
+        assert not tmpdir.join("file.part.offset").exists()
+
+    def test_resume_killed_without_offset(self, tmpdir):
+        # Nothing is known to have been received
+        session = self.killed_session(tmpdir, 0)
+        self.mc.download_ranges(session.ofile, str(tmpdir.join("file")),
+                                block_size=1000, workers=1, resume=True)
+        assert tmpdir.join("file").read_binary() == self.data
+        assert session.stores[0].reads[0] == 0
+
+    @pytest.mark.parametrize('sync_interval', [0, 3600])
+    def test_sync_interval(self, tmpdir, monkeypatch, sync_interval):
+        import os
+        fsync = os.fsync
+        synced = []
+
+        def record_fsync(fd):
+            synced.append(fd)
+            fsync(fd)
+        monkeypatch.setattr(os, "fsync", record_fsync)
+        session = MockDownloadSession(self.data)
+        self.mc.setSession(session)
+        self.mc.download_ranges(session.ofile, str(tmpdir.join("file")),
+                                block_size=1000, workers=2,
+                                sync_interval=sync_interval)
+        assert tmpdir.join("file").read_binary() == self.data
+        # Data and offset files, at the start and the end, and after
+        # each of the 11 blocks without an interval
+        assert len(synced) == (2 * 13 if sync_interval == 0 else 2 * 2)
+
+    def test_checksum_mismatch(self, tmpdir):
+        session = MockDownloadSession(self.data)
+        session.ofile.hash = rstring("0" * 40)
+        self.mc.setSession(session)
+        with pytest.raises(omero.ClientError):
+            self.mc.download_ranges(session.ofile, str(tmpdir.join("file")),
+                                    block_size=1000)
+        # Kept for diagnosis
+        assert int(tmpdir.join("file.part.offset").read()) == len(self.data)
+        assert tmpdir.join("file.part").size() == len(self.data)
+
+
+class MockWriteStore(object):
+
+    def __init__(self):
+        self.data = bytearray()
+        self.outstanding = 0
+        self.max_outstanding = 0
+
+    def write(self, block, offset, length):
+        self.data[offset:offset + length] = block
+
+    def begin_write(self, block, offset, length):
+        self.outstanding += 1
+        self.max_outstanding = max(self.max_outstanding, self.outstanding)
+        return (block, offset, length)
+
+    def end_write(self, result):
+        self.outstanding -= 1
+        self.write(*result)
+
+    def setFileId(self, file_id):
+        pass
+
+    def truncate(self, size):
+        pass
+
+    def save(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class FailingReader(object):
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+
+    def read(self, size):
+        if not self.blocks:
+            raise IOError("read failed")
+        self.blocks -= 1
+        return b"x" * size
+
+
+class MockUploadSession(object):
+
+    def __init__(self):
+        self.store = MockWriteStore()
+        self.saved_hashes = []
+
+    def getUpdateService(self):
+        return self
+
+    def saveAndReturnObject(self, obj):
+        self.saved_hashes.append(obj.hash and obj.hash.val)
+        if obj.id is None:
+            obj.id = omero.rtypes.rlong(1)
+        return obj
+
+    def createRawFileStore(self):
+        return self.store
+
+
+class TestWriteStream(object):
+
+    @pytest.mark.parametrize('in_flight', [1, 3])
+    def test_write_stream(self, in_flight):
+        import io
+        from hashlib import sha1
+        data = bytes(bytearray(range(256))) * 41
+        prx = MockWriteStore()
+        digest = sha1()
+        progress = []
+        base.BaseClient.write_stream(
+            None, io.BytesIO(data), prx, block_size=1000,
+            in_flight=in_flight, digest=digest, progress=progress.append)
+        assert bytes(prx.data) == data
+        assert digest.hexdigest() == sha1(data).hexdigest()
+        assert progress == list(range(1000, len(data), 1000)) + [len(data)]
+        assert prx.max_outstanding == (in_flight if in_flight > 1 else 0)
+
+    @pytest.mark.parametrize('in_flight', [0, -1])
+    def test_no_in_flight(self, in_flight):
+        import io
+        data = b"abc" * 1000
+        prx = MockWriteStore()
+        base.BaseClient.write_stream(
+            None, io.BytesIO(data), prx, block_size=1000,
+            in_flight=in_flight)
+        assert bytes(prx.data) == data
+        assert prx.max_outstanding == 0
+
+    def test_failed_read(self):
+        prx = MockWriteStore()
+        with pytest.raises(IOError):
+            base.BaseClient.write_stream(
+                None, FailingReader(2), prx, block_size=10, in_flight=3)
+        assert prx.max_outstanding == 2
+        assert prx.outstanding == 0
+        assert bytes(prx.data) == b"x" * 20
+
+
+class TestUpload(object):
+
+    def test_stale_hash(self, tmpdir):
+        from hashlib import sha1
+        data = b"new contents"
+        source = tmpdir.join("source")
+        source.write_binary(data)
+        mc = MockDownloadClient()
+        try:
+            session = MockUploadSession()
+            mc.setSession(session)
+            ofile = omero.model.OriginalFileI()
+            ofile.hash = rstring(sha1(b"old contents").hexdigest())
+            ofile = mc.upload(str(source), ofile=ofile, block_size=5)
+        finally:
+            mc.__del__()
+        checksum = sha1(data).hexdigest()
+        assert session.saved_hashes == [None, checksum]
+        assert ofile.hash.val == checksum
+        assert bytes(session.store.data) == data
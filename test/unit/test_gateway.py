@@ -25,18 +25,25 @@ Test of various things under omero.gateway
 """
 
 import Ice
+import numpy
 import pytest
+import re
 import sys
+import omero.gateway
 
 from omero.gateway import BlitzGateway, BlitzObjectWrapper, ImageWrapper, \
-    WellWrapper, LogicalChannelWrapper, OriginalFileWrapper
-from omero.model import ImageI, PixelsI, ExperimenterI, EventI, \
+    WellWrapper, LogicalChannelWrapper, OriginalFileWrapper, PixelsWrapper, \
+    ServiceOptsDict, DatasetWrapper
+from omero.gateway.utils import ObjectCache
+from omero.model import ImageI, PixelsI, PixelsTypeI, ExperimenterI, EventI, \
     ProjectI, TagAnnotationI, FileAnnotationI, OriginalFileI, \
     MapAnnotationI, NamedValue, PlateI, WellI, \
     LogicalChannelI, LengthI, IlluminationI, BinningI, \
-    DetectorSettingsI, DichroicI, LightPathI, ExternalInfoI
+    DetectorSettingsI, DichroicI, LightPathI, ExternalInfoI, DatasetI, \
+    DatasetAnnotationLinkI, ProjectDatasetLinkI, ExperimenterGroupI, \
+    ImageAnnotationLinkI
 from omero.model.enums import UnitsLength
-from omero.rtypes import rstring, rtime, rlong, rint, rdouble
+from omero.rtypes import rstring, rtime, rlong, rint, rdouble, rbool
 
 
 class MockQueryService(object):
@@ -61,6 +68,286 @@ class MockConnection(BlitzGateway):
         return (64, 64)
 
 
+class MockPagingQueryService(object):
+    """Answers keyset paginated queries over Projects with ids 1..n"""
+
+    def __init__(self, n):
+        self.ids = list(range(1, n + 1))
+        self.queries = []
+        self.query_strings = []
+
+    def findAllByQuery(self, query, params, _ctx=None):
+        assert query.endswith("obj.id > :last_id order by obj.id")
+        last_id = params.map["last_id"].val
+        offset = params.theFilter.offset.val
+        limit = params.theFilter.limit.val
+        self.queries.append((last_id, limit))
+        self.query_strings.append(query)
+        ids = [i for i in self.ids if i > last_id][offset:offset + limit]
+        return [ProjectI(i, True) for i in ids]
+
+
+class MockPagingConnection(MockConnection):
+
+    def __init__(self, n):
+        self.qs = MockPagingQueryService(n)
+        self.SERVICE_OPTS = dict()
+
+    def getQueryService(self):
+        return self.qs
+
+
+class MockIdQueryService(object):
+    """
+    Answers 'in (:ids)' queries by the queried class, recording the query
+    and the ids of each call
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.ids = []
+
+    def _record(self, query, params):
+        ids = params.map.get("ids") or params.map["pids"]
+        ids = [i.val for i in ids.val]
+        self.queries.append(query)
+        self.ids.append(ids)
+        return ids
+
+    def findByQuery(self, query, params, _ctx=None):
+        return self.findAllByQuery(query, params, _ctx)[0]
+
+    def findAllByQuery(self, query, params, _ctx=None):
+        ids = self._record(query, params)
+        klass = re.search(r"from (\w+)", query).group(1)
+        return [getattr(self, "_" + klass)(i) for i in reversed(ids)]
+
+    def projection(self, query, params, _ctx=None):
+        ids = self._record(query, params)
+        if "AnnotationLink" in query:
+            # Tag 1 is linked to every object, tag 2 to odd ones
+            anns = [(1, 'ome.model.annotations.TagAnnotation', 0)]
+            if [i for i in ids if i % 2]:
+                anns.append((2, 'ome.model.annotations.TagAnnotation', 0))
+            if query.lstrip().startswith("select sum"):
+                # Unchunked count, one row per annotation class
+                return [[rlong(0), rlong(0), rlong(len(anns)),
+                         rstring('ome.model.annotations.TagAnnotation')]]
+            return [[rlong(a), rstring(c), rint(r)] for a, c, r in anns]
+        return [[rlong(len(ids)), rlong(10 * len(ids))]]
+
+    def _Project(self, i):
+        return ProjectI(i, True)
+
+    def _Experimenter(self, i):
+        experimenter = ExperimenterI(i, True)
+        experimenter.omeName = rstring("user %s" % i)
+        return experimenter
+
+    def _ExperimenterGroup(self, i):
+        group = ExperimenterGroupI(i, True)
+        group.name = rstring("group %s" % i)
+        return group
+
+    def _DatasetAnnotationLink(self, i):
+        # Each Dataset is tagged once and linked to one Project
+        link = DatasetAnnotationLinkI()
+        link.parent = DatasetI(i, False)
+        link.child = TagAnnotationI(10 * i, True)
+        link.child.textValue = rstring("tag %s" % i)
+        return link
+
+    def _ImageAnnotationLink(self, i):
+        link = ImageAnnotationLinkI()
+        link.parent = ImageI(i, False)
+        link.child = TagAnnotationI(10 * i, True)
+        return link
+
+    def _ProjectDatasetLink(self, i):
+        link = ProjectDatasetLinkI()
+        link.child = DatasetI(i, False)
+        link.parent = ProjectI(100 + i, True)
+        link.parent.name = rstring("project %s" % i)
+        return link
+
+
+class MockContainerService(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def getCollectionCount(self, obj_type, prop, ids, options, _ctx=None):
+        self.calls.append((obj_type, prop, ids))
+        return dict((i, 2 * i) for i in ids)
+
+
+class MockIdConnection(MockConnection):
+    """
+    Connection for the batched lookups, optionally with a smaller
+    ID_CHUNK_SIZE or an object cache
+    """
+
+    def __init__(self, chunk_size=None, cache=False):
+        self.qs = MockIdQueryService()
+        self.cs = MockContainerService()
+        self.SERVICE_OPTS = ServiceOptsDict()
+        if chunk_size is not None:
+            self.ID_CHUNK_SIZE = chunk_size
+        if cache:
+            self.setObjectCache(ObjectCache())
+
+    def getQueryService(self):
+        return self.qs
+
+    def getContainerService(self):
+        return self.cs
+
+
+class MockRawPixelsStore(object):
+
+    def __init__(self, stores):
+        self.stores = stores
+        self.closed = False
+
+    def clone(self):
+        store = MockRawPixelsStore(self.stores)
+        self.stores.append(store)
+        return store
+
+    def setPixelsId(self, pixels_id, bypass, ctx=None):
+        self.pixels_id = pixels_id
+
+    def getPlane(self, z, c, t):
+        return self.getTile(z, c, t, 0, 0, 4, 3)
+
+    def getTile(self, z, c, t, x, y, w, h):
+        plane = numpy.full((h, w), 100 * z + 10 * c + t, dtype='>u2')
+        return plane.tobytes()
+
+    def getStack(self, c, t):
+        return b''.join(self.getPlane(z, c, t) for z in range(4))
+
+    def getHypercube(self, offset, size, step):
+        x, y, z, c, t = offset
+        w = len(range(x, x + size[0], step[0]))
+        h = len(range(y, y + size[1], step[1]))
+        return self.getTile(z, c, t, x, y, w, h)
+
+    def close(self):
+        self.closed = True
+
+
+class MockPixelsConnection(MockConnection):
+
+    def __init__(self):
+        super(MockPixelsConnection, self).__init__(None)
+        self.stores = []
+
+    def createRawPixelsStore(self):
+        return MockRawPixelsStore(self.stores).clone()
+
+
+class MockUploadStore(object):
+    """RawPixelsStore recording the planes and tiles set on it"""
+
+    def __init__(self, tile_size):
+        self.tile_size = tile_size
+        self.planes = []
+        self.tiles = []
+        self.closed = False
+
+    def setPixelsId(self, pixels_id, bypass, ctx=None):
+        self.pixels_id = pixels_id
+
+    def getTileSize(self, ctx=None):
+        return self.tile_size
+
+    def setPlane(self, buf, z, c, t, ctx=None):
+        self.planes.append(((z, c, t), bytes(buf)))
+
+    def setTile(self, buf, z, c, t, x, y, w, h, ctx=None):
+        self.tiles.append(((z, c, t, x, y, w, h), bytes(buf)))
+
+    def close(self, ctx=None):
+        self.closed = True
+
+
+class MockUploadConnection(MockConnection):
+    """
+    Answers the service calls of createImageFromNumpySeq, acting as the
+    query, pixels, container and update services itself
+    """
+
+    def __init__(self, tile_size=(256, 256)):
+        self.SERVICE_OPTS = ServiceOptsDict()
+        self.store = MockUploadStore(tile_size)
+        self.c = self
+        self.sf = self
+        self.minmax = {}
+
+    def createRawPixelsStore(self):
+        return self.store
+
+    def getQueryService(self):
+        return self
+
+    def getPixelsService(self):
+        return self
+
+    def getContainerService(self):
+        return self
+
+    def getUpdateService(self):
+        return self
+
+    def findByQuery(self, query, params, ctx=None):
+        if query.startswith("select obj from Image"):
+            # the copy of sourceImageId
+            return self.getImages("Image", [1], None)[0]
+        pixels_type = PixelsTypeI(1, True)
+        pixels_type.value = rstring(query.split("'")[1])
+        return pixels_type
+
+    def copyAndResizeImage(self, image_id, sizeX, sizeY, sizeZ, sizeT,
+                           channels, name, copy_stats, ctx=None):
+        return rlong(1)
+
+    def saveObject(self, obj, ctx=None):
+        pass
+
+    def createImage(self, sizeX, sizeY, sizeZ, sizeT, channels, pixels_type,
+                    name, description, ctx=None):
+        self.pixels_type = pixels_type.value.val
+        return rlong(1)
+
+    def getImages(self, obj_type, ids, options, ctx=None):
+        image = ImageI(ids[0], True)
+        pixels = PixelsI(2, True)
+        pixels.pixelsType = PixelsTypeI(1, True)
+        pixels.pixelsType.value = rstring('uint16')
+        image.addPixels(pixels)
+        return [image]
+
+    def setChannelGlobalMinMax(self, pixels_id, c, min_value, max_value,
+                               ctx=None):
+        self.minmax[c] = (min_value, max_value)
+
+
+@pytest.fixture(scope='function')
+def wrapped_pixels():
+    pixels = PixelsI()
+    pixels.id = rlong(1)
+    pixels.sizeX = rint(4)
+    pixels.sizeY = rint(3)
+    pixels.sizeZ = rint(4)
+    pixels.sizeC = rint(2)
+    pixels.sizeT = rint(3)
+    pixels_type = PixelsTypeI()
+    pixels_type.value = rstring('uint16')
+    pixels.pixelsType = pixels_type
+    return PixelsWrapper(conn=MockPixelsConnection(), obj=pixels)
+
+
 @pytest.fixture(scope='function')
 def wrapped_image():
     experimenter = ExperimenterI()
@@ -248,6 +535,327 @@ class TestBlitzObjectGetAttr(object):
         assert d_settings.getBinning().value == binning_value
         assert channel.getLightPath().getDichroic().getModel() == di_model
 
+    def test_accessor_table(self):
+        obj = ImageI(1, True)
+        obj.archived = rbool(True)
+        obj.acquisitionDate = rtime(1000)
+        image = ImageWrapper(None, obj)
+        assert image.getArchived() is True
+        assert image.getAcquisitionDate() is not None
+        accessors = omero.gateway._ACCESSORS[(ImageWrapper, ImageI)]
+        assert "getArchived" in accessors
+        # Getters taking an index are left to the dynamic lookup
+        assert "getPixels" not in accessors
+
+        unloaded = ImageWrapper(None, ImageI(2, False))
+        with pytest.raises(omero.UnloadedEntityException):
+            unloaded.getArchived()
+
+        channel = LogicalChannelWrapper(None, LogicalChannelI(3, False))
+        assert channel.getIllumination() is None
+
+    def test_accessor_table_used(self, monkeypatch):
+        image = ImageWrapper(None, ImageI(1, True))
+        image.getArchived()
+        key = (ImageWrapper, ImageI)
+        accessors = dict(omero.gateway._ACCESSORS[key])
+        accessors["getArchived"] = lambda self: "from table"
+        monkeypatch.setitem(omero.gateway._ACCESSORS, key, accessors)
+        assert image.getArchived() == "from table"
+
+
+class TestGetObjectsPaged(object):
+
+    @pytest.mark.parametrize("prefetch", [False, True])
+    def test_pages(self, prefetch):
+        conn = MockPagingConnection(10)
+        projects = conn.getObjects("Project", page_size=4, prefetch=prefetch)
+        assert [p.id for p in projects] == list(range(1, 11))
+        assert conn.qs.queries == [(-1, 4), (4, 4), (8, 4), (10, 4)]
+
+    def test_limit(self):
+        conn = MockPagingConnection(10)
+        projects = conn.getObjects(
+            "Project", opts={"limit": 6}, page_size=4)
+        assert [p.id for p in projects] == list(range(1, 7))
+        assert conn.qs.queries == [(-1, 4), (4, 2)]
+
+    def test_params_unchanged(self):
+        conn = MockPagingConnection(10)
+        params = omero.sys.ParametersI()
+        params.exp(5)
+        projects = conn.getObjects("Project", params=params, page_size=4)
+        assert [p.id for p in projects] == list(range(1, 11))
+        assert params.theFilter.offset is None
+        assert params.theFilter.limit is None
+        assert params.theFilter.ownerId.val == 5
+        assert "last_id" not in params.map
+        assert all("owner.id = (:eid) and obj.id > :last_id" in q
+                   for q in conn.qs.query_strings)
+
+    def test_unsupported(self):
+        conn = MockPagingConnection(10)
+        with pytest.raises(AttributeError):
+            list(conn.getObjects("Project", opts={"order_by": "obj.name"},
+                                 page_size=4))
+
+
+class TestIdChunks(object):
+
+    def test_get_objects(self):
+        conn = MockIdConnection(4)
+        ids = [7, 3, 9, 1, 3, 5, 2, 8, 6, 4]
+        projects = conn.getObjects("Project", ids, respect_order=True)
+        assert [p.id for p in projects] == [7, 3, 9, 1, 3, 5, 2, 8, 6, 4]
+        # Duplicate ids are only queried once
+        assert sorted(conn.qs.ids) == [[4], [5, 2, 8, 6], [7, 3, 9, 1]]
+
+    def test_get_objects_unchunked(self):
+        conn = MockIdConnection(4)
+        projects = list(conn.getObjects(
+            "Project", list(range(1, 11)), opts={"order_by": "obj.name"}))
+        assert len(projects) == 10
+        assert len(conn.qs.ids) == 1
+
+    def test_count_annotations(self):
+        conn = MockIdConnection(2)
+        counts = conn.countAnnotations("Image", [1, 2, 3, 4, 5])
+        assert counts["TagAnnotation"] == 2
+        assert len(conn.qs.ids) == 3
+
+    @pytest.mark.parametrize("chunk_size", [2, 1000])
+    def test_generator_ids(self, chunk_size):
+        conn = MockIdConnection(chunk_size)
+        projects = conn.getObjects(
+            "Project", (i for i in [3, 1, 2]), respect_order=True)
+        assert [p.id for p in projects] == [3, 1, 2]
+
+        conn.qs.ids = []
+        links = conn.getAnnotationLinks("Image", (i for i in [3, 1, 2]))
+        assert sorted(link.parent.id.val for link in links) == [1, 2, 3]
+        assert sorted(sum(conn.qs.ids, [])) == [1, 2, 3]
+
+        conn.qs.ids = []
+        counts = conn.countAnnotations("Image", (i for i in [1, 2, 3]))
+        assert counts["TagAnnotation"] == 2
+        assert sorted(sum(conn.qs.ids, [])) == [1, 2, 3]
+
+    def test_archived_files_info(self):
+        conn = MockIdConnection(2)
+        info = conn.getArchivedFilesInfo([1, 2, 3, 4, 5])
+        assert info == {'fileset': False, 'count': 5, 'size': 50}
+        assert sorted(conn.qs.ids) == [[1, 2], [3, 4], [5]]
+
+
+class TestPrefetch(object):
+
+    def test_prefetch(self):
+        conn = MockIdConnection()
+        datasets = []
+        for i in range(1, 6):
+            dataset = DatasetI(i, True)
+            dataset.details.group = ExperimenterGroupI(3, False)
+            dataset.unloadAnnotationLinks()
+            datasets.append(DatasetWrapper(conn, dataset))
+        datasets = conn.prefetch(
+            iter(datasets), 'annotations', 'parents', 'childCount')
+        assert len(conn.qs.queries) == 2
+        assert len(conn.cs.calls) == 1
+
+        for d in datasets:
+            assert d.countChildren() == 2 * d.id
+            assert d.countChildren_cached() == 2 * d.id
+            assert [a.getValue() for a in d.listAnnotations()] == [
+                "tag %s" % d.id]
+            assert [p.getName() for p in d.listParents()] == [
+                "project %s" % d.id]
+            assert d.getParent().id == 100 + d.id
+        assert len(conn.qs.queries) == 2
+        assert len(conn.cs.calls) == 1
+
+    def test_details(self):
+        conn = MockIdConnection(chunk_size=2)
+        datasets = []
+        for i in range(1, 6):
+            dataset = DatasetI(i, True)
+            dataset.details.owner = ExperimenterI(i % 3, False)
+            dataset.details.group = ExperimenterGroupI(7, False)
+            datasets.append(DatasetWrapper(conn, dataset))
+        # Already loaded details are kept
+        loaded = ExperimenterI(2, True)
+        datasets[1]._obj.details.owner = loaded
+        conn.prefetch(datasets, 'owner', 'group')
+        # Owners 0, 1 and 2 in chunks of 2, then the group
+        assert [sorted(ids) for ids in conn.qs.ids] == [[0, 1], [2], [7]]
+        assert [q.split()[3] for q in conn.qs.queries] == [
+            "Experimenter", "Experimenter", "ExperimenterGroup"]
+
+        for d in datasets:
+            details = d._obj.details
+            assert details.owner.isLoaded()
+            assert details.group.isLoaded()
+            assert d.getDetails().getGroup().getName() == "group 7"
+        assert datasets[1]._obj.details.owner is loaded
+        assert datasets[4].getOwner().getOmeName() == "user 2"
+        assert datasets[0].getOwner().getOmeName() == "user 1"
+        assert datasets[2].getOwner().getOmeName() == "user 0"
+        # Both unloaded copies of Experimenter 1 get the loaded object
+        assert (datasets[0]._obj.details.owner is
+                datasets[3]._obj.details.owner)
+        assert len(conn.qs.queries) == 3
+
+    def test_unsupported(self):
+        conn = MockIdConnection()
+        with pytest.raises(AttributeError):
+            conn.prefetch([], 'children')
+
+
+class TestObjectCache(object):
+
+    def test_get_object(self):
+        conn = MockIdConnection(cache=True)
+        assert conn.getObject("Experimenter", 1).id == 1
+        assert conn.getObject("Experimenter", 1).id == 1
+        assert conn.qs.ids == [[1]]
+        assert conn.getObjectCache().stats()['hits'] == 1
+
+    def test_get_objects(self):
+        conn = MockIdConnection(cache=True)
+        conn.getObject("Experimenter", 2)
+        experimenters = conn.getObjects(
+            "Experimenter", [3, 2, 1], respect_order=True)
+        assert [e.id for e in experimenters] == [3, 2, 1]
+        assert conn.qs.ids == [[2], [3, 1]]
+        list(conn.getObjects("Experimenter", [1, 2, 3]))
+        assert len(conn.qs.ids) == 2
+        # Filtered queries are not cached
+        list(conn.getObjects("Experimenter", [1], opts={'limit': 1}))
+        assert len(conn.qs.ids) == 3
+
+    def test_copies(self):
+        conn = MockIdConnection(cache=True)
+        first = conn.getObject("Experimenter", 1)
+        first._obj.omeName = rstring("changed")
+        second = conn.getObject("Experimenter", 1)
+        assert second.getOmeName() == "user 1"
+        assert second._obj is not first._obj
+        second._obj.omeName = rstring("changed")
+        [third] = conn.getObjects("Experimenter", [1])
+        assert third.getOmeName() == "user 1"
+        assert len(conn.qs.ids) == 1
+
+    def test_opt_in(self, monkeypatch):
+        kwargs = dict(username='user', passwd='secret',
+                      host='localhost', port=65535)
+        conn = BlitzGateway(**kwargs)
+        assert conn.getObjectCache() is None
+        conn.c.__del__()
+        monkeypatch.setattr(BlitzGateway, 'USE_OBJECT_CACHE', True)
+        conn = BlitzGateway(**kwargs)
+        cache = conn.getObjectCache()
+        assert isinstance(cache, ObjectCache)
+        assert cache.max_size == BlitzGateway.OBJECT_CACHE_SIZE
+        conn.c.__del__()
+
+    def test_invalidate(self):
+        conn = MockIdConnection(cache=True)
+        conn.getObject("Experimenter", 1)
+        conn._invalidateObjectCache("Image")
+        conn.getObject("Experimenter", 1)
+        assert len(conn.qs.ids) == 1
+        conn._invalidateObjectCache("ExperimenterGroup")
+        conn.getObject("Experimenter", 1)
+        assert len(conn.qs.ids) == 2
+
+
+class TestCreateImageFromNumpySeq(object):
+
+    @pytest.mark.parametrize("tile_size", [(3, 2), (4, 5), (256, 256)])
+    def test_tiled(self, tile_size):
+        tile_width, tile_height = tile_size
+        planes = [numpy.arange(35, dtype=numpy.uint16).reshape(5, 7) + 100 * i
+                  for i in range(4)]
+        conn = MockUploadConnection(tile_size)
+        image = conn.createImageFromNumpySeq(
+            iter(planes), "tiled", sizeZ=2, sizeC=2, tiled=True)
+        assert image.id == 1
+        assert conn.pixels_type == 'uint16'
+        assert conn.store.planes == []
+        assert conn.store.closed
+
+        tiles_per_plane = -(-7 // tile_width) * -(-5 // tile_height)
+        assert len(conn.store.tiles) == 4 * tiles_per_plane
+        covered = numpy.zeros((4, 5, 7), dtype=int)
+        for (z, c, t, x, y, w, h), buf in conn.store.tiles:
+            i = z * 2 + c
+            assert t == 0
+            assert w == min(tile_width, 7 - x)
+            assert h == min(tile_height, 5 - y)
+            plane = planes[i]
+            assert buf == plane[y:y + h, x:x + w].astype('>u2').tobytes()
+            covered[i, y:y + h, x:x + w] += 1
+        assert (covered == 1).all()
+        assert conn.minmax == {0: (0.0, 234.0), 1: (100.0, 334.0)}
+
+    def test_planes(self):
+        planes = [numpy.arange(12, dtype=numpy.int16).reshape(3, 4),
+                  numpy.arange(12, dtype=numpy.int16).reshape(4, 3),
+                  numpy.full((4, 3), 7, dtype=numpy.int16)]
+        conn = MockUploadConnection()
+        conn.createImageFromNumpySeq(iter(planes), "planes", sizeZ=3)
+        assert conn.pixels_type == 'int16'
+        assert conn.store.tiles == []
+        assert conn.store.planes == [
+            ((z, 0, 0), plane.astype('>i2').tobytes())
+            for z, plane in enumerate(planes)]
+
+    def test_planes_converted(self):
+        # float64 planes into the uint16 pixels of a copy of an image
+        planes = [numpy.array([[1.7, 2.2], [300.9, 65535.0]]),
+                  numpy.array([[4.5, 5.5, 6.5]])]
+        conn = MockUploadConnection()
+        conn.createImageFromNumpySeq(
+            iter(planes), "converted", sizeC=2, sourceImageId=3)
+        assert conn.store.planes == [
+            ((0, 0, 0), numpy.array([[1, 2], [300, 65535]], '>u2').tobytes()),
+            ((0, 1, 0), numpy.array([[4, 5, 6]], '>u2').tobytes())]
+        assert conn.minmax == {0: (1.7, 65535.0), 1: (4.5, 6.5)}
+
+    @pytest.mark.parametrize("chunk_bytes", [1, 40, 1 << 20])
+    def test_planes_chunked(self, monkeypatch, chunk_bytes):
+        monkeypatch.setattr(MockUploadConnection, "PLANE_CHUNK_BYTES",
+                            chunk_bytes)
+        rng = numpy.random.default_rng(1)
+        planes = [rng.integers(0, 1000, (7, 5)).astype(numpy.uint16)
+                  for i in range(4)]
+        conn = MockUploadConnection()
+        stats = []
+        conn.createImageFromNumpySeq(
+            iter(planes), "chunked", sizeC=2, sizeT=2, planeStats=stats,
+            histogramBins=4)
+        assert conn.store.planes == [
+            ((0, c, t), planes[2 * c + t].astype('>u2').tobytes())
+            for c in range(2) for t in range(2)]
+        for c in range(2):
+            channel = numpy.stack(planes[2 * c:2 * c + 2])
+            assert conn.minmax[c] == (channel.min(), channel.max())
+        assert [(p['z'], p['c'], p['t']) for p in stats] == [
+            (0, 0, 0), (0, 0, 1), (0, 1, 0), (0, 1, 1)]
+        for plane, p in zip(planes, stats):
+            assert (p['min'], p['max']) == (plane.min(), plane.max())
+            assert p['mean'] == pytest.approx(plane.mean())
+            counts, edges = p['histogram']
+            assert counts.sum() == plane.size
+            assert edges[0] == plane.min() and edges[-1] == plane.max()
+            assert len(counts) == 4
+
+    def test_plane_stats_tiled(self):
+        conn = MockUploadConnection()
+        with pytest.raises(AttributeError):
+            conn.createImageFromNumpySeq(
+                iter([numpy.zeros((2, 2))]), "tiled", tiled=True,
+                planeStats=[])
+
 
 class TestFileObject(object):
 
@@ -372,3 +980,42 @@ class TestBlitzGatewayImageWrapper(object):
         # BlitzObjectWrapper.getExternalInfo() returns omero.model.ExternalInfo
         assert isinstance(wrapper.getExternalInfo(), ExternalInfoI)
         assert wrapper.getExternalInfo() == external_info
+
+
+class TestPixelsWrapper(object):
+
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_get_tiles(self, wrapped_pixels, workers):
+        zct_tiles = [(z, c, t, (0, 0, 2, 2) if z % 2 else None)
+                     for z in range(4) for c in range(2) for t in range(3)]
+        tiles = list(wrapped_pixels.getTiles(
+            zct_tiles, workers=workers, readAhead=4))
+        assert len(tiles) == len(zct_tiles)
+        for (z, c, t, tile), plane in zip(zct_tiles, tiles):
+            assert plane.dtype == numpy.uint16
+            assert plane.shape == ((2, 2) if tile else (3, 4))
+            assert (plane == 100 * z + 10 * c + t).all()
+        stores = [store for store in wrapped_pixels._conn.stores
+                  if hasattr(store, 'pixels_id')]
+        assert len(stores) == workers
+        assert all(store.closed for store in stores)
+
+    @pytest.mark.parametrize("kwargs,shape", [
+        ({}, (3, 2, 4, 3, 4)),
+        ({"zRange": (1, 3)}, (3, 2, 2, 3, 4)),
+        ({"tile": (1, 1, 3, 2), "step": (2, 1, 2, 1, 2)}, (2, 2, 2, 2, 2)),
+    ])
+    def test_get_hyperstack(self, wrapped_pixels, tmpdir, kwargs, shape):
+        filename = str(tmpdir.join("stack.dat"))
+        for extra in ({}, {"filename": filename}):
+            kwargs.update(extra)
+            stack = wrapped_pixels.getHyperstack(**kwargs)
+            assert stack.shape == shape
+            assert stack.dtype == numpy.uint16
+            step = kwargs.get("step", (1, 1, 1, 1, 1))
+            z0 = kwargs.get("zRange", (0, 4))[0]
+            for (t, c, z), value in numpy.ndenumerate(stack[:, :, :, 0, 0]):
+                theZ = z0 + z * step[2]
+                theC = c * step[3]
+                theT = t * step[4]
+                assert value == 100 * theZ + 10 * theC + theT
@@ -26,6 +26,8 @@ Test of various things under omero.util
 
 import json
 import pytest
+import threading
+import time
 from omero_ext.path import path
 from os import linesep
 
@@ -36,6 +38,12 @@ from omero.util import (
     get_omero_userdir, get_omero_user_cache_dir, get_user_dir)
 from omero_version import omero_version
 import omero.util.image_utils as image_utils
+import omero.util.pixelstypetopython as pixelstypetopython
+from omero.util.tiles import PlaneTileLoop, PlaneTileUpload
+from omero.util.populate_roi import AbstractMeasurementCtx, ThreadPool, \
+    MeasurementError, AbstractPlateAnalysisCtx
+from omero.model import RoiI, PointI
+from omero.rtypes import rstring
 from PIL import Image
 import numpy
 
@@ -307,6 +315,133 @@ class TestImageUtils(object):
         image_utils.paste_image(img, canvas, 0, 0)
 
 
+class TestPixelsTypeToPython(object):
+
+    @pytest.mark.parametrize("pixel_type", [
+        "int8", "uint8", "int16", "uint16", "int32", "uint32",
+        "float", "double"])
+    @pytest.mark.parametrize("writable", [True, False])
+    def test_to_numpy_plane(self, pixel_type, writable):
+        char = pixelstypetopython.toPython(pixel_type)
+        expected = numpy.arange(12, dtype=char).reshape(3, 4)
+        raw = expected.astype('>' + char).tobytes()
+        if writable:
+            raw = bytearray(raw)
+        plane = pixelstypetopython.toNumpyPlane(raw, pixel_type, 3, 4)
+        assert plane.dtype == numpy.dtype(char)
+        assert plane.dtype.isnative
+        assert plane.flags.writeable
+        assert numpy.array_equal(plane, expected)
+
+
+class MockTileStore(object):
+    """RawPixelsStore recording the tiles set on it"""
+
+    def __init__(self):
+        self.tiles = []
+
+    def setTile(self, buf, z, c, t, x, y, w, h, ctx=None):
+        self.tiles.append(((z, c, t, x, y, w, h), bytes(buf)))
+
+
+class TestPlaneTileLoop(object):
+
+    @pytest.mark.parametrize("tile_size", [(3, 2), (7, 5), (4, 8), (1, 1)])
+    def test_tiles(self, tile_size):
+        tile_width, tile_height = tile_size
+        plane = numpy.arange(35, dtype=numpy.uint16).reshape(5, 7)
+        store = MockTileStore()
+        upload = PlaneTileUpload(plane)
+        loop = PlaneTileLoop(store, 1, 2, 3)
+        count = loop.forEachTile(7, 5, tile_width, tile_height, upload)
+
+        assert count == len(store.tiles) == (
+            -(-7 // tile_width) * -(-5 // tile_height))
+        covered = numpy.zeros(plane.shape, dtype=int)
+        for (z, c, t, x, y, w, h), buf in store.tiles:
+            assert (z, c, t) == (1, 2, 3)
+            assert x % tile_width == 0 and y % tile_height == 0
+            assert w == min(tile_width, 7 - x)
+            assert h == min(tile_height, 5 - y)
+            expected = plane[y:y + h, x:x + w].astype('>u2').tobytes()
+            assert buf == expected
+            covered[y:y + h, x:x + w] += 1
+        assert (covered == 1).all()
+        assert (upload.minValue, upload.maxValue) == (0, 34)
+
+    def test_convert(self):
+        plane = numpy.array([[1.5, -2.0], [300.0, 4.0]])
+        store = MockTileStore()
+        upload = PlaneTileUpload(plane, 'int16')
+        PlaneTileLoop(store, 0, 0, 0).forEachTile(2, 2, 2, 1, upload)
+        assert [buf for _, buf in store.tiles] == [
+            numpy.array([1, -2], '>i2').tobytes(),
+            numpy.array([300, 4], '>i2').tobytes()]
+        assert (upload.minValue, upload.maxValue) == (-2.0, 300.0)
+
+
+class MockUpdateService(object):
+
+    def __init__(self, ids, fail=False):
+        self.ids = ids
+        self.fail = fail
+
+    def saveAndReturnIds(self, rois):
+        if self.fail:
+            raise Exception("save failed")
+        return [self.ids.pop(0) for roi in rois]
+
+
+class TestSaveRois(object):
+
+    def ctx(self, threads, fail=False):
+        ctx = AbstractMeasurementCtx.__new__(AbstractMeasurementCtx)
+        ctx.thread_pool = ThreadPool(threads)
+        ctx.update_service = MockUpdateService(list(range(1000)), fail)
+        return ctx
+
+    def rois(self, n):
+        for i in range(n):
+            roi = RoiI()
+            roi.addShape(PointI())
+            roi.description = rstring(str(i))
+            yield roi
+
+    def test_ordered(self, monkeypatch):
+        ctx = self.ctx(3)
+        saved = {}
+
+        def update_rois(rois, batches, batch_no):
+            time.sleep(0.01 * (batch_no % 3))
+            batches[batch_no] = [int(r.description.val) for r in rois]
+            saved[batch_no] = threading.current_thread()
+        monkeypatch.setattr(ctx, "update_rois", update_rois)
+        ctx.ROI_UPDATE_LIMIT = 4
+        assert ctx.save_rois(self.rois(30)) == list(range(30))
+        assert len(saved) == 8
+        assert len(set(saved.values())) <= 3
+
+    def test_size_limit(self):
+        ctx = self.ctx(1)
+        ctx.ROI_UPDATE_BYTES = 2000
+        ids = ctx.save_rois(self.rois(10))
+        assert ids == list(range(10))
+
+    def test_failed_batch(self):
+        ctx = self.ctx(2, fail=True)
+        with pytest.raises(MeasurementError):
+            ctx.save_rois(self.rois(3))
+
+    def test_thread_count(self):
+        analysis_ctx = AbstractPlateAnalysisCtx.__new__(
+            AbstractPlateAnalysisCtx)
+        analysis_ctx.thread_pool = None
+        analysis_ctx.thread_count = 3
+        pool = analysis_ctx.get_thread_pool()
+        assert pool.tasks.maxsize == 3
+        assert analysis_ctx.get_thread_pool() is pool
+
+
 class TestUserdirs(object):
 
     def testUserdirEnvironmentDefault(self, monkeypatch):